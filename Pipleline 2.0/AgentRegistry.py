@@ -0,0 +1,34 @@
+import importlib
+
+
+class AgentRegistry:
+    """
+    Resolves agent classes by name, importing an agent's module only the first
+    time it is asked for. Entry points look agents up here instead of importing
+    every agent up front, so starting the CLI or the UI only pays for the
+    agents a run actually reaches.
+    """
+
+    agents = {
+        "RequirementsAgent": "Agents.RequirementsAgent",
+        "HumanReviewAgentForRequirement": "Agents.HumanReviewAgentForRequirement",
+        "ImplementationAgent": "Agents.ImplementationAgent",
+        "CodingAgent": "Agents.CodingAgent",
+        "DocumentationAgent": "Agents.DocumentationAgent",
+        "IntegrationAgent": "Agents.IntegrationAgent",
+        "TestingAgent": "Agents.TestingAgent",
+        "VerifierAgent": "Agents.VerfierAgent",
+        "WebsiteDesignAgent": "Agents.WebsiteDesignAgent",
+    }
+
+    @classmethod
+    def register(cls, name, module):
+        """Make the agent class ``name`` defined in ``module`` resolvable."""
+        cls.agents[name] = module
+
+    @classmethod
+    def get(cls, name):
+        """Return the agent class ``name``, importing its module on first use."""
+        if name not in cls.agents:
+            raise KeyError(f"Unknown agent: {name}")
+        return getattr(importlib.import_module(cls.agents[name]), name)
@@ -1,10 +1,7 @@
-import PyPDF2
-from langchain import PromptTemplate
-from langchain.chains.llm import LLMChain
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing_extensions import override
 
 from BaseAgent import BaseAgent
+from CodePatcher import CodePatcher, PatchError
 
 
 class CodingAgent(BaseAgent):
@@ -19,17 +16,70 @@ class CodingAgent(BaseAgent):
 
     coding_instructions = None
     previous_code_module = None
+    no_code = "No code till now !!"
+    # Edits must quote the previous code exactly, and regenerated code keeps its comments
+    code_view = "full"
+
+    patch_prompt_template = (
+        "You are an expert in {role}.\n\n"
+        "Here is the task given to you: \n"
+        "{base_prompt}\n"
+        "Coding Instructions:\n"
+        "{coding_instructions}\n"
+        "Code till Now\n"
+        "{previous_code_module}\n\n"
+        "Review of the code till now:\n"
+        "{review}\n\n"
+        "Do not rewrite the code. Return only the edits needed to address the review, as one or more blocks of the form\n"
+        "{edit_format}\n"
+        "Every SEARCH section must be copied exactly from the code till now and match it in one place only. "
+        "RETURN ONLY THE BLOCKS AND NO pre and post text\n"
+    )
 
-    def __init__(self, coding_instructions,previous_code_module="No code till now !!"):
+    def __init__(self, coding_instructions, previous_code_module=no_code, review=None, incremental=True):
+        """
+        Args:
+            coding_instructions (str): Implementation plan to code against
+            previous_code_module (str): Code from the previous round, if any
+            review (str): Review of the previous code to address in this round
+            incremental (bool): Ask for search/replace edits against the previous code instead of
+                regenerating it, falling back to full regeneration when the edits do not apply
+        """
         self.coding_instructions = coding_instructions.strip() if coding_instructions else ""
         prompt = self.basic_prompt_template.format(coding_instructions=self.coding_instructions)
         super(CodingAgent, self).__init__(self.role, prompt, context=None)
-        self.previous_code_module = previous_code_module
+        self.previous_code_module = previous_code_module or self.no_code
+        self.review = review.strip() if review else ""
+        self.incremental = bool(incremental and self.review and self.previous_code_module != self.no_code)
+        self.patcher = CodePatcher()
+        self.patch_error = None
+
+    @property
+    def output_phase(self):
+        return "patch" if self.incremental else "output"
+
+    def _build_patch_prompt(self):
+        from langchain_core.prompts import PromptTemplate
+        base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
+        prompt = PromptTemplate(
+            input_variables=["role", "base_prompt", "coding_instructions", "previous_code_module", "review",
+                             "edit_format"],
+            template=self.patch_prompt_template
+        )
+        return prompt, {
+            "role": self.role,
+            "base_prompt": base_prompt,
+            "coding_instructions": self.coding_instructions,
+            "previous_code_module": self.previous_code_module,
+            "review": self.review,
+            "edit_format": self.patcher.edit_format
+        }
 
     @override
-    def get_output(self):
-        if not self.llm:
-            raise ValueError("LLM is not set.")
+    def _build_output_prompt(self):
+        from langchain_core.prompts import PromptTemplate
+        if self.incremental:
+            return self._build_patch_prompt()
 
         # Use the enhanced prompt if available, else the basic one
         base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
@@ -43,24 +93,76 @@ class CodingAgent(BaseAgent):
             "{coding_instructions}\n"
             "Code till Now\n"
             "{previous_code_module}\n"
+            "Review of the code till now:\n"
+            "{review}\n"
         )
 
         prompt = PromptTemplate(
-            input_variables=["role", "context", "base_prompt", "coding_instructions","previous_code_module"],
+            input_variables=["role", "context", "base_prompt", "coding_instructions","previous_code_module", "review"],
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.context,
             "base_prompt": base_prompt,
             "coding_instructions": self.coding_instructions,
-            "previous_code_module": self.previous_code_module
-        })['text']
+            "previous_code_module": self.previous_code_module,
+            "review": self.review or "None"
+        }
+
+    def _fall_back(self, error):
+        # The edits did not apply, regenerate the whole module instead
+        self.patch_error = error
+        self.incremental = False
+
+    @override
+    def get_output(self):
+        if self.incremental:
+            try:
+                return self.patcher.apply(self.previous_code_module, super(CodingAgent, self).get_output())
+            except PatchError as e:
+                self._fall_back(e)
+        return super(CodingAgent, self).get_output()
+
+    @override
+    async def aget_output(self):
+        if self.incremental:
+            try:
+                return self.patcher.apply(self.previous_code_module, await super(CodingAgent, self).aget_output())
+            except PatchError as e:
+                self._fall_back(e)
+        return await super(CodingAgent, self).aget_output()
+
+    @override
+    def stream_output(self):
+        """Stream the regenerated code, or yield the patched code in one piece in incremental mode."""
+        if self.incremental:
+            try:
+                code = self.patcher.apply(self.previous_code_module, super(CodingAgent, self).get_output())
+            except PatchError as e:
+                self._fall_back(e)
+            else:
+                yield code
+                return
+        yield from super(CodingAgent, self).stream_output()
+
+    @override
+    async def astream_output(self):
+        if self.incremental:
+            try:
+                code = self.patcher.apply(self.previous_code_module, await super(CodingAgent, self).aget_output())
+            except PatchError as e:
+                self._fall_back(e)
+            else:
+                yield code
+                return
+        async for chunk in super(CodingAgent, self).astream_output():
+            yield chunk
 
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     print("This is a Coding Agent module. It is not meant to be run directly.")
     coding_instructions = """
     kay, here is the comprehensive Implementation Plan for the Process Lifecycle and Context Switching Simulator, adhering strictly to the provided requirements and the single-file constraint.
@@ -264,11 +366,7 @@ This plan provides a detailed blueprint for developing the simulator within the
 
     """
     coding_agent = CodingAgent(coding_instructions)
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
     coding_agent.set_llm(llm)
     coding_agent.set_prompt_enhancer_llm(llm)
     print("_" * 50)
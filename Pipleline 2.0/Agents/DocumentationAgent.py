@@ -1,5 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-
 from BaseAgent import BaseAgent
 
 
@@ -15,6 +13,9 @@ class DocumentationAgent(BaseAgent):
       - Troubleshooting tips
       - Maintenance instructions
     """
+    # Documents the code from its markup, styles and scripts; comments and layout are not needed
+    code_view = "compact"
+    code_inputs = ("context",)
 
     def __init__(self,integrated_system=None):
         super(DocumentationAgent, self).__init__(self.role, basic_prompt=self.basic_prompt_template, context=None)
@@ -22,12 +23,9 @@ class DocumentationAgent(BaseAgent):
 
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     agent = DocumentationAgent("<html>Hello</html>")
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
     agent.set_llm(llm)
     agent.set_prompt_enhancer_llm(llm)
     print(agent.enhance_prompt())
@@ -1,6 +1,3 @@
-from langchain.chains.llm import LLMChain
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing_extensions import override
 
 from BaseAgent import BaseAgent
@@ -22,11 +19,9 @@ class HumanReviewAgentForRequirement(BaseAgent):
 
 
     @override
-    def get_output(self):
-        if not self.llm:
-            raise ValueError("LLM is not set.")
-
+    def _build_output_prompt(self):
         # Use the enhanced prompt if available, else the basic one
+        from langchain_core.prompts import PromptTemplate
         base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
 
         final_prompt_template = (
@@ -45,11 +40,10 @@ class HumanReviewAgentForRequirement(BaseAgent):
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.context,
             "base_prompt": base_prompt,
             "current_requirements": self.current_requirements,
             "review": self.review
-        })['text']
+        }
@@ -1,8 +1,3 @@
-import PyPDF2
-from langchain.chains.llm import LLMChain
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-
 from BaseAgent import BaseAgent
 
 
@@ -23,11 +18,8 @@ class ImplementationAgent(BaseAgent):
         # Format the prompt with the approved requirements.
         super(ImplementationAgent, self).__init__(self.role, basic_prompt=self.basic_prompt_template, context=None)
 
-    def get_output(self):
-
-        if not self.llm:
-            raise ValueError("LLM is not set.")
-
+    def _build_output_prompt(self):
+        from langchain_core.prompts import PromptTemplate
         final_prompt_template = (
             "You are an expert in {role}.\n\n"
             "Prompt: {prompt}\n\n"
@@ -39,16 +31,15 @@ class ImplementationAgent(BaseAgent):
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        output = chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.approved_requirements,
             "prompt": self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
-        })
-        return output['text']
+        }
 
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     approved_requirements = """
 *   Simulate the lifecycle of processes, including creation and state transitions (e.g., running, waiting).
 *   Model the context switching mechanism between simulated processes.
@@ -66,11 +57,7 @@ if __name__ == "__main__":
     """
 
     impl_agent = ImplementationAgent(approved_requirements)
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
     impl_agent.set_llm(llm)
     impl_agent.set_prompt_enhancer_llm(llm)
 
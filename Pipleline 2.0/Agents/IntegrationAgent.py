@@ -1,6 +1,3 @@
-from langchain import PromptTemplate
-from langchain.chains.llm import LLMChain
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing_extensions import override
 
 from BaseAgent import BaseAgent
@@ -17,6 +14,8 @@ class IntegrationAgent(BaseAgent):
 
     previous_code_module = None
     current_code_module = None
+    # The modules are merged into the delivered file, comments included
+    code_view = "full"
 
     def __init__(self,previous_code_module=None, current_code_module=None):
         super(IntegrationAgent, self).__init__(self.role, basic_prompt=self.basic_prompt_template, context=None)
@@ -26,11 +25,9 @@ class IntegrationAgent(BaseAgent):
 
 
     @override
-    def get_output(self):
-        if not self.llm:
-            raise ValueError("LLM is not set.")
-
+    def _build_output_prompt(self):
         # Use the enhanced prompt if available, else the basic one
+        from langchain_core.prompts import PromptTemplate
         base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
 
         final_prompt_template = (
@@ -49,16 +46,16 @@ class IntegrationAgent(BaseAgent):
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.context,
             "base_prompt": base_prompt,
             "previous_code_module": self.previous_code_module,
             "current_code_module": self.current_code_module
-        })['text']
+        }
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     code_module = """
     def add(a, b):
         return a + b
@@ -69,11 +66,7 @@ if __name__ == "__main__":
     """
 
     integration_agent = IntegrationAgent(previous_code_module=previous_code_module, current_code_module=code_module)
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=10000
-    )
+    llm = LLMClientPool.shared().llm(max_tokens=10000)
 
     integration_agent.set_llm(llm)
     integration_agent.set_prompt_enhancer_llm(llm)
@@ -1,7 +1,11 @@
-import PyPDF2
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from typing_extensions import override
 
 from BaseAgent import BaseAgent
+from PdfTextExtractor import PdfTextExtractor
 
 class RequirementsAgent(BaseAgent):
     """This agent is responsible for gathering requirements from the user.
@@ -18,28 +22,188 @@ class RequirementsAgent(BaseAgent):
     """
 
     file_path = None
+    text_cache = None
+
+    map_prompt_template = (
+        "You are an expert in {role}.\n\n"
+        "This is part {index} of {count} of a requirements document:\n"
+        "{chunk}\n\n"
+        "Here is the task given to you: \n"
+        "{base_prompt}\n"
+        "Only extract the requirements stated in this part. Return them as bullet points, one per line, "
+        "without any other text.\n"
+    )
+
+    reduce_prompt_template = (
+        "You are an expert in {role}.\n\n"
+        "Partial requirement lists extracted from consecutive parts of one requirements document:\n"
+        "{partials}\n\n"
+        "Here is the task given to you: \n"
+        "{base_prompt}\n"
+        "Merge the partial lists into a single list. Remove duplicates and near-duplicates, keep every distinct "
+        "requirement and order them by priority.\n"
+    )
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, text_cache=None, file_digest=None, map_reduce=False, chunk_size=12000,
+                 max_concurrency=4):
+        """
+        Args:
+            file_path (str): Requirements PDF to read
+            text_cache (PdfTextCache): Optional cache of extracted text, shared across runs
+            file_digest (str): SHA-256 of the PDF bytes, if the caller already knows it
+            map_reduce (bool): Extract requirements from section-aligned chunks concurrently and merge them,
+                instead of sending the whole document in one prompt
+            chunk_size (int): Maximum characters per chunk in map-reduce mode
+            max_concurrency (int): Maximum chunk extractions in flight in map-reduce mode
+        """
         super(RequirementsAgent, self).__init__(self.role, self.basic_prompt,context=None,)
         self.file_path = file_path
+        self.text_cache = text_cache
+        self.file_digest = file_digest
+        self.map_reduce = map_reduce
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
         self.read_requirements()
 
     def read_requirements(self):
-        with open(self.file_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        self.context = text.strip()
+        if self.text_cache is not None:
+            self.context = self.text_cache.get_text(self.file_path, self.file_digest)
+        else:
+            self.context = PdfTextExtractor().extract_text(self.file_path)
         return  self.context
 
+    def split_chunks(self):
+        """Split the document into chunks of at most ``chunk_size`` characters along section and line boundaries."""
+        pieces = []
+        for section in re.split(r"\n\s*\n", self.context or ""):
+            if len(section) <= self.chunk_size:
+                pieces.append(section)
+                continue
+            for line in section.split("\n"):
+                # A single line longer than a chunk is cut hard
+                pieces.extend(line[i:i + self.chunk_size] for i in range(0, max(len(line), 1), self.chunk_size))
+
+        chunks, current = [], ""
+        for piece in pieces:
+            if current and len(current) + len(piece) + 1 > self.chunk_size:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n{piece}" if current else piece
+        if current.strip():
+            chunks.append(current)
+        return chunks
+
+    def _use_map_reduce(self):
+        return self.map_reduce and len(self.context or "") > self.chunk_size
+
+    def _build_map_prompts(self):
+        from langchain_core.prompts import PromptTemplate
+        base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
+        prompt = PromptTemplate(
+            input_variables=["role", "index", "count", "chunk", "base_prompt"],
+            template=self.map_prompt_template
+        )
+        chunks = self.split_chunks()
+        return [
+            (prompt, {
+                "role": self.role,
+                "index": index,
+                "count": len(chunks),
+                "chunk": chunk,
+                "base_prompt": base_prompt
+            })
+            for index, chunk in enumerate(chunks, start=1)
+        ]
+
+    @staticmethod
+    def merge_partials(partials):
+        """Join the partial lists, dropping requirements already listed by an earlier part."""
+        seen = set()
+        merged = []
+        for index, partial in enumerate(partials, start=1):
+            lines = []
+            for line in partial.splitlines():
+                key = re.sub(r"[^a-z0-9 ]", "", re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s*", "", line).lower())
+                key = " ".join(key.split())
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                lines.append(line)
+            if lines:
+                merged.append(f"--- Part {index} ---\n" + "\n".join(lines))
+        return "\n\n".join(merged)
+
+    def _build_reduce_prompt(self, partials):
+        from langchain_core.prompts import PromptTemplate
+        base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
+        prompt = PromptTemplate(
+            input_variables=["role", "partials", "base_prompt"],
+            template=self.reduce_prompt_template
+        )
+        return prompt, {
+            "role": self.role,
+            "partials": self.merge_partials(partials),
+            "base_prompt": base_prompt
+        }
+
+    def _map_chunks(self):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(lambda request: self._run_prompt(self.llm, *request, "map"), self._build_map_prompts()))
+
+    async def _amap_chunks(self):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(request):
+            async with semaphore:
+                return await self._arun_prompt(self.llm, *request, "map")
+
+        return await asyncio.gather(*(run(request) for request in self._build_map_prompts()))
+
+    async def _astream_map_reduce(self):
+        partials = await self._amap_chunks()
+        async for chunk in self._astream(self.llm, self._render(*self._build_reduce_prompt(partials)), "reduce",
+                                             fitted=True):
+            yield chunk
+
+    @override
+    def get_output(self):
+        if not self._use_map_reduce():
+            return super(RequirementsAgent, self).get_output()
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return self._run_prompt(self.llm, *self._build_reduce_prompt(self._map_chunks()), "reduce")
+
+    @override
+    async def aget_output(self):
+        if not self._use_map_reduce():
+            return await super(RequirementsAgent, self).aget_output()
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return await self._arun_prompt(self.llm, *self._build_reduce_prompt(await self._amap_chunks()), "reduce")
+
+    @override
+    def stream_output(self):
+        if not self._use_map_reduce():
+            return super(RequirementsAgent, self).stream_output()
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        # The map step runs up front; only the merged list is streamed
+        return self._stream(self.llm, self._render(*self._build_reduce_prompt(self._map_chunks())), "reduce",
+                            fitted=True)
+
+    @override
+    def astream_output(self):
+        if not self._use_map_reduce():
+            return super(RequirementsAgent, self).astream_output()
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return self._astream_map_reduce()
+
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     req = RequirementsAgent("../1.pdf")
-    llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro-exp-03-25",
-            temperature=0.1,
-            max_tokens=100000
-        )
+    llm = LLMClientPool.shared().llm()
     req.set_llm(llm)
     req.set_prompt_enhancer_llm(llm)
     print("_"*50)
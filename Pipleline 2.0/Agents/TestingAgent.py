@@ -1,36 +1,66 @@
 import sys
 
-import PyPDF2
-from langchain import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing_extensions import override
+
 from BaseAgent import BaseAgent
+from HtmlChecker import HtmlChecker
 
 class TestingAgent(BaseAgent):
     role = "Testing Agent"
     basic_prompt_template = """
     You are a meticulous TestingAgent.
-    Test the following code module (designed to be embedded in an HTML file) by simulating its execution.
+    Test the code module below (designed to be embedded in an HTML file) by simulating its execution.
     Return a detailed report indicating "passed" if all tests succeed, or describe any failures clearly.
-
-    Code Module:
-    {code_module}
     """
 
     context= None
+    # Report the defects static checks find in the module instead of simulating it
+    static_checks = True
+    code_view = "compact"
+    code_inputs = ("code_module",)
 
     def __init__(self, code_module):
 
-        self.context = code_module.strip() if code_module else ""
-        prompt = self.basic_prompt_template.format(code_module=self.code_module)
-        super(TestingAgent, self).__init__(self.role, prompt, context=None)
+        self.code_module = code_module.strip() if code_module else ""
+        super(TestingAgent, self).__init__(self.role, basic_prompt=self.basic_prompt_template, context=None)
+
+    @override
+    def static_review(self):
+        if not self.static_checks or not self.code_module:
+            return ""
+        return HtmlChecker.review_of(self.code_module)
+
+    @override
+    def _build_output_prompt(self):
+        # The module is an input rather than part of the basic prompt, so the enhanced prompt is reused
+        from langchain_core.prompts import PromptTemplate
+        base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
+
+        final_prompt_template = (
+            "You are an expert in {role}.\n\n"
+            "{context}\n\n"
+            "Here is the task given to you: \n"
+            "{base_prompt}\n"
+            "Code Module:\n"
+            "{code_module}\n"
+        )
+
+        prompt = PromptTemplate(
+            input_variables=["role", "context", "base_prompt", "code_module"],
+            template=final_prompt_template
+        )
+
+        return prompt, {
+            "role": self.role,
+            "context": self.context,
+            "base_prompt": base_prompt,
+            "code_module": self.code_module
+        }
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     agent = TestingAgent(code_module=sys.argv[1])
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
     agent.set_llm(llm)
     agent.set_prompt_enhancer_llm(llm)
     print(agent.enhance_prompt())
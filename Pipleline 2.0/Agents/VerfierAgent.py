@@ -1,9 +1,7 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing_extensions import override
 
-from langchain import PromptTemplate
-from langchain.chains.llm import LLMChain
 from BaseAgent import BaseAgent
+from HtmlChecker import HtmlChecker
 
 class VerifierAgent(BaseAgent):
 
@@ -17,14 +15,24 @@ class VerifierAgent(BaseAgent):
 
     integrated_system = None
     req_doc = None
+    # Report the defects static checks find in the system instead of asking the model
+    static_checks = True
+    code_view = "compact"
+    code_inputs = ("integrated_system",)
+
     def __init__(self):
         super(VerifierAgent, self).__init__(self.role, basic_prompt=self.basic_prompt_template, context=None)
+
     @override
-    def get_output(self):
-        if not self.llm:
-            raise ValueError("LLM is not set.")
+    def static_review(self):
+        if not self.static_checks or not self.integrated_system:
+            return ""
+        return HtmlChecker.review_of(self.integrated_system)
 
+    @override
+    def _build_output_prompt(self):
         # Use the enhanced prompt if available, else the basic one
+        from langchain_core.prompts import PromptTemplate
         base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
 
         final_prompt_template = (
@@ -43,23 +51,19 @@ class VerifierAgent(BaseAgent):
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.context,
             "base_prompt": base_prompt,
             "integrated_system": self.integrated_system,
             "req_doc": self.req_doc
-        })['text']
+        }
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     agent = VerifierAgent()
     agent.integrated_system = "<html>Hello</html>"
     agent.req_doc = "print Hello"
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
     agent.set_llm(llm)
     agent.set_prompt_enhancer_llm(llm)
     print(agent.enhance_prompt())
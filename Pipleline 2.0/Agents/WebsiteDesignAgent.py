@@ -1,8 +1,9 @@
 # from Agents.BaseAgent import BaseAgent
 from BaseAgent import BaseAgent
+from CodePatcher import CodePatcher, PatchError
+from HtmlChecker import HtmlChecker
 import json
 import os
-import markdown
 import re
 
 class WebsiteDesignAgent(BaseAgent):
@@ -10,11 +11,14 @@ class WebsiteDesignAgent(BaseAgent):
     Agent responsible for creating a complete webpage with multiple sections/tabs
     by combining simulation code with content from markdown and JSON files.
     """
-    
+    # The page embeds the simulation code as generated
+    code_view = "full"
+
     def __init__(self, simulation_code, aim_path=None, theory_path=None, procedure_path=None, 
                  objective_path=None, pretest_path=None, enhanced_css=False, left_tabs=False,
                  generate_procedure=False, generate_content=False, feedback="", 
-                 aim_content=None, theory_content=None, objective_content=None, pretest_content=None):
+                 aim_content=None, theory_content=None, objective_content=None, pretest_content=None,
+                 incremental_revision=True):
         """
         Initialize the Website Design Agent
         
@@ -34,6 +38,8 @@ class WebsiteDesignAgent(BaseAgent):
             theory_content (str/dict): Content for theory section, provided directly instead of from file
             objective_content (str/dict): Content for objective section, provided directly instead of from file
             pretest_content (list): Pretest questions provided directly instead of from file
+            incremental_revision (bool): With feedback on a previous website, ask for section-scoped edits
+                and apply them locally instead of having the whole site generated again
         """
         # Define role and basic prompt for the BaseAgent constructor
         role = "Web Developer"
@@ -66,6 +72,15 @@ class WebsiteDesignAgent(BaseAgent):
         
         # Add field for previous website code
         self.previous_website_code = None
+
+        # Cleaned page produced by the last streamed generation
+        self.website_html = None
+
+        self.incremental_revision = incremental_revision
+        self.patcher = CodePatcher()
+        self.revision_error = None
+        # Set when generation failed and an error page was returned instead
+        self.generation_error = None
     
     def set_llm(self, llm):
         """Set the language model to be used by this agent"""
@@ -89,8 +104,10 @@ class WebsiteDesignAgent(BaseAgent):
         """
         self.previous_website_code = website_code
         
+        if self.prompt_template and self._revising():
+            self.prompt_template = self._build_revision_prompt()
         # If we have previous code, modify the prompt template to include it
-        if self.prompt_template and self.previous_website_code:
+        elif self.prompt_template and self.previous_website_code:
             # Add the previous website code to the prompt template
             self.prompt_template += f"""
             
@@ -108,6 +125,11 @@ class WebsiteDesignAgent(BaseAgent):
             Do NOT generate a completely new website. Instead, identify the specific changes needed
             based on the feedback and update the existing code accordingly.
             """
+
+    def _revising(self):
+        """Whether feedback on a previous website is applied as section-scoped edits."""
+        return bool(self.incremental_revision and self.previous_website_code
+                    and self.feedback and self.feedback.strip())
     
     def _read_content_file(self, file_path):
         """Read content from a file, if file exists."""
@@ -142,8 +164,8 @@ class WebsiteDesignAgent(BaseAgent):
         # If can't isolate, return the whole thing
         return self.simulation_code
     
-    def enhance_prompt(self):
-        """Enhance the prompt template with specific content for website generation."""
+    def _build_prompt_template(self):
+        """Build the website generation prompt from the simulation code and section content."""
         # Get content either from provided content or files
         aim = self.aim_content if self.aim_content is not None else self._read_content_file(self.aim_path)
         theory = self.theory_content if self.theory_content is not None else self._read_content_file(self.theory_path)
@@ -308,13 +330,132 @@ class WebsiteDesignAgent(BaseAgent):
         Make sure the website is fully functional, visually appealing, and educational.
         """
         
-        self.prompt_template = template
-        
+        return template
+
+    def _build_revision_prompt(self):
+        """Build the prompt asking for section-scoped edits to the previous website."""
+        sections = "\n        ".join(f"- {name}" for name in HtmlChecker.sections_of(self.previous_website_code))
+        template = f"""
+        You are a professional web developer revising an existing virtual lab website.
+
+        # USER FEEDBACK
+        Please incorporate the following user feedback into the website design:
+        {self.feedback}
+        """
+
+        if self.custom_enhancement:
+            template += f"""
+            # ADDITIONAL REQUIREMENTS
+            {self.custom_enhancement}
+            """
+
+        template += f"""
+        # CURRENT WEBSITE
+        ```html
+        {self.previous_website_code}
+        ```
+
+        # SECTIONS
+        Every element with an id is a section named after its id. Inline style and script blocks are named
+        style, style-2, ... and script, script-2, ... in document order. The sections of the current website are:
+        {sections}
+
+        # OUTPUT FORMAT
+        Do NOT output the website again. Return only the edits needed to implement the feedback, as one or more
+        blocks of the following form, where section-name is one of the sections listed above:
+
+        {self.patcher.section_edit_format}
+
+        Every SEARCH part must be copied exactly from the named section and match it in one place only.
+        Keep the page a single, well-formed HTML file. RETURN ONLY THE BLOCKS AND NO pre and post text.
+        """
+
+        return template
+
+    def _apply_revision(self, edits):
+        """Apply the model's edits to the previous website and check the result is still well-formed."""
+        html = self.patcher.apply(self.previous_website_code, edits, HtmlChecker.sections_of)
+        known_problems = set(HtmlChecker.problems_in(self.previous_website_code))
+        new_problems = [problem for problem in HtmlChecker.problems_in(html) if problem not in known_problems]
+        if new_problems:
+            raise PatchError("Revised website is not well-formed: " + "; ".join(new_problems[:5]))
+        return html
+
+    def _fall_back(self, error):
+        # The edits did not apply cleanly, have the whole site generated again instead
+        self.revision_error = error
+        self.incremental_revision = False
+        self.prompt_template = ""
+
+    def _build_enhancer_prompt(self, template):
+        return f"Please enhance the following prompt template for a virtual lab website design task. Focus on clarity and detail:\n\n{template}"
+
+    def enhance_prompt(self):
+        """Enhance the prompt template with specific content for website generation."""
+        if self._revising():
+            # The edit instructions are exact already, and enhancing would echo the whole previous site
+            self.prompt_template = self._build_revision_prompt()
+            return
+        self.prompt_template = self._build_prompt_template()
+
         # Optional: let the LLM enhance the prompt further if needed
         if self.prompt_enhancer_llm:
-            enhancer_prompt = f"Please enhance the following prompt template for a virtual lab website design task. Focus on clarity and detail:\n\n{template}"
-            enhanced_prompt = self.prompt_enhancer_llm.invoke(enhancer_prompt).content
-            self.prompt_template = enhanced_prompt
+            enhancer_prompt = self._build_enhancer_prompt(self.prompt_template)
+            self.prompt_template = self._complete(self.prompt_enhancer_llm, enhancer_prompt, "enhance")
+
+    async def aenhance_prompt(self):
+        """Async counterpart of ``enhance_prompt``."""
+        if self._revising():
+            self.prompt_template = self._build_revision_prompt()
+            return
+        self.prompt_template = self._build_prompt_template()
+
+        if self.prompt_enhancer_llm:
+            enhancer_prompt = self._build_enhancer_prompt(self.prompt_template)
+            self.prompt_template = await self._acomplete(self.prompt_enhancer_llm, enhancer_prompt, "enhance")
+
+    def _clean_html(self, html_content):
+        """Strip wrapper text from the model response and de-duplicate the simulation."""
+        # Extract just the HTML if it's wrapped in fences or other text
+        html_content = HtmlChecker.extract(html_content)
+
+
+        # Ensure that the simulation is only in the Simulation tab by checking for duplicates
+        # This is a fallback in case the model doesn't follow instructions
+        if "<html" in html_content:
+            # Simple heuristic: If we see the same simulation code snippet in multiple places,
+            # we'll clean it up by keeping only the one in the simulation tab
+            simulation_snippet = self._extract_simulation_content()
+            
+            # If we can identify key parts of the simulation
+            if simulation_snippet and len(simulation_snippet) > 100:
+                # Try to identify a unique signature from the simulation (first 100 chars)
+                sim_signature = simulation_snippet[:100]
+                
+                # Count occurrences
+                occurrences = html_content.count(sim_signature)
+                
+                # If the simulation appears to be duplicated
+                if occurrences > 1:
+                    # Try to identify the simulation tab content
+                    sim_tab_pattern = re.compile(r'(id=["\']\w*simulation\w*["\'])(.*?)' + re.escape(sim_signature), re.DOTALL | re.IGNORECASE)
+                    sim_tab_match = sim_tab_pattern.search(html_content)
+                    
+                    if sim_tab_match:
+                        # Keep the simulation in the simulation tab and remove others
+                        for _ in range(occurrences - 1):
+                            # Find the last occurrence and remove it if it's not in the simulation tab
+                            last_index = html_content.rfind(sim_signature)
+                            if last_index > 0 and sim_tab_match.start() != last_index:
+                                html_content = html_content[:last_index] + "<!-- Simulation code moved to Simulation tab -->" + html_content[last_index + len(simulation_snippet):]
+                
+        return html_content
+
+    def _failed(self, error):
+        """Record ``error`` as the generation error and return the error page shown instead of the website."""
+        self.generation_error = error
+        self.website_html = f"<html><body><h1>Error generating website</h1><p>{str(error)}</p></body></html>"
+        return self.website_html
 
     def generate_website(self):
         """Generate the complete website HTML"""
@@ -322,51 +463,101 @@ class WebsiteDesignAgent(BaseAgent):
             return "Error: Language model not set. Please call set_llm() first."
             
         try:
-            response = self.llm.invoke(self.prompt_template)
+            if self._revising():
+                try:
+                    return self._apply_revision(self._complete(self.llm, self.prompt_template, "revise"))
+                except PatchError as e:
+                    self._fall_back(e)
+                    self.enhance_prompt()
             # Extract HTML content from the response
-            html_content = response.content
-            
-            # Try to extract just the HTML if it's wrapped in other text
-            html_pattern = re.compile(r'```(?:html)?(.*?)```', re.DOTALL)
-            match = html_pattern.search(html_content)
-            if match:
-                html_content = match.group(1).strip()
-                
-            # Ensure that the simulation is only in the Simulation tab by checking for duplicates
-            # This is a fallback in case the model doesn't follow instructions
-            if "<html" in html_content:
-                # Simple heuristic: If we see the same simulation code snippet in multiple places,
-                # we'll clean it up by keeping only the one in the simulation tab
-                simulation_snippet = self._extract_simulation_content()
-                
-                # If we can identify key parts of the simulation
-                if simulation_snippet and len(simulation_snippet) > 100:
-                    # Try to identify a unique signature from the simulation (first 100 chars)
-                    sim_signature = simulation_snippet[:100]
-                    
-                    # Count occurrences
-                    occurrences = html_content.count(sim_signature)
-                    
-                    # If the simulation appears to be duplicated
-                    if occurrences > 1:
-                        # Try to identify the simulation tab content
-                        sim_tab_pattern = re.compile(r'(id=["\']\w*simulation\w*["\'](.*?)' + re.escape(sim_signature), re.DOTALL | re.IGNORECASE)
-                        sim_tab_match = sim_tab_pattern.search(html_content)
-                        
-                        if sim_tab_match:
-                            # Keep the simulation in the simulation tab and remove others
-                            for _ in range(occurrences - 1):
-                                # Find the last occurrence and remove it if it's not in the simulation tab
-                                last_index = html_content.rfind(sim_signature)
-                                if last_index > 0 and sim_tab_match.start() != last_index:
-                                    html_content = html_content[:last_index] + "<!-- Simulation code moved to Simulation tab -->" + html_content[last_index + len(simulation_snippet):]
-                    
-            return html_content
+            return self._clean_html(self._complete(self.llm, self.prompt_template))
         except Exception as e:
-            return f"<html><body><h1>Error generating website</h1><p>{str(e)}</p></body></html>"
+            return self._failed(e)
+
+    async def agenerate_website(self):
+        """Async counterpart of ``generate_website``."""
+        if not self.llm:
+            return "Error: Language model not set. Please call set_llm() first."
+
+        try:
+            if self._revising():
+                try:
+                    return self._apply_revision(await self._acomplete(self.llm, self.prompt_template, "revise"))
+                except PatchError as e:
+                    self._fall_back(e)
+                    await self.aenhance_prompt()
+            return self._clean_html(await self._acomplete(self.llm, self.prompt_template))
+        except Exception as e:
+            return self._failed(e)
     
     def get_output(self):
         """Generate and return the website HTML"""
         if not self.prompt_template:
             self.enhance_prompt()
         return self.generate_website()
+
+    async def aget_output(self):
+        """Generate and return the website HTML without blocking the event loop"""
+        if not self.prompt_template:
+            await self.aenhance_prompt()
+        return await self.agenerate_website()
+
+    def stream_output(self):
+        """
+        Yield the raw website HTML in chunks as the model produces it.
+        Once the generator is exhausted, the cleaned page is available in ``self.website_html``.
+        A revision applied as edits is yielded in one piece. If generation fails, the stream ends
+        early and ``self.website_html`` is the error page, as ``generate_website`` returns it.
+        """
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        try:
+            yield from self._stream_website()
+        except Exception as e:
+            self._failed(e)
+
+    def _stream_website(self):
+        if not self.prompt_template:
+            self.enhance_prompt()
+        if self._revising():
+            try:
+                self.website_html = self._apply_revision(self._complete(self.llm, self.prompt_template, "revise"))
+            except PatchError as e:
+                self._fall_back(e)
+                self.enhance_prompt()
+            else:
+                yield self.website_html
+                return
+        chunks = []
+        for chunk in self._stream(self.llm, self.prompt_template):
+            chunks.append(chunk)
+            yield chunk
+        self.website_html = self._clean_html("".join(chunks))
+
+    async def astream_output(self):
+        """Async counterpart of ``stream_output``."""
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        try:
+            async for chunk in self._astream_website():
+                yield chunk
+        except Exception as e:
+            self._failed(e)
+
+    async def _astream_website(self):
+        if not self.prompt_template:
+            await self.aenhance_prompt()
+        if self._revising():
+            try:
+                self.website_html = self._apply_revision(await self._acomplete(self.llm, self.prompt_template, "revise"))
+            except PatchError as e:
+                self._fall_back(e)
+                await self.aenhance_prompt()
+            else:
+                yield self.website_html
+                return
+        chunks = []
+        async for chunk in self._astream(self.llm, self.prompt_template):
+            chunks.append(chunk)
+            yield chunk
+        self.website_html = self._clean_html("".join(chunks))
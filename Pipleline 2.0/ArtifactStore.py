@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+
+# Shared by every store of the process, so no gc runs between another store's put and the index entry
+# referring to it; other processes are covered by gc's grace period
+_lock = threading.Lock()
+
+
+def _remove(path):
+    """Remove ``path`` and return True, or False if the gc of another process removed it first."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _mtime(path):
+    """Return the modification time of ``path``, or 0 if it was removed meanwhile."""
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+class ArtifactStore:
+    """
+    Versioned store of every output a run generates, kept under its content hash.
+
+    Outputs are zlib-compressed into ``objects/<2 hex>/<sha256>``, so identical
+    outputs (an unchanged stage re-run, the same code in two runs) are stored
+    once. Each run has a small JSON index in ``runs/<run id>.json`` listing its
+    iterations in order, so a run's history is a single file read and any
+    earlier iteration is one object read away. ``gc`` keeps the store bounded
+    by dropping the oldest runs and the objects no remaining run refers to.
+    """
+
+    def __init__(self, directory, max_runs=1000, max_bytes=None, grace=600):
+        """
+        Args:
+            directory (str): Root of the store
+            max_runs (int): Runs kept by ``gc``; older ones are dropped first
+            max_bytes (int): Compressed size ``gc`` keeps the objects under, None for no limit
+            grace (float): Seconds after it was last stored during which ``gc`` never removes an object,
+                so outputs another process stored but has not recorded in its index yet survive
+        """
+        self.directory = directory
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.objects_dir = os.path.join(directory, "objects")
+        self.runs_dir = os.path.join(directory, "runs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the store configured by the environment, or None if ``ARTIFACT_STORE=0`` turns it off:
+
+        ARTIFACT_STORE_DIR=.cache/artifacts
+        ARTIFACT_STORE_MAX_RUNS=1000
+        ARTIFACT_STORE_MAX_MB=500
+        ARTIFACT_STORE_GRACE_S=600
+        """
+        if os.getenv("ARTIFACT_STORE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        max_mb = os.getenv("ARTIFACT_STORE_MAX_MB")
+        return cls(
+            os.getenv("ARTIFACT_STORE_DIR", ".cache/artifacts"),
+            max_runs=int(os.getenv("ARTIFACT_STORE_MAX_RUNS", "1000")),
+            max_bytes=int(max_mb) * 2 ** 20 if max_mb else None,
+            grace=float(os.getenv("ARTIFACT_STORE_GRACE_S", "600"))
+        )
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _index_path(self, run):
+        return os.path.join(self.runs_dir, f"{run}.json")
+
+    def put(self, content):
+        """Store ``content`` unless an identical output is stored already, and return its digest."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        try:
+            # Storing it again restarts its grace period
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomic(path, zlib.compress(data, 6))
+        return digest
+
+    def get(self, digest):
+        """Return the stored output with ``digest``, or None if it is not (or no longer) stored."""
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def iterations(self, run, stage=None):
+        """Return the entries of ``run``'s index in the order they were recorded, optionally of one stage only."""
+        try:
+            with open(self._index_path(run), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+        return [entry for entry in entries if stage is None or entry["stage"] == stage]
+
+    def record(self, run, stage, content):
+        """
+        Store ``content`` as the next iteration of ``stage`` in ``run`` and return its index entry.
+        Recording the same output as the stage's latest iteration again adds nothing.
+        """
+        # Under the lock so that a concurrent gc cannot sweep the object before the index refers to it
+        with _lock:
+            digest = self.put(content)
+            entries = self.iterations(run)
+            previous = [entry for entry in entries if entry["stage"] == stage]
+            if previous and previous[-1]["digest"] == digest:
+                return previous[-1]
+            entry = {
+                "stage": stage,
+                "iteration": len(previous) + 1,
+                "digest": digest,
+                "chars": len(content),
+                "created": time.time()
+            }
+            entries.append(entry)
+            self._write_atomic(self._index_path(run), json.dumps(entries, indent=1).encode("utf-8"))
+        return entry
+
+    def load(self, run, stage, iteration=None):
+        """Return iteration ``iteration`` (1-based, default the latest) of ``stage`` in ``run``, or None."""
+        entries = self.iterations(run, stage)
+        if not entries:
+            return None
+        entry = entries[-1] if iteration is None else next((e for e in entries if e["iteration"] == iteration), None)
+        return self.get(entry["digest"]) if entry else None
+
+    def runs(self):
+        """Return the ids of the stored runs, most recently updated first."""
+        names = [name for name in os.listdir(self.runs_dir) if name.endswith(".json")]
+        names.sort(key=lambda name: _mtime(os.path.join(self.runs_dir, name)), reverse=True)
+        return [name[:-len(".json")] for name in names]
+
+    def gc(self):
+        """
+        Drop the oldest runs beyond ``max_runs`` and every object no remaining run refers to,
+        then more of the oldest runs while the objects exceed ``max_bytes``. Objects stored within
+        the last ``grace`` seconds are kept either way. Returns the number of runs and objects removed.
+        """
+        with _lock:
+            recent = time.time() - self.grace
+            runs = self.runs()
+            dropped = runs[self.max_runs:]
+            runs = runs[:self.max_runs]
+            for run in dropped:
+                _remove(self._index_path(run))
+
+            # Number of remaining runs referring to each object
+            run_digests = {run: {entry["digest"] for entry in self.iterations(run)} for run in runs}
+            references = Counter(digest for digests in run_digests.values() for digest in digests)
+            sizes = {}
+            removed_objects = 0
+            for prefix in os.listdir(self.objects_dir):
+                for name in os.listdir(os.path.join(self.objects_dir, prefix)):
+                    path = os.path.join(self.objects_dir, prefix, name)
+                    if name.endswith(".tmp"):
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        # Removed by the gc of another process
+                        continue
+                    if stat.st_mtime >= recent:
+                        # Kept like an object a run still being recorded refers to
+                        references[name] += 1
+                    if references[name]:
+                        sizes[name] = stat.st_size
+                    elif _remove(path):
+                        removed_objects += 1
+
+            total = sum(sizes.values())
+            while self.max_bytes is not None and total > self.max_bytes and len(runs) > 1:
+                run = runs.pop()
+                _remove(self._index_path(run))
+                dropped.append(run)
+                for digest in run_digests.pop(run):
+                    references[digest] -= 1
+                    if not references[digest] and digest in sizes:
+                        total -= sizes.pop(digest)
+                        removed_objects += _remove(self._object_path(digest))
+        return len(dropped), removed_objects
@@ -1,15 +1,48 @@
+from contextlib import nullcontext
+
 import dotenv
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+from CodeCompactor import CodeCompactor
 
 dotenv.load_dotenv()
 
+# Finish reasons of an answer cut off at the model's output token limit (Gemini, OpenAI-style)
+_TRUNCATED_FINISH_REASONS = ("MAX_TOKENS", "LENGTH")
+
+
+class OutputTruncated(Exception):
+    """Raised for a lighter tier's answer that stopped at its token limit, so it is escalated rather than kept."""
+
+    def __init__(self, output):
+        super().__init__(f"Output stopped at the token limit after {len(output)} characters")
+        self.output = output
+
 
 class BaseAgent:
     llm = None
     prompt_enhancer_llm = None
     enhanced_prompt = None
+    response_cache = None
+    prompt_store = None
+    token_budget = None
+    tracer = None
+    model_router = None
+    # Bump in a subclass to invalidate its stored enhanced prompts
+    prompt_version = 1
+    # Phase recorded in the trace for the calls made by get_output and friends
+    output_phase = "output"
+    # View of generated code ("full", "compact" or "outline") the prompt inputs named in code_inputs get
+    code_view = "full"
+    code_inputs = ()
+
+    enhance_prompt_template = (
+        "You are an expert prompt engineer for the role of '{role}'.\n\n"
+        "The basic prompt that needs enhancing is:\n"
+        "{basic_prompt}\n\n"
+        "Using the above details, refine and improve the basic prompt by providing clear instructions, suggestions, and guidelines "
+        "on how to approach the task effectively. Ensure the enhanced prompt is actionable and provides hints on what the agent should expect, "
+        "but do not include any content that is part of the context since i will send it again\n\n"
+    )
 
     def __init__(self, role: str, basic_prompt: str, context: str = ""):
         self.role = role
@@ -21,37 +54,347 @@ class BaseAgent:
 
     def set_prompt_enhancer_llm(self, llm):
         self.prompt_enhancer_llm = llm
-    def enhance_prompt(self):
-        if  self.prompt_enhancer_llm is None:
-            raise ValueError("Prompt enhancer LLM is not set.")
 
-        enhanced_prompt_template = (
-            "You are an expert prompt engineer for the role of '{role}'.\n\n"
-            "The basic prompt that needs enhancing is:\n"
-            "{basic_prompt}\n\n"
-            "Using the above details, refine and improve the basic prompt by providing clear instructions, suggestions, and guidelines "
-            "on how to approach the task effectively. Ensure the enhanced prompt is actionable and provides hints on what the agent should expect, "
-            "but do not include any content that is part of the context since i will send it again\n\n"
-        )
+    def set_response_cache(self, cache):
+        self.response_cache = cache
+
+    def set_prompt_store(self, store):
+        self.prompt_store = store
+
+    def set_token_budget(self, budget):
+        self.token_budget = budget
+
+    def set_tracer(self, tracer):
+        self.tracer = tracer
+
+    def set_model_router(self, router):
+        self.model_router = router
+
+    def _render(self, prompt, inputs):
+        """
+        Render ``prompt`` with the code inputs in the agent's ``code_view``, first compacting
+        its largest inputs if the token budget requires it.
+        """
+        if self.code_view != "full":
+            inputs = {
+                name: CodeCompactor.view(value, self.code_view) if name in self.code_inputs else value
+                for name, value in inputs.items()
+            }
+        if self.token_budget is not None:
+            inputs = self.token_budget.fit_inputs(self.role, prompt, inputs)
+        return prompt.format(**inputs)
+
+    def _run_prompt(self, llm, prompt, inputs, phase="output"):
+        """Render ``prompt`` with ``inputs`` and complete it with ``llm``."""
+        return self._complete(llm, self._render(prompt, inputs), phase, fitted=True)
+
+    async def _arun_prompt(self, llm, prompt, inputs, phase="output"):
+        return await self._acomplete(llm, self._render(prompt, inputs), phase, fitted=True)
+
+    def _cache_key(self, llm, text):
+        if self.response_cache is None:
+            return None
+        # A pooled handle carries its whole configuration, a plain client only what it exposes
+        config = getattr(llm, "config", None)
+        if not isinstance(config, dict):
+            config = {name: getattr(llm, name, None) for name in ("model", "temperature", "max_tokens")}
+        return self.response_cache.make_key(text, config)
+
+    def _fit_to_budget(self, text, fitted=False):
+        # Cutting a rendered prompt whose inputs were already fitted could only cut its instructions
+        return self.token_budget.fit(self.role, text, refuse=fitted) if self.token_budget is not None else text
+
+    def _record_usage(self, text, output, usage=None):
+        if self.token_budget is not None:
+            self.token_budget.record(self.role, text, output, usage)
+
+    def _trace(self, llm, text, phase, stream=False):
+        """Return a context tracing one call to ``llm``; its span is a throwaway dict when tracing is off."""
+        if self.tracer is None:
+            return nullcontext({})
+        return self.tracer.span(self.role, phase, getattr(llm, "model", None), text, stream)
+
+    @staticmethod
+    def _trace_result(span, key, output, cached, usage=None):
+        span["cache"] = "off" if not key else ("hit" if cached else "miss")
+        span["response_chars"] = len(output)
+        if usage:
+            span["input_tokens"] = usage.get("input_tokens")
+            span["output_tokens"] = usage.get("output_tokens")
+
+    def _route(self, llm, phase):
+        """Return the tier routed for ``phase`` and the client to call; ("heavy", ``llm``) without a router."""
+        if self.model_router is None:
+            return "heavy", llm
+        return self.model_router.route(type(self).__name__, phase, llm)
+
+    @staticmethod
+    def _truncated(message):
+        """Whether ``message`` (a response or its last streamed chunk) stopped at the output token limit."""
+        reason = (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+        return str(getattr(reason, "name", reason)).upper() in _TRUNCATED_FINISH_REASONS
+
+    def _escalates(self, tier):
+        """Whether calls on ``tier`` can be escalated to the heavy model."""
+        return tier != "heavy" and self.model_router.escalate
+
+    def _escalating(self, tier, phase, output=None, error=None):
+        """Whether a call on ``tier`` that failed with ``error`` or returned ``output`` goes to the heavy model."""
+        if not self._escalates(tier):
+            return False
+        if error is None and self.model_router.acceptable(tier, output):
+            return False
+        self.model_router.record_escalation(type(self).__name__, phase)
+        return True
+
+    def _complete(self, llm, text, phase="output", fitted=False):
+        """Send a fully rendered prompt to ``llm``, answering from the response cache when possible.
+
+        ``phase`` names the step of the agent's work the call belongs to in the trace; ``fitted``
+        marks text rendered by ``_render``, which is refused rather than compacted if still too long.
+        With a model router, the call goes to the tier routed for ``phase`` and is escalated to ``llm``
+        if it fails, comes back too short or stops at the tier's token limit. The prompt is fitted to
+        the budget once, so an escalation resends it as it was, whatever the first attempt used up.
+        """
+        text = self._fit_to_budget(text, fitted)
+        tier, routed = self._route(llm, phase)
+        try:
+            output = self._complete_on(routed, text, phase, strict=self._escalates(tier))
+        except Exception as e:
+            if not self._escalating(tier, phase, error=e):
+                raise
+            return self._complete_on(llm, text, phase)
+        if self._escalating(tier, phase, output):
+            return self._complete_on(llm, text, phase)
+        return output
+
+    async def _acomplete(self, llm, text, phase="output", fitted=False):
+        """Async counterpart of ``_complete``."""
+        text = self._fit_to_budget(text, fitted)
+        tier, routed = self._route(llm, phase)
+        try:
+            output = await self._acomplete_on(routed, text, phase, strict=self._escalates(tier))
+        except Exception as e:
+            if not self._escalating(tier, phase, error=e):
+                raise
+            return await self._acomplete_on(llm, text, phase)
+        if self._escalating(tier, phase, output):
+            return await self._acomplete_on(llm, text, phase)
+        return output
+
+    def _stream(self, llm, text, phase="output", fitted=False):
+        """Yield the completion of ``text`` chunk by chunk as it arrives, routed like ``_complete``.
+
+        Whether a lighter tier's answer is kept is only known once it is complete, as it may stop
+        at the tier's token limit, so it is yielded in one piece or replaced by the heavy model's
+        streamed answer; the caller never sees two answers.
+        """
+        text = self._fit_to_budget(text, fitted)
+        tier, routed = self._route(llm, phase)
+        if not self._escalates(tier):
+            yield from self._stream_on(routed, text, phase)
+            return
+        try:
+            output = self._complete_on(routed, text, phase, strict=True)
+        except Exception as e:
+            if not self._escalating(tier, phase, error=e):
+                raise
+            output = None
+        if output is None or self._escalating(tier, phase, output):
+            yield from self._stream_on(llm, text, phase)
+            return
+        yield output
+
+    async def _astream(self, llm, text, phase="output", fitted=False):
+        """Async counterpart of ``_stream``."""
+        text = self._fit_to_budget(text, fitted)
+        tier, routed = self._route(llm, phase)
+        if not self._escalates(tier):
+            async for chunk in self._astream_on(routed, text, phase):
+                yield chunk
+            return
+        try:
+            output = await self._acomplete_on(routed, text, phase, strict=True)
+        except Exception as e:
+            if not self._escalating(tier, phase, error=e):
+                raise
+            output = None
+        if output is None or self._escalating(tier, phase, output):
+            async for chunk in self._astream_on(llm, text, phase):
+                yield chunk
+            return
+        yield output
+
+    def _complete_on(self, llm, text, phase, strict=False):
+        """
+        Complete ``text`` (already fitted to the budget) with ``llm`` itself, answering from the
+        response cache when possible.
+        With ``strict``, an answer cut off at the token limit raises ``OutputTruncated``.
+        """
+        key = self._cache_key(llm, text)
+        with self._trace(llm, text, phase) as span:
+            output = self.response_cache.get(key) if key else None
+            cached = output is not None
+            usage = None
+            if not cached:
+                message = llm.invoke(text)
+                output = message.content
+                usage = getattr(message, "usage_metadata", None)
+                self._record_usage(text, output, usage)
+                if strict and self._truncated(message):
+                    # Not cached either, so the next run asks again
+                    raise OutputTruncated(output)
+                if key:
+                    self.response_cache.set(key, output, getattr(llm, "model", None))
+            self._trace_result(span, key, output, cached, usage)
+        return output
+
+    async def _acomplete_on(self, llm, text, phase, strict=False):
+        """Async counterpart of ``_complete_on`` built on ``llm.ainvoke``."""
+        key = self._cache_key(llm, text)
+        with self._trace(llm, text, phase) as span:
+            output = self.response_cache.get(key) if key else None
+            cached = output is not None
+            usage = None
+            if not cached:
+                message = await llm.ainvoke(text)
+                output = message.content
+                usage = getattr(message, "usage_metadata", None)
+                self._record_usage(text, output, usage)
+                if strict and self._truncated(message):
+                    # Not cached either, so the next run asks again
+                    raise OutputTruncated(output)
+                if key:
+                    self.response_cache.set(key, output, getattr(llm, "model", None))
+            self._trace_result(span, key, output, cached, usage)
+        return output
 
+    @staticmethod
+    def _add_usage(total, chunk):
+        # Streamed chunks report usage deltas, which add up to the call's usage
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            for field in ("input_tokens", "output_tokens"):
+                total[field] = total.get(field, 0) + (usage.get(field) or 0)
+
+    def _stream_on(self, llm, text, phase):
+        """Yield the completion of ``text`` by ``llm`` itself chunk by chunk as it arrives.
+
+        A cached response is yielded as a single chunk; a streamed one is
+        cached once it has been fully received.
+        """
+        key = self._cache_key(llm, text)
+        with self._trace(llm, text, phase, stream=True) as span:
+            output = self.response_cache.get(key) if key else None
+            if output is not None:
+                self._trace_result(span, key, output, True)
+                yield output
+                return
+            chunks = []
+            usage = {}
+            stream = llm.stream(text)
+            for chunk in stream if self.tracer is None else self.tracer.iterate(span, stream):
+                if not chunks and self.tracer is not None:
+                    self.tracer.first_chunk(span)
+                chunks.append(chunk.content)
+                self._add_usage(usage, chunk)
+                yield chunk.content
+            output = "".join(chunks)
+            self._record_usage(text, output, usage)
+            self._trace_result(span, key, output, False, usage)
+            if key:
+                self.response_cache.set(key, output, getattr(llm, "model", None))
+
+    async def _astream_on(self, llm, text, phase):
+        """Async counterpart of ``_stream_on`` built on ``llm.astream``."""
+        key = self._cache_key(llm, text)
+        with self._trace(llm, text, phase, stream=True) as span:
+            output = self.response_cache.get(key) if key else None
+            if output is not None:
+                self._trace_result(span, key, output, True)
+                yield output
+                return
+            chunks = []
+            usage = {}
+            stream = llm.astream(text)
+            async for chunk in stream if self.tracer is None else self.tracer.aiterate(span, stream):
+                if not chunks and self.tracer is not None:
+                    self.tracer.first_chunk(span)
+                chunks.append(chunk.content)
+                self._add_usage(usage, chunk)
+                yield chunk.content
+            output = "".join(chunks)
+            self._record_usage(text, output, usage)
+            self._trace_result(span, key, output, False, usage)
+            if key:
+                self.response_cache.set(key, output, getattr(llm, "model", None))
+
+    @classmethod
+    def prompt_enhancer(cls):
+        """Return a context-free instance that can enhance this class's basic prompt.
+
+        Enhancement only depends on the role and basic prompt, so pipelines can
+        start it before the inputs an agent's constructor needs are available.
+        """
+        agent = cls.__new__(cls)
+        BaseAgent.__init__(agent, cls.role, getattr(cls, "basic_prompt_template", None) or cls.basic_prompt)
+        return agent
+
+    def _stored_prompt_key(self):
+        # The enhancement never sees the context, so it can be reused across runs
+        if self.prompt_store is None:
+            return None
+        return self.prompt_store.make_key(self.role, self.basic_prompt, getattr(self.prompt_enhancer_llm, "model", None),
+                                          self.prompt_version, self.enhance_prompt_template)
+
+    def _store_enhanced_prompt(self, key):
+        if key is not None:
+            self.prompt_store.set(key, self.enhanced_prompt, self.role,
+                                  getattr(self.prompt_enhancer_llm, "model", None), self.prompt_version)
+
+    def _build_enhance_prompt(self):
+        """Return the prompt template and inputs used to enhance the basic prompt."""
+        from langchain_core.prompts import PromptTemplate
         prompt = PromptTemplate(
             input_variables=["role", "basic_prompt", "context"],
-            template=enhanced_prompt_template
+            template=self.enhance_prompt_template
         )
-
-        chain = LLMChain(llm=self.prompt_enhancer_llm, prompt=prompt)
-        enhanced_prompt = chain.invoke({
+        return prompt, {
             "role": self.role,
             "basic_prompt": self.basic_prompt,
             "context": self.context
-        })
-        self.enhanced_prompt = enhanced_prompt['text']
+        }
+
+    def enhance_prompt(self):
+        if  self.prompt_enhancer_llm is None:
+            raise ValueError("Prompt enhancer LLM is not set.")
+
+        key = self._stored_prompt_key()
+        self.enhanced_prompt = self.prompt_store.get(key) if key else None
+        if self.enhanced_prompt is None:
+            self.enhanced_prompt = self._run_prompt(self.prompt_enhancer_llm, *self._build_enhance_prompt(), "enhance")
+            self._store_enhanced_prompt(key)
         return self.enhanced_prompt
 
-    def get_output(self):
-        if not self.llm:
-            raise ValueError("LLM is not set.")
+    async def aenhance_prompt(self):
+        if self.prompt_enhancer_llm is None:
+            raise ValueError("Prompt enhancer LLM is not set.")
 
+        key = self._stored_prompt_key()
+        self.enhanced_prompt = self.prompt_store.get(key) if key else None
+        if self.enhanced_prompt is None:
+            self.enhanced_prompt = await self._arun_prompt(self.prompt_enhancer_llm, *self._build_enhance_prompt(),
+                                                           "enhance")
+            self._store_enhanced_prompt(key)
+        return self.enhanced_prompt
+
+    def _build_output_prompt(self):
+        """Return the prompt template and inputs for the agent's task.
+
+        Agents that need extra inputs override this rather than ``get_output``
+        so the sync and async paths stay identical.
+        """
+        from langchain_core.prompts import PromptTemplate
         # Use the enhanced prompt if available, else the basic one
         base_prompt = self.enhanced_prompt if self.enhanced_prompt else self.basic_prompt
 
@@ -67,15 +410,61 @@ class BaseAgent:
             template=final_prompt_template
         )
 
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.invoke({
+        return prompt, {
             "role": self.role,
             "context": self.context,
             "base_prompt": base_prompt
-        })['text']
+        }
+
+    def static_review(self):
+        """
+        Return a finding that makes the model call pointless (e.g. defects static checks found in
+        the input), given as the agent's output instead; "" lets the model produce it.
+        """
+        return ""
+
+    @staticmethod
+    async def _ayield(text):
+        yield text
+
+    def get_output(self):
+        review = self.static_review()
+        if review:
+            return review
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return self._run_prompt(self.llm, *self._build_output_prompt(), self.output_phase)
 
+    async def aget_output(self):
+        review = self.static_review()
+        if review:
+            return review
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return await self._arun_prompt(self.llm, *self._build_output_prompt(), self.output_phase)
+
+    def stream_output(self):
+        """Return a generator yielding the agent's output in chunks as the model produces them."""
+        review = self.static_review()
+        if review:
+            return iter([review])
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return self._stream(self.llm, self._render(*self._build_output_prompt()), self.output_phase,
+                            fitted=True)
+
+    def astream_output(self):
+        """Return an async generator yielding the agent's output in chunks."""
+        review = self.static_review()
+        if review:
+            return self._ayield(review)
+        if not self.llm:
+            raise ValueError("LLM is not set.")
+        return self._astream(self.llm, self._render(*self._build_output_prompt()), self.output_phase,
+                            fitted=True)
 
 if __name__ == "__main__":
+    from LLMClientPool import LLMClientPool
     role = "Requirements Agent"
     context = (
         "Requirements Document:\n"
@@ -94,11 +483,7 @@ if __name__ == "__main__":
     )
 
     agent = BaseAgent(role, basic_prompt, context)
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000
-    )
+    llm = LLMClientPool.shared().llm()
 
     agent.set_llm(llm)
     agent.set_prompt_enhancer_llm(llm)
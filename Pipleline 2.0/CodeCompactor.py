@@ -0,0 +1,300 @@
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+# Blocks whose content is compacted by its own rules, or (pre, textarea) left as is
+_BLOCK = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)", re.DOTALL | re.IGNORECASE)
+_HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+# A CSS string, a block delimiter, or a run of anything else
+_CSS_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[{};]|[^"\'{};]+')
+# Next string delimiter, slash (comment, regex literal or division) in JavaScript
+_JS_TOKEN = re.compile(r"['\"`/]")
+# A slash after one of these characters or keywords starts a regex literal rather than a division
+_JS_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_JS_REGEX_KEYWORDS = re.compile(r"\b(?:return|typeof|instanceof|in|of|new|delete|void|throw|case|do|else|yield|await)$")
+
+_JS_FUNCTION = re.compile(r"\bfunction\s*\*?\s*(\w+)\s*\(([^)]*)\)")
+_JS_ASSIGNED_FUNCTION = re.compile(
+    r"\b(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s+)?(?:function\s*\*?\s*\w*\s*\(([^)]*)\)|\(([^)]*)\)\s*=>|(\w+)\s*=>)"
+)
+_JS_CLASS = re.compile(r"\bclass\s+(\w+)(?:\s+extends\s+([\w.]+))?")
+_JS_LISTENER = re.compile(
+    r"([\w.$]+(?:\(\s*['\"][^'\"]*['\"]\s*\))?)\s*\.\s*addEventListener\(\s*['\"]([\w:-]+)['\"]\s*,\s*([\w.$]+)?"
+)
+
+
+def _regex_allowed(code):
+    """Whether a ``/`` following ``code`` (the JavaScript before it) starts a regex literal."""
+    code = code.rstrip()
+    return not code or code[-1] in _JS_REGEX_PRECEDERS or _JS_REGEX_KEYWORDS.search(code) is not None
+
+
+def _regex_end(js, start):
+    """Return the index after the regex literal starting at ``start`` (its flags included)."""
+    end = start + 1
+    in_class = False
+    while end < len(js) and js[end] != "\n":
+        char = js[end]
+        if char == "\\":
+            end += 2
+            continue
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            end += 1
+            while end < len(js) and (js[end].isalnum() or js[end] == "_"):
+                end += 1
+            return end
+        end += 1
+    # Not terminated on its line: not a regex literal after all, keep the slash alone
+    return start + 1
+
+
+def _js_parts(js):
+    """
+    Split ``js`` into ``("code" | "comment" | "literal", text)`` parts, where literals are strings,
+    template literals and regex literals. A slash is read as starting a regex literal where a
+    division cannot stand.
+    """
+    position = 0
+    previous = ""
+    while True:
+        match = _JS_TOKEN.search(js, position)
+        if match is None:
+            yield "code", js[position:]
+            return
+        start = match.start()
+        code = js[position:start]
+        yield "code", code
+        token = match.group()
+        following = js[start + 1:start + 2]
+        if token == "/" and following == "/":
+            end = js.find("\n", start)
+            end = len(js) if end == -1 else end
+            kind = "comment"
+        elif token == "/" and following == "*":
+            end = js.find("*/", start + 2)
+            end = len(js) if end == -1 else end + 2
+            kind = "comment"
+        elif token == "/":
+            end = _regex_end(js, start) if _regex_allowed(previous + code) else start + 1
+            # A lone slash is a division (or a regex literal not terminated on its line)
+            kind = "literal" if end > start + 1 else "code"
+        else:
+            # A quoted string ends at its closing quote or, unless it is a template literal, at the line end
+            end = start + 1
+            while end < len(js) and js[end] != token and (token == "`" or js[end] != "\n"):
+                end += 2 if js[end] == "\\" else 1
+            # The line end of an unterminated string is not part of it
+            end = min(end + 1, len(js)) if js[end:end + 1] == token else min(end, len(js))
+            kind = "literal"
+        yield kind, js[start:end]
+        if kind != "comment":
+            previous = code + js[start:end]
+        position = end
+
+
+def _strip_js_comments(js):
+    """Remove ``//`` and ``/* */`` comments from ``js``, leaving string, template and regex literals intact."""
+    return "".join(text for kind, text in _js_parts(js) if kind != "comment")
+
+
+def _compact_js(js):
+    """
+    Strip the comments, indentation and blank lines of ``js``. Literals are set aside while the
+    lines are squeezed, so multi-line template literals and continued strings keep their text.
+    """
+    literals = []
+    code = []
+    for kind, text in _js_parts(js):
+        if kind == "literal":
+            code.append(f"\0{len(literals)}\0")
+            literals.append(text)
+        elif kind == "code":
+            code.append(text)
+    return re.sub(r"\0(\d+)\0", lambda m: literals[int(m.group(1))], _squeeze_lines("".join(code)))
+
+
+def _squeeze_lines(text):
+    """Strip every line and drop the empty ones."""
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _squeeze_css(css):
+    """
+    Collapse the whitespace of ``css``: selectors and at-rule preludes keep a single space where
+    they had any (``.card :hover`` is not ``.card:hover``), declarations lose it around ``:``, ``,``
+    and ``;``, and strings are left as they are.
+    """
+    out = []
+    segment = []
+
+    def flush(delimiter):
+        # Declarations lose the spaces around their punctuation, selectors only those around commas
+        punctuation = r"\s*,\s*" if delimiter == "{" else r"\s*([:,])\s*"
+        text = "".join(token if token[0] in "\"'" else re.sub(punctuation, lambda m: m.group().strip(), token)
+                       for token in segment)
+        out.append(text.strip() + delimiter)
+        segment.clear()
+
+    for token in _CSS_TOKEN.findall(css):
+        if token in "{};":
+            flush(token)
+        else:
+            segment.append(token if token[0] in "\"'" else re.sub(r"\s+", " ", token))
+    flush("")
+    return "".join(out)
+
+
+def _fold_css(css):
+    """Put each top-level rule of ``css`` on its own line, dropping a rule that repeats the one before it."""
+    rules = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(css):
+        if char == "{":
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:index + 1].strip())
+                start = index + 1
+    # Only an identical rule right after it is redundant; one further down could undo a rule in between
+    folded = [rule for index, rule in enumerate(rules) if not index or rules[index - 1] != rule]
+    # A cut-off last rule is kept as it is
+    return "\n".join(folded + ([css[start:].strip()] if css[start:].strip() else []))
+
+
+def _compact_css(css):
+    return _fold_css(_squeeze_css(_CSS_COMMENT.sub("", css)))
+
+
+def _compact_markup(html):
+    html = _HTML_COMMENT.sub("", html)
+    return re.sub(r"[ \t]{2,}", " ", _squeeze_lines(html))
+
+
+class _OutlineParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.elements = []
+        self.handlers = []
+        self.external_scripts = []
+        self.scripts = []
+        self._in = None
+
+    @staticmethod
+    def _label(tag, attrs):
+        label = f"{tag}#{attrs['id']}" if attrs.get("id") else tag
+        if tag in ("input", "select", "button") and attrs.get("type"):
+            label += f" (type={attrs['type']})"
+        return label
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        if attrs.get("id"):
+            self.elements.append(self._label(tag, attrs))
+        for name, value in attrs.items():
+            if name.startswith("on"):
+                self.handlers.append(f'{self._label(tag, attrs)} {name}="{value.strip()}"')
+        if tag == "script":
+            if attrs.get("src"):
+                self.external_scripts.append(attrs["src"])
+            else:
+                self.scripts.append("")
+                self._in = "script"
+        elif tag == "title":
+            self._in = "title"
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "title"):
+            self._in = None
+
+    def handle_data(self, data):
+        if self._in == "script":
+            self.scripts[-1] += data
+        elif self._in == "title":
+            self.title += data.strip()
+
+
+class CodeCompactor:
+    """
+    Token-lean views of generated HTML for the prompts of agents that read it.
+
+    ``full`` is the code as generated. ``compact`` is the same page with HTML,
+    CSS and JavaScript comments removed, indentation and blank lines dropped,
+    each CSS rule on one line and a rule repeated right after itself dropped;
+    apart from that and insignificant whitespace the markup, styles and
+    scripts are unchanged. ``outline`` lists only
+    what the page is made of: its title, external scripts, elements with ids,
+    inline handlers, functions, classes and event listeners. Agents declare
+    the view they need in ``code_view``.
+    """
+
+    views = ("full", "compact", "outline")
+
+    @classmethod
+    def view(cls, code, view="compact"):
+        """Return ``view`` of ``code``; views of the same code are computed once for every agent reading it."""
+        if view not in cls.views:
+            raise ValueError(f"Unknown code view: {view}")
+        if view == "full" or not code:
+            return code
+        return _cached_view(code, view)
+
+    @staticmethod
+    def compact(code):
+        parts = []
+        position = 0
+        for match in _BLOCK.finditer(code):
+            parts.append(_compact_markup(code[position:match.start()]))
+            opening, tag, content, closing = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+            if tag == "script":
+                content = _compact_js(content)
+            elif tag == "style":
+                content = _compact_css(content)
+            parts.append(f"{opening}\n{content}\n{closing}" if content and tag in ("script", "style")
+                         else f"{opening}{content}{closing}")
+            position = match.end()
+        parts.append(_compact_markup(code[position:]))
+        return "\n".join(part for part in parts if part)
+
+    @staticmethod
+    def outline(code):
+        parser = _OutlineParser()
+        parser.feed(code)
+        parser.close()
+        script = _strip_js_comments("\n".join(parser.scripts))
+
+        functions = [f"function {name}({params.strip()})" for name, params in _JS_FUNCTION.findall(script)]
+        for name, function_params, arrow_params, single_param in _JS_ASSIGNED_FUNCTION.findall(script):
+            functions.append(f"{name}({(function_params or arrow_params or single_param).strip()})")
+        classes = [name + (f" extends {base}" if base else "") for name, base in _JS_CLASS.findall(script)]
+        listeners = [f"{target}: {event}" + (f" -> {handler}" if handler else "")
+                     for target, event, handler in _JS_LISTENER.findall(script)]
+
+        sections = [
+            ("Title", [parser.title] if parser.title else []),
+            ("External scripts", parser.external_scripts),
+            ("Elements with ids", parser.elements),
+            ("Inline handlers", parser.handlers),
+            ("Functions", functions),
+            ("Classes", classes),
+            ("Event listeners", listeners)
+        ]
+        lines = ["Outline of the code (markup text, styles and function bodies omitted):"]
+        for title, entries in sections:
+            if entries:
+                lines.append(f"{title}:")
+                lines.extend(f"- {entry}" for entry in dict.fromkeys(entries))
+        return "\n".join(lines)
+
+
+@lru_cache(maxsize=32)
+def _cached_view(code, view):
+    return CodeCompactor.compact(code) if view == "compact" else CodeCompactor.outline(code)
@@ -0,0 +1,133 @@
+import re
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+SECTION_MARKER = "<<<<<<< SECTION"
+END_MARKER = ">>>>>>> END"
+
+_BLOCK_PATTERN = re.compile(
+    r"^<{5,9} ?SEARCH(?:[ \t]+(?P<scope>[^\n]*?))?[ \t]*\n(?P<search>.*?)^={5,9}[ \t]*\n(?P<replace>.*?)"
+    r"^>{5,9} ?REPLACE[^\n]*$"
+    r"|^<{5,9} ?SECTION[ \t]+(?P<section>[^\n]*?)[ \t]*\n(?P<content>.*?)^>{5,9} ?END[^\n]*$",
+    re.MULTILINE | re.DOTALL
+)
+
+
+class PatchError(Exception):
+    """Raised when an edit cannot be located unambiguously in the code it should apply to."""
+
+
+class CodePatcher:
+    """
+    Applies search/replace edit blocks returned by a model to a previous version of the code:
+
+        <<<<<<< SEARCH
+        exact lines from the current code
+        =======
+        lines replacing them
+        >>>>>>> REPLACE
+
+    Each search text must occur exactly once. When an exact match fails, the
+    lines are matched again ignoring indentation and trailing whitespace, as
+    models often re-indent what they copy.
+    """
+
+    edit_format = (
+        f"{SEARCH_MARKER}\n"
+        "exact lines copied from the current code, enough of them to be unique\n"
+        f"{DIVIDER}\n"
+        "the lines that replace them\n"
+        f"{REPLACE_MARKER}"
+    )
+
+    section_edit_format = (
+        f"{SEARCH_MARKER} section-name\n"
+        "exact lines copied from that section, enough of them to be unique within it\n"
+        f"{DIVIDER}\n"
+        "the lines that replace them\n"
+        f"{REPLACE_MARKER}\n\n"
+        "or, to rewrite a section completely:\n\n"
+        f"{SECTION_MARKER} section-name\n"
+        "the complete new content of the section\n"
+        f"{END_MARKER}"
+    )
+
+    @staticmethod
+    def parse(text):
+        """
+        Return the edits found in ``text``, in order, as ``(scope, search, replace)``.
+        ``scope`` is the section named in the block header, or None; ``search`` is
+        None for a block that rewrites the whole section.
+        """
+        edits = []
+        for match in _BLOCK_PATTERN.finditer(text or ""):
+            if match.group("section") is not None:
+                edits.append((match.group("section").strip(), None, match.group("content")))
+            else:
+                edits.append(((match.group("scope") or "").strip() or None, match.group("search"), match.group("replace")))
+        return edits
+
+    @staticmethod
+    def _find_lines(code, search):
+        """Return the character span of ``search`` in ``code`` comparing stripped lines, or None."""
+        wanted = [line.strip() for line in search.strip("\n").split("\n")]
+        lines = code.split("\n")
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line) + 1)
+
+        matches = [
+            start for start in range(len(lines) - len(wanted) + 1)
+            if [line.strip() for line in lines[start:start + len(wanted)]] == wanted
+        ]
+        if len(matches) > 1:
+            raise PatchError(f"Search block matches {len(matches)} places:\n{search}")
+        if not matches:
+            return None
+        start = matches[0]
+        return offsets[start], offsets[start + len(wanted)] - 1
+
+    def apply_edit(self, code, search, replace):
+        if not search.strip():
+            raise PatchError("Empty search block")
+        count = code.count(search)
+        if count == 1:
+            return code.replace(search, replace, 1)
+        if count > 1:
+            raise PatchError(f"Search block matches {count} places:\n{search}")
+
+        span = self._find_lines(code, search)
+        if span is None:
+            raise PatchError(f"Search block not found:\n{search}")
+        start, end = span
+        return code[:start] + replace.rstrip("\n") + code[end:]
+
+    def apply(self, code, text, sections=None):
+        """
+        Apply every edit block in ``text`` to ``code`` and return the result.
+
+        ``sections`` maps a code string to its ``{name: (start, end)}`` section spans.
+        When given, scoped blocks only match inside (or replace) the named section;
+        spans are looked up again after every edit since earlier edits move them.
+        Raises ``PatchError`` if there are no blocks or any of them does not apply.
+        """
+        edits = self.parse(text)
+        if not edits:
+            raise PatchError("No search/replace blocks found")
+        for scope, search, replace in edits:
+            if scope is None or sections is None:
+                if search is None:
+                    raise PatchError(f"Section rewrite without a known section: {scope}")
+                code = self.apply_edit(code, search, replace)
+                continue
+            spans = sections(code)
+            if scope not in spans:
+                raise PatchError(f"Unknown section: {scope}")
+            start, end = spans[scope]
+            if search is None:
+                part = "\n" + replace.strip("\n") + "\n"
+            else:
+                part = self.apply_edit(code[start:end], search, replace)
+            code = code[:start] + part + code[end:]
+        return code
@@ -0,0 +1,214 @@
+import re
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"
+}
+# Elements whose end tag HTML lets authors leave out
+OPTIONAL_END_ELEMENTS = {
+    "p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot", "option", "optgroup", "colgroup", "rt", "rp",
+    "html", "head", "body"
+}
+
+_FENCE = re.compile(r"^\s*```", re.MULTILINE)
+# A fenced block, possibly cut off before its closing fence
+_FENCED_BLOCK = re.compile(r"```[ \t]*(?:html|HTML)?[ \t]*\n(.*?)(?:```|\Z)", re.DOTALL)
+_DOCUMENT_START = re.compile(r"<!doctype|<html\b", re.IGNORECASE)
+_ID_LOOKUP = re.compile(
+    r"getElementById\(\s*(['\"`])([\w:.-]+)\1\s*\)|querySelector(?:All)?\(\s*(['\"`])#([\w-]+)\3\s*\)"
+)
+# Ids a script gives elements it creates: el.id = "x", setAttribute("id", "x"), or id="x" in markup it writes
+_SCRIPT_ID = re.compile(
+    r"\.id\s*=\s*['\"`]([\w:.-]+)['\"`]|setAttribute\(\s*['\"]id['\"]\s*,\s*['\"`]([\w:.-]+)['\"`]"
+    r"|\bid\s*=\s*\\?['\"]([\w:.-]+)\\?['\"]"
+)
+
+
+class HtmlChecker(HTMLParser):
+    """
+    Single-pass structural check of a generated page.
+
+    Confirms the page is one well-formed HTML document: a single html, head
+    and body, balanced tags, terminated script and style blocks, unique ids
+    and nothing but whitespace or comments after ``</html>``. The same pass
+    records the character span of every addressable section (each element
+    with an id, and each inline ``style``/``script`` block as ``style``,
+    ``style-2``, ``script``, ...), which section-scoped edits are applied to.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._line_offsets = [0]
+        self._stack = []
+        self._counts = {}
+        self.sections = {}
+        self.problems = []
+        self.ids = set()
+        # Terminated inline scripts as (line, text)
+        self.scripts = []
+        self._script = None
+        self._after_html = False
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def _add_id(self, attrs):
+        element_id = dict(attrs).get("id")
+        if element_id:
+            self.ids.add(element_id)
+
+    def _section_name(self, tag, attrs):
+        element_id = dict(attrs).get("id")
+        if element_id:
+            return element_id
+        if tag == "style" or (tag == "script" and not dict(attrs).get("src")):
+            self._counts[tag] = self._counts.get(tag, 0) + 1
+            return tag if self._counts[tag] == 1 else f"{tag}-{self._counts[tag]}"
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        self._content_after_html()
+        if tag in ("html", "head", "body"):
+            self._counts[tag] = self._counts.get(tag, 0) + 1
+            if self._counts[tag] == 2:
+                self.problems.append(f"More than one <{tag}> element (line {self.getpos()[0]})")
+        self._add_id(attrs)
+        if tag in VOID_ELEMENTS:
+            return
+        if tag == "script" and not dict(attrs).get("src"):
+            self._script = (self.getpos()[0], [])
+        name = self._section_name(tag, attrs)
+        if name in self.sections:
+            self.problems.append(f"Duplicate id or section '{name}' (line {self.getpos()[0]})")
+            name = None
+        start = self._offset() + len(self.get_starttag_text())
+        self._stack.append((tag, name, start, self.getpos()[0]))
+
+    def handle_startendtag(self, tag, attrs):
+        self._content_after_html()
+        self._add_id(attrs)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if not any(open_tag == tag for open_tag, _, _, _ in self._stack):
+            self.problems.append(f"Unexpected </{tag}> (line {self.getpos()[0]})")
+            return
+        if tag == "script" and self._script is not None:
+            line, parts = self._script
+            self.scripts.append((line, "".join(parts)))
+            self._script = None
+        end = self._offset()
+        while self._stack:
+            open_tag, name, start, line = self._stack.pop()
+            if open_tag == tag:
+                if name:
+                    self.sections[name] = (start, end)
+                break
+            self._report_unclosed(open_tag, name, line)
+        if tag == "html":
+            self._after_html = True
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script[1].append(data)
+        if data.strip():
+            self._content_after_html()
+
+    def _content_after_html(self):
+        if self._after_html:
+            self.problems.append(f"Content after </html> (line {self.getpos()[0]})")
+            self._after_html = False
+
+    def _report_unclosed(self, tag, name, line):
+        if tag not in OPTIONAL_END_ELEMENTS:
+            label = f"<{tag}> ({name})" if name else f"<{tag}>"
+            self.problems.append(f"{label} opened on line {line} is never closed")
+
+    def check(self, html):
+        """Parse ``html`` and return the list of structural problems found (empty when well-formed)."""
+        for line in html.split("\n"):
+            self._line_offsets.append(self._line_offsets[-1] + len(line) + 1)
+        self.feed(html)
+        self.close()
+        # An unterminated script or style is left unparsed in the buffer
+        while self._stack:
+            tag, name, _, line = self._stack.pop()
+            self._report_unclosed(tag, name, line)
+        if self._counts.get("html", 0) == 0:
+            self.problems.append("Missing <html> element")
+        if self._counts.get("body", 0) == 0:
+            self.problems.append("Missing <body> element")
+        return self.problems
+
+    @classmethod
+    def problems_in(cls, html):
+        return cls().check(html)
+
+    @staticmethod
+    def extract(output):
+        """
+        Return the HTML document in a model's ``output`` without the Markdown fences or prose
+        around it; ``output`` is returned unchanged when it holds no document.
+        """
+        text = output
+        blocks = [block for block in _FENCED_BLOCK.findall(output) if "<" in block]
+        if blocks:
+            text = next((block for block in blocks if _DOCUMENT_START.search(block)), blocks[0])
+        start = _DOCUMENT_START.search(text)
+        if start is not None:
+            text = text[start.start():]
+            end = text.lower().rfind("</html>")
+            if end != -1:
+                text = text[:end + len("</html>")]
+        elif not blocks:
+            return output
+        return text.strip()
+
+    @classmethod
+    def lint(cls, output):
+        """
+        Return the defects of a generated page that are certain without running it: Markdown fences
+        or prose around the code, output cut off before ``</html>``, the structural problems of
+        ``check``, empty inline scripts, and ids looked up by the scripts that no element has.
+        """
+        findings = []
+        if _FENCE.search(output):
+            findings.append("The code is wrapped in Markdown fences (```); return only the HTML")
+        elif output.strip() and not output.lstrip().startswith("<"):
+            findings.append("There is text before the HTML; return only the code")
+        if "</html>" not in output.lower():
+            findings.append("The output stops before </html>, it looks truncated")
+
+        checker = cls()
+        findings.extend(checker.check(output))
+        for line, text in checker.scripts:
+            if not text.strip():
+                findings.append(f"Empty <script> block (line {line})")
+
+        script_text = "\n".join(text for _, text in checker.scripts)
+        created = {next(group for group in match.groups() if group) for match in _SCRIPT_ID.finditer(script_text)}
+        missing = []
+        for match in _ID_LOOKUP.finditer(script_text):
+            element_id = match.group(2) or match.group(4)
+            if element_id not in checker.ids and element_id not in created and element_id not in missing:
+                missing.append(element_id)
+        findings.extend(f"The script looks up id '{element_id}' but no element has it" for element_id in missing)
+        return findings
+
+    @classmethod
+    def review_of(cls, output):
+        """Return ``lint``'s findings as review text for the next code iteration, or "" if there are none."""
+        findings = cls.lint(output)
+        if not findings:
+            return ""
+        return ("Static checks found these defects in the code, fix all of them:\n"
+                + "\n".join(f"- {finding}" for finding in findings))
+
+    @classmethod
+    def sections_of(cls, html):
+        """Return the ``{name: (start, end)}`` character spans of the sections of ``html``, in document order."""
+        checker = cls()
+        checker.check(html)
+        return dict(sorted(checker.sections.items(), key=lambda item: item[1][0]))
@@ -0,0 +1,244 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from RateLimiter import RateLimiter
+from TokenBudget import estimate_tokens
+
+
+def _create_gemini_client(**config):
+    # Imported on first use so that importing the pool stays cheap
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(**config)
+
+
+class PooledLLM:
+    """
+    Lightweight handle to the pool's clients for one model configuration.
+
+    It is what agents hold as their ``llm``: every ``invoke``/``ainvoke``/
+    ``stream``/``astream`` call checks a client out of the pool for its
+    duration, so handles created per session or per pipeline share the same
+    clients and their keep-alive connections. When the pool has a rate
+    limiter, calls go through it and are retried on throttling.
+    """
+
+    def __init__(self, pool, config):
+        self.pool = pool
+        self.config = dict(config)
+
+    def __getattr__(self, name):
+        # model, temperature, max_tokens, ... as configured
+        config = self.__dict__.get("config", {})
+        if name in config:
+            return config[name]
+        raise AttributeError(name)
+
+    def invoke(self, text, **kwargs):
+        def call():
+            with self.pool.checkout(self.config) as client:
+                return client.invoke(text, **kwargs)
+
+        limiter = self.pool.rate_limiter
+        if limiter is None:
+            return call()
+        return limiter.call(self.model, estimate_tokens(text), call)
+
+    async def ainvoke(self, text, **kwargs):
+        async def call():
+            async with self.pool.acheckout(self.config) as client:
+                return await client.ainvoke(text, **kwargs)
+
+        limiter = self.pool.rate_limiter
+        if limiter is None:
+            return await call()
+        return await limiter.acall(self.model, estimate_tokens(text), call)
+
+    def stream(self, text, **kwargs):
+        def chunks():
+            with self.pool.checkout(self.config) as client:
+                yield from client.stream(text, **kwargs)
+
+        limiter = self.pool.rate_limiter
+        if limiter is None:
+            yield from chunks()
+        else:
+            yield from limiter.stream(self.model, estimate_tokens(text), chunks)
+
+    async def astream(self, text, **kwargs):
+        async def chunks():
+            async with self.pool.acheckout(self.config) as client:
+                async for chunk in client.astream(text, **kwargs):
+                    yield chunk
+
+        limiter = self.pool.rate_limiter
+        source = chunks() if limiter is None else limiter.astream(self.model, estimate_tokens(text), chunks)
+        async for chunk in source:
+            yield chunk
+
+    def __repr__(self):
+        return f"PooledLLM({self.config})"
+
+
+class LLMClientPool:
+    """
+    Process-wide pool of LLM clients keyed by model configuration.
+
+    Building a chat model client is expensive and each one keeps its own
+    connections, so clients are created once per configuration and reused by
+    every session, pipeline and agent in the process. At most
+    ``max_clients_per_config`` clients exist for a configuration: a checkout
+    takes an idle client, creates one while under the limit, and otherwise
+    shares the least busy client (chat model clients are safe to call
+    concurrently). Configurations unused for longest are dropped beyond
+    ``max_configs``. Calls made through its handles share ``rate_limiter``
+    (None for no limits).
+    """
+
+    default_config = {
+        "model": "gemini-2.5-pro-exp-03-25",
+        "temperature": 0.1,
+        "max_tokens": 100000
+    }
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_clients_per_config=4, max_configs=8, factory=_create_gemini_client, rate_limiter=None):
+        self.max_clients_per_config = max_clients_per_config
+        self.max_configs = max_configs
+        self.factory = factory
+        self.rate_limiter = rate_limiter
+        # config key -> list of [client (None while it is built), checkouts in progress, built event]
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.checkouts = 0
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide pool, rate limited as configured by the environment."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(rate_limiter=RateLimiter.from_env())
+            return cls._shared
+
+    @classmethod
+    def set_shared(cls, pool):
+        """Replace the process-wide pool, e.g. with one creating fake clients for offline benchmarks."""
+        with cls._shared_lock:
+            cls._shared = pool
+
+    @staticmethod
+    def make_key(config):
+        return tuple(sorted((name, repr(value)) for name, value in config.items()))
+
+    def llm(self, **overrides):
+        """Return a handle for the default configuration updated with ``overrides``."""
+        return PooledLLM(self, {**self.default_config, **overrides})
+
+    def _reserve(self, config):
+        """
+        Pick the client a checkout of ``config`` uses and count the checkout on it. Returns the
+        pool key, the entry and whether the caller has to build its client (outside the lock).
+        """
+        key = self.make_key(config)
+        with self._lock:
+            self.checkouts += 1
+            entries = self._clients.setdefault(key, [])
+            self._clients.move_to_end(key)
+            entry = min(entries, key=lambda e: e[1], default=None)
+            build = entry is None or (entry[1] > 0 and len(entries) < self.max_clients_per_config)
+            if build:
+                # Reserved before it is built, so concurrent checkouts wait for it instead of adding more
+                entry = [None, 0, threading.Event()]
+                entries.append(entry)
+            entry[1] += 1
+            self._evict()
+            return key, entry, build
+
+    def _build(self, key, entry, config):
+        try:
+            client = self.factory(**config)
+        except BaseException:
+            with self._lock:
+                entries = self._clients.get(key, [])
+                if entry in entries:
+                    entries.remove(entry)
+            entry[2].set()
+            raise
+        with self._lock:
+            self.created += 1
+        entry[0] = client
+        entry[2].set()
+
+    def _acquire(self, config):
+        while True:
+            key, entry, build = self._reserve(config)
+            try:
+                if build:
+                    self._build(key, entry, config)
+                else:
+                    entry[2].wait()
+            except BaseException:
+                self._release(entry)
+                raise
+            if entry[0] is not None:
+                return entry
+            # Its client failed to build and the builder raised; try again with another
+            self._release(entry)
+
+    async def _aacquire(self, config):
+        """Async counterpart of ``_acquire``; clients are built and waited for off the event loop."""
+        while True:
+            key, entry, build = self._reserve(config)
+            try:
+                if build:
+                    await asyncio.to_thread(self._build, key, entry, config)
+                elif not entry[2].is_set():
+                    await asyncio.to_thread(entry[2].wait)
+            except BaseException:
+                self._release(entry)
+                raise
+            if entry[0] is not None:
+                return entry
+            self._release(entry)
+
+    def _release(self, entry):
+        with self._lock:
+            entry[1] -= 1
+
+    def _evict(self):
+        while len(self._clients) > self.max_configs:
+            key, entries = next(iter(self._clients.items()))
+            if any(entry[1] for entry in entries):
+                break
+            del self._clients[key]
+
+    @contextmanager
+    def checkout(self, config):
+        """Check a client for ``config`` out of the pool for the duration of the ``with`` block."""
+        entry = self._acquire(config)
+        try:
+            yield entry[0]
+        finally:
+            self._release(entry)
+
+    @asynccontextmanager
+    async def acheckout(self, config):
+        entry = await self._aacquire(config)
+        try:
+            yield entry[0]
+        finally:
+            self._release(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "configs": len(self._clients),
+                "clients": sum(len(entries) for entries in self._clients.values()),
+                "in_use": sum(entry[1] for entries in self._clients.values() for entry in entries),
+                "created": self.created,
+                "checkouts": self.checkouts
+            }
@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import Counter
+
+
+class ModelRouter:
+    """
+    Routes each agent's calls to a model tier by agent and phase.
+
+    A tier is a set of overrides of the client's configuration (model, token
+    limit, temperature); the ``heavy`` tier is the client as configured. Routes
+    map ``"<agent class>.<phase>"`` to a tier, where either part may be ``*``
+    and the most specific route wins, so short tasks like prompt enhancement,
+    review edits and pass/fail verification go to a faster model while code
+    and website generation stay on the heavy one. With ``escalate`` on, a call
+    on a lighter tier that fails, returns less than its tier's ``min_chars`` or
+    stops at the tier's token limit is repeated on the heavy model.
+    """
+
+    default_tiers = {
+        "heavy": {},
+        "fast": {"model": "gemini-2.0-flash", "temperature": 0.1, "max_tokens": 8192}
+    }
+    default_routes = {
+        "*.enhance": "fast",
+        "RequirementsAgent.map": "fast",
+        "HumanReviewAgentForRequirement.output": "fast",
+        "VerifierAgent.output": "fast"
+    }
+
+    def __init__(self, tiers=None, routes=None, escalate=True, min_chars=1):
+        """
+        Args:
+            tiers (dict): Configuration overrides per tier name, which may include ``min_chars``
+            routes (dict): Tier name per ``"<agent class>.<phase>"`` pattern; unrouted calls use ``heavy``
+            escalate (bool): Repeat failed, too short or cut off calls of lighter tiers on the heavy model
+            min_chars (int): Shortest output (stripped) accepted from a lighter tier without escalating
+        """
+        self.tiers = {"heavy": {}, **(self.default_tiers if tiers is None else tiers)}
+        self.routes = dict(self.default_routes if routes is None else routes)
+        unknown = set(self.routes.values()) - set(self.tiers)
+        if unknown:
+            raise ValueError(f"Routes to undefined tiers: {', '.join(sorted(unknown))}")
+        self.escalate = escalate
+        self.min_chars = min_chars
+        self._lock = threading.Lock()
+        self._calls = Counter()
+        self._escalations = Counter()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the router configured by the environment, or None if ``MODEL_ROUTING=0`` turns it off:
+
+        MODEL_TIERS="fast=gemini-2.0-flash:8192:0.1"  (model:max_tokens:temperature per tier)
+        MODEL_ROUTES="*.enhance=fast,VerifierAgent.output=fast"  (replaces the default routes)
+        MODEL_ESCALATION=1
+        """
+        if os.getenv("MODEL_ROUTING", "1").lower() in ("0", "false", "off", "no"):
+            return None
+
+        tiers = {name: dict(tier) for name, tier in cls.default_tiers.items()}
+        for entry in os.getenv("MODEL_TIERS", "").split(","):
+            if "=" in entry:
+                name, values = entry.split("=", 1)
+                model, max_tokens, temperature = (values.split(":") + ["", ""])[:3]
+                tier = {"model": model.strip()}
+                if max_tokens.strip():
+                    tier["max_tokens"] = int(max_tokens)
+                if temperature.strip():
+                    tier["temperature"] = float(temperature)
+                tiers[name.strip()] = tier
+
+        routes = None
+        if os.getenv("MODEL_ROUTES"):
+            routes = {}
+            for entry in os.getenv("MODEL_ROUTES").split(","):
+                if "=" in entry:
+                    pattern, tier = entry.split("=", 1)
+                    routes[pattern.strip()] = tier.strip()
+        escalate = os.getenv("MODEL_ESCALATION", "1").lower() not in ("0", "false", "off", "no")
+        return cls(tiers, routes, escalate=escalate)
+
+    def settings(self):
+        """Return the tiers, routes and escalation setting, which decide the model answering each call."""
+        return {"tiers": self.tiers, "routes": self.routes, "escalate": self.escalate}
+
+    def tier_of(self, agent, phase):
+        """Return the tier name for ``phase`` of the agent class named ``agent``."""
+        for pattern in (f"{agent}.{phase}", f"{agent}.*", f"*.{phase}", "*.*"):
+            if pattern in self.routes:
+                return self.routes[pattern]
+        return "heavy"
+
+    def route(self, agent, phase, llm):
+        """
+        Return the tier for ``phase`` of ``agent`` and the client to call: ``llm`` reconfigured for
+        the tier, or ``llm`` itself on the heavy tier or if it is not a pooled handle it can reconfigure.
+        """
+        tier = self.tier_of(agent, phase)
+        overrides = {name: value for name, value in self.tiers[tier].items() if name != "min_chars"}
+        if not hasattr(llm, "pool"):
+            tier, overrides = "heavy", {}
+        with self._lock:
+            self._calls[tier] += 1
+        if not overrides:
+            return tier, llm
+        return tier, type(llm)(llm.pool, {**llm.config, **overrides})
+
+    def acceptable(self, tier, output):
+        """Whether ``output`` of ``tier`` is kept rather than escalated to the heavy model."""
+        return len(output.strip()) >= self.tiers[tier].get("min_chars", self.min_chars)
+
+    def record_escalation(self, agent, phase):
+        with self._lock:
+            self._escalations[f"{agent}.{phase}"] += 1
+
+    def stats(self):
+        """Return the calls per tier and the escalations per agent and phase."""
+        with self._lock:
+            return {"calls": dict(self._calls), "escalations": dict(self._escalations)}
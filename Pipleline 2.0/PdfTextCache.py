@@ -0,0 +1,74 @@
+import hashlib
+import mmap
+import os
+
+from PdfTextExtractor import PdfTextExtractor
+
+
+class PdfTextCache:
+    """
+    On-disk cache of extracted PDF text keyed by the SHA-256 of the PDF bytes.
+
+    A cached document is read back through a memory-mapped file and never
+    touches PyPDF2, so re-processing or re-uploading the same PDF is cheap.
+    The directory can be shared by the CLI, the Streamlit UI and batch runs.
+    """
+
+    def __init__(self, directory=".cache/pdf_text", extractor=None):
+        self.directory = directory
+        self.extractor = extractor or PdfTextExtractor()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache configured by the environment, or None if it is disabled.
+
+        ``PDF_TEXT_CACHE=0`` turns the cache off and ``PDF_TEXT_CACHE_DIR`` moves it.
+        """
+        if os.getenv("PDF_TEXT_CACHE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        return cls(os.getenv("PDF_TEXT_CACHE_DIR", ".cache/pdf_text"))
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def file_digest(file_path):
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.txt")
+
+    def get(self, digest):
+        """Return the cached text for ``digest``, or None if it was never extracted."""
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return mapped[:].decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest, text):
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        path = self._path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def get_text(self, file_path, digest=None):
+        """Return the text of the PDF at ``file_path``, extracting it only on a cache miss."""
+        digest = digest or self.file_digest(file_path)
+        text = self.get(digest)
+        if text is None:
+            text = self.extractor.extract_text(file_path)
+            self.put(digest, text)
+        return text
@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _extract_page_range(file_path, start, stop):
+    """Extract pages ``start`` to ``stop`` in a worker process."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file_path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+class PdfTextExtractor:
+    """
+    Extracts the text of a PDF, splitting page ranges across a process pool for
+    large documents. Small documents are parsed in-process, where starting
+    workers would cost more than it saves.
+    """
+
+    def __init__(self, workers=None, min_pages_per_worker=8):
+        """
+        Args:
+            workers (int): Maximum number of worker processes (defaults to the CPU count)
+            min_pages_per_worker (int): Pages each worker should get before the pool is worth using
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_pages_per_worker = min_pages_per_worker
+
+    def _page_ranges(self, page_count):
+        workers = min(self.workers, page_count // self.min_pages_per_worker)
+        if workers <= 1:
+            return [(0, page_count)]
+        size, extra = divmod(page_count, workers)
+        ranges, start = [], 0
+        for worker in range(workers):
+            stop = start + size + (1 if worker < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    def iter_pages(self, file_path):
+        """
+        Yield the text of each page in order as soon as it is available, so callers
+        can process pages as they arrive or stop early. Pending work is cancelled
+        when the generator is closed.
+        """
+        # PyPDF2 is only imported once a PDF actually has to be parsed
+        import PyPDF2
+        reader = PyPDF2.PdfReader(file_path)
+        ranges = self._page_ranges(len(reader.pages))
+        if len(ranges) == 1:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+        pool = ProcessPoolExecutor(max_workers=len(ranges))
+        try:
+            futures = [pool.submit(_extract_page_range, file_path, start, stop) for start, stop in ranges]
+            for future in futures:
+                yield from future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract_pages(self, file_path):
+        """Return the text of every page."""
+        return list(self.iter_pages(file_path))
+
+    def extract_text(self, file_path):
+        """Return the whole document as one string, pages separated by newlines."""
+        return "\n".join(self.iter_pages(file_path)).strip()
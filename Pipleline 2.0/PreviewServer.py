@@ -0,0 +1,181 @@
+import atexit
+import gzip
+import hashlib
+import mimetypes
+import threading
+import uuid
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Smaller bodies are not worth the compression overhead
+GZIP_MIN_BYTES = 1024
+
+
+class _Artifact:
+
+    def __init__(self, content, content_type):
+        self.body = content.encode("utf-8") if isinstance(content, str) else content
+        self.content_type = content_type
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzipped = gzip.compress(self.body, compresslevel=6) if len(self.body) >= GZIP_MIN_BYTES else None
+        # The compressed body is another representation, so it gets a strong ETag of its own
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Previews are reloaded constantly; keep the console quiet
+        pass
+
+    def _send(self, head_only):
+        artifact = self.server.preview.get(self.path.split("?", 1)[0])
+        if artifact is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        use_gzip = artifact.gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        body, etag = (artifact.gzipped, artifact.gzip_etag) if use_gzip else (artifact.body, artifact.etag)
+
+        # Previews change between iterations, so browsers always revalidate and get a 304 if nothing changed.
+        # If-None-Match compares weakly, so a tag a proxy marked weak (W/"...") still matches
+        if etag in [tag.strip().removeprefix("W/") for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", artifact.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(head_only=False)
+
+    def do_HEAD(self):
+        self._send(head_only=True)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PreviewSession:
+    """
+    A session's namespace on the preview server. Its artifacts are removed
+    when it is closed or garbage collected along with the session.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.prefix = uuid.uuid4().hex[:12]
+        self._finalizer = weakref.finalize(self, server.remove, self.prefix)
+
+    def publish(self, name, content, content_type=None):
+        """Serve ``content`` as ``name`` in this session and return its URL."""
+        return self.server.publish(f"{self.prefix}/{name}", content, content_type)
+
+    def url(self, name):
+        return self.server.url(f"{self.prefix}/{name}")
+
+    def close(self):
+        self._finalizer()
+
+
+class PreviewServer:
+    """
+    Serves generated pages straight from memory on a threaded HTTP server.
+
+    Every request is handled on its own thread, so slow clients and many open
+    tabs do not block each other. Artifacts are kept encoded, gzip-compressed
+    and hashed when published, so a request only copies bytes: clients that
+    accept gzip get the compressed body, and reloads of an unchanged page are
+    answered with ``304 Not Modified`` through its ETag.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, port_attempts=10):
+        """
+        Args:
+            host (str): Interface to listen on
+            port (int): Preferred port; the next ones are tried if it is taken, then any free port
+            port_attempts (int): Number of consecutive ports tried before falling back to any free port
+        """
+        self.host = host
+        self.port = port
+        self.port_attempts = port_attempts
+        self.artifacts = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        """Start serving in a background thread if not already running and return the port in use."""
+        with self._lock:
+            if self._httpd is not None:
+                return self.port
+            for port in [self.port + offset for offset in range(self.port_attempts)] + [0]:
+                try:
+                    self._httpd = _Server((self.host, port), _Handler)
+                    break
+                except OSError:
+                    continue
+            else:
+                raise OSError(f"No free port for the preview server from {self.port}")
+            self._httpd.preview = self
+            self.port = self._httpd.server_address[1]
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="preview-server", daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+        return self.port
+
+    def shutdown(self):
+        """Stop serving and release the port."""
+        with self._lock:
+            httpd, self._httpd = self._httpd, None
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def publish(self, path, content, content_type=None):
+        """Serve ``content`` at ``path`` (replacing what was there) and return its URL."""
+        path = "/" + path.lstrip("/")
+        content_type = content_type or (mimetypes.guess_type(path)[0] or "text/html") + "; charset=utf-8"
+        artifact = _Artifact(content, content_type)
+        with self._lock:
+            self.artifacts[path] = artifact
+        self.start()
+        return self.url(path)
+
+    def get(self, path):
+        with self._lock:
+            return self.artifacts.get(path)
+
+    def remove(self, prefix):
+        """Stop serving every artifact under ``prefix``."""
+        prefix = "/" + prefix.strip("/") + "/"
+        with self._lock:
+            for path in [path for path in self.artifacts if path.startswith(prefix)]:
+                del self.artifacts[path]
+
+    def session(self):
+        """Return a new namespace for one user session's previews."""
+        return PreviewSession(self)
+
+    def url(self, path):
+        host = "localhost" if self.host in ("127.0.0.1", "0.0.0.0", "") else self.host
+        return f"http://{host}:{self.port}/{path.lstrip('/')}"
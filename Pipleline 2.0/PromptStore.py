@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class PromptStore:
+    """Persistent store of enhanced prompts.
+
+    ``BaseAgent.enhance_prompt()`` never sees the agent's context, so its result
+    only depends on the role, the basic prompt, the enhancer template and the
+    enhancer model. Each combination is enhanced once and then reused by every
+    run, process and Streamlit session sharing the store. Bumping an agent's
+    ``prompt_version`` (or calling ``invalidate``) forces a fresh enhancement.
+    """
+
+    def __init__(self, path=".cache/enhanced_prompts.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS enhanced_prompts ("
+            "key TEXT PRIMARY KEY, role TEXT NOT NULL, model TEXT, version INTEGER NOT NULL, "
+            "prompt TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the store configured by the environment, or None if it is disabled.
+
+        ``ENHANCED_PROMPT_STORE=0`` turns the store off and
+        ``ENHANCED_PROMPT_STORE_PATH`` moves it.
+        """
+        if os.getenv("ENHANCED_PROMPT_STORE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        return cls(os.getenv("ENHANCED_PROMPT_STORE_PATH", ".cache/enhanced_prompts.sqlite3"))
+
+    @staticmethod
+    def make_key(role, basic_prompt, model=None, version=1, template=""):
+        payload = json.dumps({
+            "role": role,
+            "basic_prompt": basic_prompt,
+            "model": model,
+            "version": version,
+            "template": template
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT prompt FROM enhanced_prompts WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, prompt, role, model=None, version=1):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO enhanced_prompts (key, role, model, version, prompt, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, role, model, version, prompt, time.time())
+            )
+            self._conn.commit()
+
+    def invalidate(self, role=None, model=None, below_version=None):
+        """Drop stored prompts, optionally only those of one role/model or older than a version.
+
+        Returns the number of prompts removed.
+        """
+        clauses, params = [], []
+        if role is not None:
+            clauses.append("role = ?")
+            params.append(role)
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        if below_version is not None:
+            clauses.append("version < ?")
+            params.append(below_version)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM enhanced_prompts" + where, params).rowcount
+            self._conn.commit()
+        return removed
+
+    def entries(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT role, model, version, created FROM enhanced_prompts ORDER BY role, created"
+            ).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate stored enhanced prompts.")
+    parser.add_argument("--path", default=os.getenv("ENHANCED_PROMPT_STORE_PATH", ".cache/enhanced_prompts.sqlite3"))
+    parser.add_argument("--invalidate", action="store_true", help="remove the matching prompts")
+    parser.add_argument("--role", help="only match prompts of this agent role")
+    parser.add_argument("--model", help="only match prompts produced by this enhancer model")
+    args = parser.parse_args()
+
+    store = PromptStore(args.path)
+    if args.invalidate:
+        print(f"Removed {store.invalidate(role=args.role, model=args.model)} enhanced prompt(s).")
+    else:
+        for role, model, version, created in store.entries():
+            if (args.role is None or role == args.role) and (args.model is None or model == args.model):
+                print(f"{role:35} {model or '-':30} v{version} {time.ctime(created)}")
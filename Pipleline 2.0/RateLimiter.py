@@ -0,0 +1,440 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+from Tracer import record_retry
+
+# Error class names and HTTP codes that mean "slow down" rather than "this request is wrong"
+_THROTTLE_NAMES = ("ResourceExhausted", "TooManyRequests", "RateLimitError")
+_TRANSIENT_NAMES = ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+                    "ConnectionError", "TimeoutError", "ReadTimeout", "RemoteDisconnected")
+_THROTTLE_CODES = (429,)
+_TRANSIENT_CODES = (500, 502, 503, 504)
+_THROTTLE_STATUSES = ("RESOURCE_EXHAUSTED",)
+# Provider errors that wrap the service's response, so only their message tells a 429 apart
+_PROVIDER_NAMES = ("GoogleAPIError", "ChatGoogleGenerativeAIError", "APIError")
+_THROTTLE_MESSAGE = re.compile(r"\b429\b|resource[_ ]exhausted|quota|rate limit", re.IGNORECASE)
+# "retry in 37.5s" in messages, or the gRPC RetryInfo detail "retry_delay {\n seconds: 37\n}"
+_RETRY_HINT = re.compile(r"retry(?:_delay)?[^0-9]{0,20}(\d+(?:\.\d+)?)\s*s|seconds:\s*(\d+)", re.IGNORECASE)
+
+
+def _error_code(error):
+    for attribute in ("code", "status_code", "status"):
+        value = getattr(error, attribute, None)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _error_status(error):
+    # A status name such as "RESOURCE_EXHAUSTED", given as a string or as a gRPC status code
+    for attribute in ("status", "code"):
+        value = getattr(error, attribute, None)
+        name = getattr(value, "name", value)
+        if isinstance(name, str):
+            return name.upper()
+    return None
+
+
+def is_throttled(error):
+    """
+    Return whether ``error`` is the service rejecting a request for exceeding its quota: by its
+    class, status code or status name, or by its message for provider errors that only carry it there.
+    """
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names.intersection(_THROTTLE_NAMES):
+        return True
+    if _error_code(error) in _THROTTLE_CODES or _error_status(error) in _THROTTLE_STATUSES:
+        return True
+    # Client libraries re-raise the service's error as their own, chained to it
+    if error.__cause__ is not None and is_throttled(error.__cause__):
+        return True
+    return bool(names.intersection(_PROVIDER_NAMES)) and _THROTTLE_MESSAGE.search(str(error)) is not None
+
+
+def is_transient(error):
+    """Return whether ``error`` is worth retrying: throttling, a server-side failure or a dropped connection."""
+    if is_throttled(error):
+        return True
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return bool(names.intersection(_TRANSIENT_NAMES)) or _error_code(error) in _TRANSIENT_CODES
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at ``per_minute`` units per minute, holding at most a minute's worth.
+
+    ``reserve`` always takes what it asks for and returns how long the caller
+    has to wait before using it, so the balance can go negative: callers then
+    queue up in the order they reserved instead of polling for capacity.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take ``amount`` units (at most the capacity) and return the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+            return max(0.0, -self.available / self.rate)
+
+    def refund(self, amount):
+        """Give back ``amount`` units reserved for a call that failed without being processed."""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + min(amount, self.capacity))
+
+    def charge(self, amount):
+        """Take ``amount`` more units for a call that already ran, e.g. tokens beyond its estimate."""
+        with self._lock:
+            self._refill()
+            self.available -= amount
+
+    def drain(self):
+        """Empty the bucket after the service reported its quota as exhausted."""
+        with self._lock:
+            self._refill()
+            self.available = min(self.available, 0.0)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease.
+
+    Every successful call raises the limit by ``1 / limit`` (about one slot per
+    round of calls); a throttled call halves it, at most once per ``cooldown``
+    seconds so that one burst of rejections only counts once.
+    """
+
+    def __init__(self, max_concurrency, min_concurrency=1, cooldown=1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.cooldown = cooldown
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        # (loop, future) of each coroutine waiting for a slot
+        self._waiters = []
+
+    def _free(self):
+        return self.in_flight < max(int(self.limit), self.min_concurrency)
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(self._free)
+            self.in_flight += 1
+
+    async def aacquire(self):
+        # Slots are shared with calls made from worker threads, so a release wakes the threads waiting
+        # on the condition and, from whatever thread it runs in, the coroutines waiting on a future
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._free():
+                    self.in_flight += 1
+                    return
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await future
+            finally:
+                with self._condition:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def release(self, outcome):
+        """Free a slot; ``outcome`` is "ok", "throttled" or "error" (which leaves the limit unchanged)."""
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            elif outcome == "throttled":
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, future)
+            except RuntimeError:
+                # Its loop is closed, so nothing waits on the future any more
+                pass
+
+
+class _ModelLimiter:
+
+    def __init__(self, rpm, tpm, max_concurrency):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter shared by every LLM call of the process.
+
+    Each model gets its own requests-per-minute and tokens-per-minute token
+    buckets and an adaptive concurrency limit. A call first reserves one
+    request and its estimated prompt tokens, waits until the buckets allow it,
+    and takes a concurrency slot. Throttling errors halve the concurrency
+    limit and drain the buckets; throttling and other transient errors are
+    retried with jittered exponential backoff (or after the delay the service
+    asks for). A streamed call is only retried if it failed before its first
+    chunk, as chunks already handed out cannot be taken back.
+    """
+
+    # Free-tier quotas; models without an entry are only bounded by the defaults
+    default_limits = {
+        "gemini-2.5-pro-exp-03-25": {"rpm": 5, "tpm": 250000}
+    }
+
+    def __init__(self, limits=None, default_rpm=None, default_tpm=None, max_concurrency=4,
+                 max_retries=5, base_delay=2.0, max_delay=60.0):
+        """
+        Args:
+            limits (dict): ``{model: {"rpm": ..., "tpm": ...}}`` overriding ``default_limits``
+            default_rpm (int): Requests per minute for models without limits, None for no limit
+            default_tpm (int): Tokens per minute for models without limits, None for no limit
+            max_concurrency (int): Upper bound of the adaptive concurrency limit per model
+            max_retries (int): Retries of a transient failure before it is raised
+            base_delay (float): Backoff of the first retry in seconds, doubled for every further one
+            max_delay (float): Upper bound of a single backoff in seconds
+        """
+        self.limits = {**self.default_limits, **(limits or {})}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the limiter configured by the environment, or None if ``LLM_RATE_LIMIT=0`` turns it off:
+
+        LLM_RATE_LIMITS="gemini-2.5-pro-exp-03-25=5:250000,gemini-2.0-flash=15:1000000"  (rpm:tpm per model)
+        LLM_RATE_LIMIT_RPM=60, LLM_RATE_LIMIT_TPM=1000000  (models without limits)
+        LLM_MAX_CONCURRENCY=4
+        LLM_MAX_RETRIES=5
+        """
+        if os.getenv("LLM_RATE_LIMIT", "1").lower() in ("0", "false", "off", "no"):
+            return None
+
+        def number(name, default=None):
+            value = os.getenv(name)
+            return int(value) if value else default
+
+        limits = {}
+        for entry in os.getenv("LLM_RATE_LIMITS", "").split(","):
+            if "=" in entry:
+                model, values = entry.rsplit("=", 1)
+                rpm, _, tpm = values.partition(":")
+                limits[model.strip()] = {"rpm": int(rpm) if rpm.strip() else None,
+                                         "tpm": int(tpm) if tpm.strip() else None}
+        return cls(
+            limits=limits,
+            default_rpm=number("LLM_RATE_LIMIT_RPM"),
+            default_tpm=number("LLM_RATE_LIMIT_TPM"),
+            max_concurrency=number("LLM_MAX_CONCURRENCY", 4),
+            max_retries=number("LLM_MAX_RETRIES", 5)
+        )
+
+    def _limiter(self, model):
+        model = (model or "").removeprefix("models/")
+        with self._lock:
+            if model not in self._models:
+                limits = self.limits.get(model, {})
+                self._models[model] = _ModelLimiter(
+                    limits.get("rpm", self.default_rpm),
+                    limits.get("tpm", self.default_tpm),
+                    self.max_concurrency
+                )
+            return self._models[model]
+
+    @staticmethod
+    def _reserve(limiter, tokens):
+        """Reserve a request and ``tokens`` and return the seconds to wait for them."""
+        wait = limiter.requests.reserve(1) if limiter.requests else 0.0
+        if limiter.tokens and tokens:
+            wait = max(wait, limiter.tokens.reserve(tokens))
+        return wait
+
+    @staticmethod
+    def _settle(limiter, reserved, used):
+        # Charge the tokens a call used beyond its prompt estimate (the completion, mostly)
+        limiter.calls += 1
+        if limiter.tokens and used > reserved:
+            limiter.tokens.charge(used - reserved)
+
+    def _on_error(self, limiter, error, attempt, tokens, started=False):
+        """Return the outcome for the concurrency limit and the backoff before retrying, or None to give up."""
+        if limiter.tokens and tokens and not started:
+            # The prompt was never processed, so its tokens are reserved again by the retry
+            limiter.tokens.refund(tokens)
+        throttled = is_throttled(error)
+        if throttled:
+            limiter.throttled += 1
+            for bucket in (limiter.requests, limiter.tokens):
+                if bucket:
+                    bucket.drain()
+        if started or attempt >= self.max_retries or not is_transient(error):
+            return ("throttled" if throttled else "error"), None
+        limiter.retries += 1
+        record_retry()
+        return ("throttled" if throttled else "error"), self.backoff(attempt, error)
+
+    def backoff(self, attempt, error=None):
+        """Seconds to wait before retry ``attempt`` (0-based): the delay the service asked for, else full jitter."""
+        match = _RETRY_HINT.search(str(error)) if error is not None else None
+        if match:
+            return min(float(match.group(1) or match.group(2)), self.max_delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _usage(result):
+        usage = getattr(result, "usage_metadata", None) or {}
+        return usage.get("total_tokens") or (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+
+    def call(self, model, tokens, fn):
+        """Run ``fn()`` as a call to ``model`` with ``tokens`` estimated prompt tokens, within the limits."""
+        limiter = self._limiter(model)
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(limiter, tokens))
+            limiter.concurrency.acquire()
+            outcome = "error"
+            try:
+                result = fn()
+                outcome = "ok"
+            except Exception as e:
+                outcome, delay = self._on_error(limiter, e, attempt, tokens)
+                if delay is None:
+                    raise
+            finally:
+                limiter.concurrency.release(outcome)
+            if outcome == "ok":
+                self._settle(limiter, tokens, self._usage(result))
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, model, tokens, fn):
+        """Async counterpart of ``call``; ``fn()`` returns the awaitable to run."""
+        limiter = self._limiter(model)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(limiter, tokens))
+            await limiter.concurrency.aacquire()
+            outcome = "error"
+            try:
+                result = await fn()
+                outcome = "ok"
+            except Exception as e:
+                outcome, delay = self._on_error(limiter, e, attempt, tokens)
+                if delay is None:
+                    raise
+            finally:
+                limiter.concurrency.release(outcome)
+            if outcome == "ok":
+                self._settle(limiter, tokens, self._usage(result))
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stream(self, model, tokens, fn):
+        """Yield the chunks of ``fn()`` within the limits, retrying only failures before the first chunk."""
+        limiter = self._limiter(model)
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(limiter, tokens))
+            limiter.concurrency.acquire()
+            outcome = "error"
+            started = False
+            used = 0
+            try:
+                for chunk in fn():
+                    started = True
+                    used += self._usage(chunk)
+                    yield chunk
+                outcome = "ok"
+            except Exception as e:
+                outcome, delay = self._on_error(limiter, e, attempt, tokens, started)
+                if delay is None:
+                    raise
+            finally:
+                limiter.concurrency.release(outcome)
+            if outcome == "ok":
+                self._settle(limiter, tokens, used)
+                return
+            time.sleep(delay)
+            attempt += 1
+
+    async def astream(self, model, tokens, fn):
+        """Async counterpart of ``stream``; ``fn()`` returns the async iterator to consume."""
+        limiter = self._limiter(model)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(limiter, tokens))
+            await limiter.concurrency.aacquire()
+            outcome = "error"
+            started = False
+            used = 0
+            try:
+                async for chunk in fn():
+                    started = True
+                    used += self._usage(chunk)
+                    yield chunk
+                outcome = "ok"
+            except Exception as e:
+                outcome, delay = self._on_error(limiter, e, attempt, tokens, started)
+                if delay is None:
+                    raise
+            finally:
+                limiter.concurrency.release(outcome)
+            if outcome == "ok":
+                self._settle(limiter, tokens, used)
+                return
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Return calls, retries, throttling errors and the current concurrency limit per model."""
+        with self._lock:
+            return {
+                model: {
+                    "calls": limiter.calls,
+                    "retries": limiter.retries,
+                    "throttled": limiter.throttled,
+                    "concurrency": round(limiter.concurrency.limit, 2)
+                }
+                for model, limiter in self._models.items()
+            }
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """Content-addressed, on-disk cache of LLM completions.
+
+    Entries are keyed by a hash of the fully rendered prompt together with the
+    client's configuration (model, temperature, token limit, ...). The store is bounded: entries older than
+    ``max_age`` seconds are dropped, and once ``max_entries`` or ``max_bytes``
+    is exceeded the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path=".cache/responses.sqlite3", max_entries=2000,
+                 max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache configured by the environment, or None if it is disabled.
+
+        ``LLM_RESPONSE_CACHE=0`` turns caching off and ``LLM_RESPONSE_CACHE_PATH``
+        moves the store.
+        """
+        if os.getenv("LLM_RESPONSE_CACHE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        return cls(os.getenv("LLM_RESPONSE_CACHE_PATH", ".cache/responses.sqlite3"))
+
+    @staticmethod
+    def make_key(prompt, config=None):
+        """Return the key of ``prompt`` completed by a client configured with ``config``.
+
+        Every setting that can change the answer (model, temperature, max_tokens, ...) is
+        part of the key; credentials are not.
+        """
+        config = {name: repr(value) for name, value in (config or {}).items() if "api_key" not in name}
+        payload = json.dumps({"config": config, "prompt": prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response, model=None):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.max_age:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters for this process along with the store's size."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+
+class RunCheckpoint:
+    """
+    Per-run record of every stage's inputs and output, stored as one JSON file
+    per stage in the run directory.
+
+    A stage is keyed by the SHA-256 of its name and inputs. Because every
+    stage's inputs include the outputs it builds on, a re-run reuses stages
+    up to the first one whose inputs changed (or that never finished) and
+    recomputes from there on.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, directory):
+        """Build the checkpoint for ``directory``, or None if ``RUN_CHECKPOINT=0`` turns checkpoints off."""
+        if os.getenv("RUN_CHECKPOINT", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        return cls(directory)
+
+    @staticmethod
+    def make_key(stage, inputs):
+        payload = json.dumps({"stage": stage, "inputs": inputs}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, stage):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", stage) + ".json")
+
+    def load(self, stage, inputs):
+        """Return the saved output of ``stage`` if it was produced from the same inputs, otherwise None."""
+        try:
+            with open(self._path(stage), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if record.get("key") != self.make_key(stage, inputs):
+            return None
+        return record["output"]
+
+    def save(self, stage, inputs, output):
+        record = {
+            "stage": stage,
+            "key": self.make_key(stage, inputs),
+            "inputs": inputs,
+            "output": output,
+            "created": time.time()
+        }
+        # Write to a temporary file first so a crash never leaves a truncated stage behind
+        path = self._path(stage)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+    def clear(self):
+        """Forget every stage of this run."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
@@ -0,0 +1,170 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageGraph:
+    """
+    Dependency graph of pipeline stages, run with every ready stage in flight at once.
+
+    A stage is a callable taking the dict of outputs produced so far and
+    returning its own output. It becomes ready once all the stages it depends
+    on have finished, so a run's wall-clock is bounded by its longest chain
+    of dependent stages (the critical path) rather than the sum of all of them.
+    ``run`` executes stages on a thread pool; ``arun`` awaits coroutine stages
+    on the event loop and runs plain functions in worker threads.
+    """
+
+    def __init__(self, max_workers=4, initializer=None):
+        """
+        Args:
+            max_workers (int): Maximum number of stages running at once
+            initializer (callable): Called at the start of every worker thread used by ``run``
+        """
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, fn, depends_on=()):
+        """Declare stage ``name`` computed by ``fn(results)`` once every stage in ``depends_on`` has finished."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is declared twice")
+        self.stages[name] = (fn, tuple(depends_on))
+        return self
+
+    def _order(self):
+        """Return the stage names in dependency order, rejecting unknown dependencies and cycles."""
+        order, visiting, done = [], set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Stage {path[-1]} depends on unknown stage {name}")
+            if name in visiting:
+                raise ValueError("Stage dependency cycle: " + " -> ".join(path + [name]))
+            visiting.add(name)
+            for dependency in self.stages[name][1]:
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def _ready(self, results, started):
+        return [
+            name for name in self._order()
+            if name not in started and all(dependency in results for dependency in self.stages[name][1])
+        ]
+
+    def _timed(self, name, results):
+        start = time.perf_counter()
+        try:
+            return self.stages[name][0](results)
+        finally:
+            self.timings[name] = (start, time.perf_counter())
+
+    def run(self, results=None):
+        """
+        Run every stage on a thread pool and return all outputs by stage name.
+        ``results`` may hold outputs already available, whose stages are then skipped.
+        If a stage fails, no further stages are started and its exception is raised
+        once the running ones have finished.
+        """
+        results = dict(results or {})
+        started = set(results)
+        self.timings = {}
+        self._start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.initializer) as pool:
+            running = {}
+            error = None
+            while True:
+                if error is None:
+                    for name in self._ready(results, started):
+                        started.add(name)
+                        running[pool.submit(self._timed, name, dict(results))] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        error = error or e
+        self._end = time.perf_counter()
+        if error is not None:
+            raise error
+        return results
+
+    async def arun(self, results=None):
+        """Async counterpart of ``run``; coroutine stages run on the event loop, others in threads."""
+        results = dict(results or {})
+        started = set(results)
+        self.timings = {}
+        self._start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def execute(name, inputs):
+            fn = self.stages[name][0]
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if inspect.iscoroutinefunction(fn):
+                        return await fn(inputs)
+                    return await asyncio.to_thread(fn, inputs)
+                finally:
+                    self.timings[name] = (start, time.perf_counter())
+
+        running = {}
+        error = None
+        while True:
+            if error is None:
+                for name in self._ready(results, started):
+                    started.add(name)
+                    running[asyncio.ensure_future(execute(name, dict(results)))] = name
+            if not running:
+                break
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = running.pop(task)
+                try:
+                    results[name] = task.result()
+                except Exception as e:
+                    error = error or e
+        self._end = time.perf_counter()
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self):
+        """Return the chain of dependent stages with the longest total duration, and that duration."""
+        chains = {}
+        for name in self._order():
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            previous = max(
+                (chains[dependency] for dependency in self.stages[name][1] if dependency in chains),
+                key=lambda chain: chain[1], default=([], 0.0)
+            )
+            chains[name] = (previous[0] + [name], previous[1] + end - start)
+        return max(chains.values(), key=lambda chain: chain[1], default=([], 0.0))
+
+    def report(self):
+        """Return per-stage timings, the critical path and the wall-clock of the last run as text."""
+        if not self.timings:
+            return "No stages were run."
+        lines = [f"{'stage':28} {'start':>8} {'duration':>9}"]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"{name:28} {start - self._start:7.2f}s {end - start:8.2f}s")
+        path, duration = self.critical_path()
+        total = sum(end - start for start, end in self.timings.values())
+        lines.append(f"critical path: {' -> '.join(path)} ({duration:.2f}s)")
+        lines.append(f"wall-clock {self._end - self._start:.2f}s for {total:.2f}s of stage time")
+        return "\n".join(lines)
@@ -0,0 +1,183 @@
+import math
+import os
+import re
+import threading
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Approximate the token count of ``text`` without calling the model's tokenizer.
+
+    Words are counted in pieces of about four characters and every punctuation
+    mark as one token, which tracks SentencePiece/BPE counts closely for prose,
+    Markdown and HTML/JavaScript.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+def compact_text(text, max_tokens):
+    """Shorten ``text`` to roughly ``max_tokens`` by cutting out its middle, keeping the start and end."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    marker = f"\n...[{tokens - max_tokens} tokens omitted to fit the token budget]...\n"
+    keep = max(int(len(text) * max_tokens / tokens) - len(marker), 0)
+    head = keep * 2 // 3
+    tail = keep - head
+    return text[:head] + marker + (text[-tail:] if tail else "")
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a prompt does not fit the remaining token budget and may not be compacted."""
+
+
+class TokenBudget:
+    """
+    Token accounting and budget governor shared by the agents of one run.
+
+    Every call is estimated locally before it is sent and recorded afterwards
+    with the usage reported by the model (or the estimate when none is
+    reported). Limits can be set per call (``prompt_limit``), per agent role
+    (``agent_limits``) and for the whole run (``run_limit``). A prompt that
+    would exceed what is left is either compacted to fit (``mode="compact"``)
+    or refused with ``TokenBudgetExceeded`` (``mode="refuse"``).
+    """
+
+    def __init__(self, run_limit=None, agent_limits=None, prompt_limit=None, mode="compact", min_prompt_tokens=1000):
+        if mode not in ("compact", "refuse"):
+            raise ValueError(f"Unknown token budget mode: {mode}")
+        self.run_limit = run_limit
+        self.agent_limits = dict(agent_limits or {})
+        self.prompt_limit = prompt_limit
+        self.mode = mode
+        self.min_prompt_tokens = min_prompt_tokens
+        self.usage = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a budget from the environment. All limits are optional:
+
+        TOKEN_BUDGET_RUN=2000000
+        TOKEN_BUDGET_PROMPT=200000
+        TOKEN_BUDGET_AGENTS="Coding Agent=600000,Documentation Agent=150000"
+        TOKEN_BUDGET_MODE=compact  (or refuse)
+        """
+        def limit(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        agent_limits = {}
+        for entry in os.getenv("TOKEN_BUDGET_AGENTS", "").split(","):
+            if "=" in entry:
+                role, value = entry.rsplit("=", 1)
+                agent_limits[role.strip()] = int(value)
+        return cls(
+            run_limit=limit("TOKEN_BUDGET_RUN"),
+            agent_limits=agent_limits,
+            prompt_limit=limit("TOKEN_BUDGET_PROMPT"),
+            mode=os.getenv("TOKEN_BUDGET_MODE", "compact")
+        )
+
+    def used(self, role=None):
+        """Tokens sent and received so far, by one agent role or by the whole run."""
+        with self._lock:
+            if role is None:
+                entries = list(self.usage.values())
+            else:
+                entries = [self.usage[role]] if role in self.usage else []
+            return sum(entry["input_tokens"] + entry["output_tokens"] for entry in entries)
+
+    def allowance(self, role):
+        """Largest prompt, in tokens, that ``role`` may send right now (None when unlimited)."""
+        limits = []
+        if self.prompt_limit is not None:
+            limits.append(self.prompt_limit)
+        if self.run_limit is not None:
+            limits.append(self.run_limit - self.used())
+        if role in self.agent_limits:
+            limits.append(self.agent_limits[role] - self.used(role))
+        return min(limits) if limits else None
+
+    def _check(self, role, estimate, allowed, refuse=False):
+        if refuse or self.mode == "refuse" or allowed < self.min_prompt_tokens:
+            raise TokenBudgetExceeded(
+                f"{role}: prompt of ~{estimate} tokens exceeds the remaining budget of {max(allowed, 0)} tokens"
+            )
+
+    def fit(self, role, text, refuse=False):
+        """
+        Return ``text`` unchanged if it fits the budget, otherwise compact or refuse it. ``refuse``
+        refuses it whatever the mode, for prompts whose inputs ``fit_inputs`` already compacted.
+        """
+        allowed = self.allowance(role)
+        if allowed is None:
+            return text
+        estimate = estimate_tokens(text)
+        if estimate <= allowed:
+            return text
+        self._check(role, estimate, allowed, refuse)
+        return compact_text(text, allowed)
+
+    def fit_inputs(self, role, prompt, inputs):
+        """
+        Return prompt inputs whose rendering fits the budget, compacting the
+        largest inputs first so the instructions around them stay intact.
+        """
+        allowed = self.allowance(role)
+        if allowed is None:
+            return inputs
+        estimate = estimate_tokens(prompt.format(**inputs))
+        if estimate <= allowed:
+            return inputs
+        self._check(role, estimate, allowed)
+
+        inputs = dict(inputs)
+        # Cuts only approximate the estimate, so passes cutting a growing margin more repeat until
+        # the prompt fits or stops shrinking
+        previous = None
+        margin = 0
+        while allowed < estimate and estimate != previous:
+            previous = estimate
+            sizes = {name: estimate_tokens(value) for name, value in inputs.items() if isinstance(value, str)}
+            for name in sorted(sizes, key=sizes.get, reverse=True):
+                excess = estimate - allowed
+                if excess <= 0:
+                    break
+                inputs[name] = compact_text(inputs[name], max(sizes[name] - excess - margin, 0))
+                estimate = estimate_tokens(prompt.format(**inputs))
+            margin = margin * 2 or 1
+        return inputs
+
+    def record(self, role, prompt, output, usage=None):
+        """
+        Record one call. ``usage`` is the model's reported usage
+        (``input_tokens``/``output_tokens``); local estimates are used when it is missing.
+        """
+        estimated_input = estimate_tokens(prompt)
+        input_tokens = (usage or {}).get("input_tokens") or estimated_input
+        output_tokens = (usage or {}).get("output_tokens") or estimate_tokens(output)
+        with self._lock:
+            entry = self.usage.setdefault(role, {
+                "calls": 0, "estimated_input_tokens": 0, "input_tokens": 0, "output_tokens": 0
+            })
+            entry["calls"] += 1
+            entry["estimated_input_tokens"] += estimated_input
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+
+    def report(self):
+        """Return per-agent usage plus a ``total`` entry."""
+        with self._lock:
+            report = {role: dict(entry) for role, entry in self.usage.items()}
+        total = {"calls": 0, "estimated_input_tokens": 0, "input_tokens": 0, "output_tokens": 0}
+        for entry in report.values():
+            for field in total:
+                total[field] += entry[field]
+        report["total"] = total
+        return report
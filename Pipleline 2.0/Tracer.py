@@ -0,0 +1,266 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from TokenBudget import estimate_tokens
+
+# Span of the LLM call in progress, so code further down the call (the rate limiter) can annotate it
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Every tracer of the process may append to the same file
+_write_lock = threading.Lock()
+
+
+def record_retry():
+    """Count a retry on the LLM call being traced in this thread or task, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span["retries"] += 1
+
+
+def percentile(values, q):
+    """Return the ``q``-th percentile (0-100) of ``values`` by the nearest-rank method, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class Tracer:
+    """
+    Appends a JSON line per LLM call (an "llm" span) and per pipeline stage
+    (a "stage" span) to a trace file shared by every run.
+
+    An LLM span records the run, agent, phase (enhance, output, patch, ...),
+    model, prompt and response sizes, latency (and time to the first chunk
+    when streamed), retries, the response cache outcome (hit, miss or off)
+    and the token usage the model reported. ``summarize`` aggregates spans
+    into call counts and latency percentiles. Once the file reaches
+    ``max_bytes`` it is renamed to ``<path>.1`` (replacing the previous one)
+    and a new file is started.
+    """
+
+    def __init__(self, path, run_id=None, max_bytes=None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, run_id=None):
+        """Build the tracer configured by the environment, or None if ``LLM_TRACE=0`` turns tracing off.
+
+        ``LLM_TRACE_PATH`` moves the trace file and ``LLM_TRACE_MAX_MB`` (default 50, 0 for no limit)
+        is the size at which it is rotated.
+        """
+        if os.getenv("LLM_TRACE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        max_mb = float(os.getenv("LLM_TRACE_MAX_MB", "50"))
+        return cls(os.getenv("LLM_TRACE_PATH", ".cache/trace.jsonl"), run_id,
+                   int(max_mb * 1024 * 1024) if max_mb > 0 else None)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with _write_lock:
+            if self.max_bytes is not None:
+                try:
+                    if os.path.getsize(self.path) >= self.max_bytes:
+                        os.replace(self.path, self.path + ".1")
+                except FileNotFoundError:
+                    pass
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    @contextmanager
+    def span(self, agent, phase, model, prompt, stream=False):
+        """
+        Trace one LLM call for the duration of the ``with`` block. The block
+        fills in ``cache``, ``response_chars`` and the reported usage on the
+        yielded span; latency and the outcome are added when it exits.
+
+        The span is the current one inside the block, unless ``stream`` is set: a
+        generator suspended inside the block would leave it current for its consumer,
+        so streamed calls make it current only while producing a chunk (``iterate``).
+        """
+        span = {
+            "kind": "llm",
+            "run": self.run_id,
+            "agent": agent,
+            "phase": phase,
+            "model": model,
+            "prompt_chars": len(prompt),
+            "prompt_tokens": estimate_tokens(prompt),
+            "response_chars": 0,
+            "retries": 0,
+            "cache": "off",
+            "start": time.time()
+        }
+        token = None if stream else _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+            span["status"] = "ok"
+        except GeneratorExit:
+            # A stream abandoned by its consumer
+            span["status"] = "cancelled"
+            raise
+        except BaseException as e:
+            span["status"] = "error"
+            span["error"] = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            span["latency"] = round(time.perf_counter() - start, 4)
+            if token is not None:
+                _current_span.reset(token)
+            self.write(span)
+
+    @staticmethod
+    def iterate(span, chunks):
+        """Yield from ``chunks`` with ``span`` as the current span while each chunk is produced."""
+        iterator = iter(chunks)
+        while True:
+            token = _current_span.set(span)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield chunk
+
+    @staticmethod
+    async def aiterate(span, chunks):
+        """Async counterpart of ``iterate``."""
+        iterator = chunks.__aiter__()
+        while True:
+            token = _current_span.set(span)
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield chunk
+
+    @staticmethod
+    def first_chunk(span):
+        """Record the time to the first streamed chunk on ``span``."""
+        if "first_chunk" not in span and "start" in span:
+            span["first_chunk"] = round(time.time() - span["start"], 4)
+
+    def record_stage(self, name, start, end):
+        """Record a pipeline stage that ran from ``start`` to ``end`` (``time.perf_counter`` values)."""
+        self.write({
+            "kind": "stage",
+            "run": self.run_id,
+            "stage": name,
+            "start": time.time() - (time.perf_counter() - start),
+            "latency": round(end - start, 4)
+        })
+
+    @staticmethod
+    def _parse(lines, kind=None, run=None):
+        spans = []
+        for line in lines:
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash
+                continue
+            if (kind is None or span.get("kind") == kind) and (run is None or span.get("run") == run):
+                spans.append(span)
+        return spans
+
+    @classmethod
+    def load(cls, path, kind=None, run=None):
+        """
+        Return the spans of the trace at ``path`` (after those of its rotated
+        ``<path>.1``), optionally only those of one kind or run.
+        """
+        spans = []
+        for name in (path + ".1", path):
+            try:
+                with open(name, "r", encoding="utf-8") as f:
+                    spans.extend(cls._parse(f, kind, run))
+            except FileNotFoundError:
+                pass
+        return spans
+
+    @staticmethod
+    def summarize(spans, by=("agent", "phase")):
+        """
+        Aggregate spans grouped by the ``by`` fields into rows with the number
+        of calls, errors, retries and cache hits, and p50/p95/max/total latency.
+        """
+        groups = {}
+        for span in spans:
+            groups.setdefault(tuple(span.get(field) for field in by), []).append(span)
+        rows = []
+        for key, group in sorted(groups.items(), key=lambda item: [str(part) for part in item[0]]):
+            latencies = [span["latency"] for span in group if "latency" in span]
+            rows.append({
+                **dict(zip(by, key)),
+                "calls": len(group),
+                "errors": sum(span.get("status") == "error" for span in group),
+                "retries": sum(span.get("retries", 0) for span in group),
+                "cache_hits": sum(span.get("cache") == "hit" for span in group),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "max": max(latencies, default=None),
+                "total": round(sum(latencies), 4)
+            })
+        return rows
+
+    def report(self):
+        """Return this run's LLM calls summarized by agent and phase, as text."""
+        lines = [f"{'agent':34} {'phase':10} {'calls':>5} {'hits':>5} {'retries':>7} {'p50':>8} {'p95':>8} {'total':>8}"]
+        for row in self.summarize(self.load(self.path, kind="llm", run=self.run_id)):
+            lines.append(f"{str(row['agent']):34} {str(row['phase']):10} {row['calls']:5} {row['cache_hits']:5} "
+                         f"{row['retries']:7} {row['p50']:7.2f}s {row['p95']:7.2f}s {row['total']:7.2f}s")
+        return "\n".join(lines)
+
+
+class TraceFollower:
+    """
+    Spans of a trace file kept in memory and brought up to date incrementally:
+    each ``spans()`` call only parses the lines appended since the previous one,
+    and starts over when the file has been rotated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._spans = []
+        self._offset = 0
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def spans(self, kind=None, run=None):
+        """Return the spans of the trace, optionally only those of one kind or run."""
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    if (stat.st_dev, stat.st_ino) != self._file_id or stat.st_size < self._offset:
+                        # A new file after a rotation: its predecessor is now <path>.1
+                        self._file_id = (stat.st_dev, stat.st_ino)
+                        self._offset = 0
+                        self._spans = []
+                        if os.path.exists(self.path + ".1"):
+                            with open(self.path + ".1", "r", encoding="utf-8") as rotated:
+                                self._spans = Tracer._parse(rotated)
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return []
+            # A line still being written is read on a later call
+            complete = data[:data.rfind(b"\n") + 1]
+            self._offset += len(complete)
+            self._spans.extend(Tracer._parse(complete.decode("utf-8", errors="replace").splitlines()))
+            return [span for span in self._spans
+                    if (kind is None or span.get("kind") == kind) and (run is None or span.get("run") == run)]
@@ -0,0 +1,172 @@
+"""
+Headless batch runner for the requirements -> implementation -> code -> documentation chain.
+
+Every job is a requirements PDF. Jobs are read from a directory (every *.pdf in it), a text
+manifest (one PDF path per line) or a JSON manifest such as:
+
+    [
+        {"pdf": "inputs/PhysicsExpVirtualLabs.pdf", "name": "physics",
+         "requirements_review": "Focus on the pendulum experiment", "code_review": ""}
+    ]
+
+Usage:
+    python batch.py inputs --out runs --concurrency 3
+    python batch.py inputs --auto-refine --max-iterations 4
+    python batch.py inputs --website --verify
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+from main import Pipeline
+
+
+def load_jobs(source):
+    """Return the list of job dicts described by a directory or manifest file."""
+    source = Path(source)
+    if source.is_dir():
+        entries = [{"pdf": str(path)} for path in sorted(source.glob("*.pdf"))]
+    elif source.suffix == ".json":
+        with open(source, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        entries = [{"pdf": entry} if isinstance(entry, str) else entry for entry in entries]
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            entries = [{"pdf": line.strip()} for line in f if line.strip() and not line.startswith("#")]
+
+    jobs = []
+    names = set()
+    for entry in entries:
+        name = entry.get("name") or Path(entry["pdf"]).stem
+        # Keep per-job output directories distinct even if two PDFs share a stem
+        unique_name, suffix = name, 2
+        while unique_name in names:
+            unique_name, suffix = f"{name}-{suffix}", suffix + 1
+        names.add(unique_name)
+        jobs.append({**entry, "name": unique_name})
+    return jobs
+
+
+async def run_job(job, out_dir, semaphore, settings=None):
+    """Run one pipeline non-interactively with the Pipeline ``settings`` and return its summary record."""
+    job_dir = os.path.join(out_dir, job["name"])
+    async with semaphore:
+        start = time.perf_counter()
+        record = {"name": job["name"], "pdf": job["pdf"], "output_dir": job_dir}
+        try:
+            pipeline = Pipeline(
+                pdf_path=job["pdf"],
+                output_dir=job_dir,
+                reviews={
+                    "requirements": job.get("requirements_review") or "",
+                    "code": job.get("code_review") or ""
+                },
+                verbose=False,
+                **(settings or {})
+            )
+            outputs = await pipeline.arun()
+            for stage, filename in (("requirements", "requirements.md"), ("implementation", "implementation.md")):
+                with open(os.path.join(job_dir, filename), "w", encoding="utf-8") as f:
+                    f.write(outputs[stage])
+            record["status"] = "ok"
+            if pipeline.tracer is not None:
+                record["trace_run"] = pipeline.tracer.run_id
+            record["output_chars"] = {stage: len(text) for stage, text in outputs.items()}
+            record["code_iterations"] = pipeline.code_iterations
+            if "verification" in outputs:
+                record["verified"] = Pipeline.verification_passed(outputs["verification"])
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = f"{type(e).__name__}: {e}"
+            os.makedirs(job_dir, exist_ok=True)
+            with open(os.path.join(job_dir, "error.log"), "w", encoding="utf-8") as f:
+                f.write(traceback.format_exc())
+        record["latency_s"] = round(time.perf_counter() - start, 2)
+
+    status = "\033[92mok\033[0m" if record["status"] == "ok" else "\033[91mfailed\033[0m"
+    print(f"[{status}] {job['name']} in {record['latency_s']:.2f}s")
+    return record
+
+
+async def run_batch(jobs, out_dir, concurrency=2, **settings):
+    """
+    Run all jobs with at most ``concurrency`` pipelines in flight and return the run summary.
+    ``settings`` are passed to every Pipeline (e.g. ``build_website=True``).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    records = await asyncio.gather(*(run_job(job, out_dir, semaphore, settings) for job in jobs))
+    wall_clock = time.perf_counter() - start
+
+    succeeded = [record for record in records if record["status"] == "ok"]
+    latencies = sorted(record["latency_s"] for record in records)
+    summary = {
+        "jobs": len(records),
+        "succeeded": len(succeeded),
+        "failed": len(records) - len(succeeded),
+        "concurrency": concurrency,
+        "wall_clock_s": round(wall_clock, 2),
+        "throughput_jobs_per_min": round(len(succeeded) / wall_clock * 60, 3) if wall_clock else 0.0,
+        "mean_latency_s": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "max_latency_s": latencies[-1] if latencies else 0.0,
+        "results": records
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary):
+    print()
+    print(f"{'job':30} {'status':8} {'latency':>10} {'iterations':>11} {'verified':>9}")
+    print("-" * 72)
+    for record in summary["results"]:
+        verified = {True: "yes", False: "no"}.get(record.get("verified"), "-")
+        print(f"{record['name'][:30]:30} {record['status']:8} {record['latency_s']:>9.2f}s "
+              f"{record.get('code_iterations', 0):>11} {verified:>9}")
+    print("-" * 72)
+    print(f"{summary['succeeded']}/{summary['jobs']} succeeded in {summary['wall_clock_s']:.2f}s "
+          f"(concurrency {summary['concurrency']}, {summary['throughput_jobs_per_min']} jobs/min, "
+          f"mean latency {summary['mean_latency_s']:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline over many requirement PDFs without prompting.")
+    parser.add_argument("source", help="directory of PDFs, or a .txt/.json manifest")
+    parser.add_argument("--out", default="runs", help="directory receiving one sub-directory per job")
+    parser.add_argument("--concurrency", type=int, default=2, help="maximum number of pipelines running at once")
+    parser.add_argument("--map-reduce", action="store_true",
+                        help="extract requirements chunk by chunk, for large multi-experiment PDFs")
+    parser.add_argument("--chunk-size", type=int, default=Pipeline.requirements_chunk_size,
+                        help="maximum characters per requirements chunk in map-reduce mode")
+    parser.add_argument("--auto-refine", action="store_true",
+                        help="refine the code until the verifier passes it instead of using the code reviews")
+    parser.add_argument("--max-iterations", type=int, default=Pipeline.max_loop,
+                        help="maximum code iterations per job")
+    parser.add_argument("--refine-time-limit", type=float, default=Pipeline.refine_time_limit,
+                        help="seconds after which a job stops starting new code iterations in --auto-refine mode")
+    parser.add_argument("--website", action="store_true",
+                        help="also generate website.html, a full website built around the code")
+    parser.add_argument("--verify", action="store_true",
+                        help="also check the final code against the requirements and write verification.md")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.source)
+    if not jobs:
+        parser.error(f"no PDFs found in {args.source}")
+    summary = asyncio.run(run_batch(
+        jobs, args.out, max(1, args.concurrency),
+        requirements_map_reduce=args.map_reduce,
+        requirements_chunk_size=args.chunk_size,
+        auto_refine=args.auto_refine,
+        max_loop=args.max_iterations,
+        refine_time_limit=args.refine_time_limit,
+        build_website=args.website,
+        verify=args.verify
+    ))
+    print_summary(summary)
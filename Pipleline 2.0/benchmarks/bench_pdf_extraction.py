@@ -0,0 +1,83 @@
+"""
+Benchmark PDF text extraction: the original page loop against PdfTextExtractor, serial and parallel.
+
+The bundled inputs are only a few pages long, so they are also merged ``--repeat`` times into a
+larger synthetic document, which is where the process pool pays off.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py --repeat 20 --workers 4
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import PyPDF2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from PdfTextExtractor import PdfTextExtractor  # noqa: E402
+
+
+def original_extract(file_path):
+    """The extraction loop RequirementsAgent used before PdfTextExtractor."""
+    with open(file_path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text() + "\n"
+    return text.strip()
+
+
+def build_large_pdf(paths, repeat, target):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(repeat):
+        for path in paths:
+            for page in PyPDF2.PdfReader(path).pages:
+                writer.add_page(page)
+    with open(target, "wb") as f:
+        writer.write(f)
+    return len(writer.pages)
+
+
+def time_it(fn, path, rounds):
+    timings = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(path)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def bench(path, label, rounds, workers):
+    serial = PdfTextExtractor(workers=1)
+    parallel = PdfTextExtractor(workers=workers, min_pages_per_worker=1)
+    baseline, expected = time_it(original_extract, path, rounds)
+    serial_time, serial_text = time_it(serial.extract_text, path, rounds)
+    parallel_time, parallel_text = time_it(parallel.extract_text, path, rounds)
+    assert serial_text == expected and parallel_text == expected, f"{label}: extracted text differs"
+    print(f"{label:40} {baseline:9.3f}s {serial_time:9.3f}s {parallel_time:9.3f}s {baseline / parallel_time:7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", default=str(Path(__file__).resolve().parent.parent / "inputs"))
+    parser.add_argument("--repeat", type=int, default=20, help="copies of the inputs merged into the large PDF")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    pdfs = sorted(glob.glob(os.path.join(args.inputs, "*.pdf")))
+    print(f"{'document':40} {'original':>10} {'serial':>10} {'parallel':>10} {'speedup':>8}")
+    for pdf in pdfs:
+        bench(pdf, os.path.basename(pdf), args.rounds, args.workers)
+
+    if args.repeat > 0 and pdfs:
+        with tempfile.TemporaryDirectory() as tmp:
+            large = os.path.join(tmp, "large.pdf")
+            pages = build_large_pdf(pdfs, args.repeat, large)
+            bench(large, f"merged x{args.repeat} ({pages} pages)", args.rounds, args.workers)
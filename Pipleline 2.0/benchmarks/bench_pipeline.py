@@ -0,0 +1,276 @@
+"""
+Offline end-to-end benchmark: the whole pipeline, each agent and the ui.py helpers on a fake model.
+
+Every agent gets its LLM from the shared client pool, which is replaced by one building
+``FakeChatModel`` clients: replies are deterministic and sized like the real ones, and latency
+and throttling are injected as configured, so runs need no network access or quota and are
+comparable with each other. Caches and checkpoints are turned off so every run does all the work.
+
+Reported: pipeline runs per minute sequentially (``Pipeline.run``) and concurrently (the batch
+runner), p50/p95 latency per stage and per agent, LLM retries, peak memory and the import time
+of ``main``. Results are compared with the stored baseline for the same settings; a metric more
+than ``--max-regression`` percent worse fails the run.
+
+Usage:
+    python benchmarks/bench_pipeline.py --runs 3 --concurrency 3 --latency 0.2
+    python benchmarks/bench_pipeline.py --throttle-every 7 --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES = Path(__file__).resolve().parent / "baselines"
+
+# Every run has to do all the work; the trace goes to a temporary file (see below)
+for name in ("LLM_RESPONSE_CACHE", "ENHANCED_PROMPT_STORE", "PDF_TEXT_CACHE", "RUN_CHECKPOINT", "ARTIFACT_STORE"):
+    os.environ[name] = "0"
+
+sys.path.insert(0, str(ROOT))
+from AgentRegistry import AgentRegistry  # noqa: E402
+from LLMClientPool import LLMClientPool  # noqa: E402
+from ModelRouter import ModelRouter  # noqa: E402
+from RateLimiter import RateLimiter  # noqa: E402
+from Tracer import Tracer, percentile  # noqa: E402
+from check_import_time import import_profile  # noqa: E402
+from fake_llm import FakeChatModel  # noqa: E402
+
+# Pipelines also run the opt-in stages, so runs do all the work a full run can do
+FULL_RUN = {"build_website": True, "verify": True}
+
+# Metrics where a larger value is better; for all others smaller is better
+HIGHER_IS_BETTER = ("runs_per_min",)
+
+
+def install_fake_llm(args):
+    """
+    Make the shared client pool hand out fake models, rate limited like the real endpoint would be.
+    Calls routed to the fast tier go to the faster ``fake-chat-fast``.
+    """
+    if args.no_routing:
+        os.environ["MODEL_ROUTING"] = "0"
+    else:
+        os.environ["MODEL_TIERS"] = "fast=fake-chat-fast"
+    pool = LLMClientPool(
+        factory=FakeChatModel.factory(
+            latency=args.latency, seconds_per_1k_tokens=args.seconds_per_1k_tokens, throttle_every=args.throttle_every
+        ),
+        rate_limiter=RateLimiter(
+            limits={model: {"rpm": args.rpm, "tpm": None} for model in ("fake-chat", "fake-chat-fast")},
+            max_concurrency=args.llm_concurrency, base_delay=0.05, max_delay=1.0
+        )
+    )
+    pool.default_config = {**LLMClientPool.default_config, "model": "fake-chat"}
+    LLMClientPool.set_shared(pool)
+    return pool
+
+
+def latency_stats(values):
+    return {
+        "p50": round(percentile(values, 50), 4) if values else None,
+        "p95": round(percentile(values, 95), 4) if values else None
+    }
+
+
+def stage_latencies(trace_path, runs=None):
+    """Return p50/p95 per pipeline stage from the trace, over ``runs`` (all runs if None)."""
+    spans = [span for span in Tracer.load(trace_path, kind="stage") if runs is None or span["run"] in runs]
+    return {
+        row["stage"]: {"p50": row["p50"], "p95": row["p95"]}
+        for row in Tracer.summarize(spans, by=("stage",))
+    }
+
+
+def bench_sequential(pdfs, runs, out_dir, trace_path):
+    """Run ``Pipeline.run`` ``runs`` times one after the other, as the CLI does."""
+    from main import Pipeline
+    latencies, run_ids = [], set()
+    start = time.perf_counter()
+    for i in range(runs):
+        pipeline = Pipeline(pdf_path=pdfs[i % len(pdfs)], output_dir=os.path.join(out_dir, f"run-{i}"),
+                            reviews={}, verbose=False, **FULL_RUN)
+        run_start = time.perf_counter()
+        pipeline.run()
+        latencies.append(time.perf_counter() - run_start)
+        run_ids.add(pipeline.tracer.run_id)
+    wall_clock = time.perf_counter() - start
+    return {
+        "runs": runs,
+        "runs_per_min": round(runs / wall_clock * 60, 3),
+        "run_latency": latency_stats(latencies),
+        "stages": stage_latencies(trace_path, run_ids)
+    }
+
+
+def bench_concurrent(pdfs, runs, concurrency, out_dir):
+    """Run ``runs`` pipelines through the batch runner with ``concurrency`` in flight."""
+    from batch import run_batch
+    jobs = [{"pdf": pdfs[i % len(pdfs)], "name": f"job-{i}"} for i in range(runs)]
+    summary = asyncio.run(run_batch(jobs, out_dir, concurrency, **FULL_RUN))
+    if summary["failed"]:
+        errors = [record["error"] for record in summary["results"] if record["status"] != "ok"]
+        raise RuntimeError(f"{summary['failed']} batch jobs failed: {errors[0]}")
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "runs_per_min": summary["throughput_jobs_per_min"],
+        "run_latency": latency_stats([record["latency_s"] for record in summary["results"]])
+    }
+
+
+def bench_agents(pdf, rounds):
+    """Time each agent on its own: prompt enhancement and output, ``rounds`` times."""
+    llm = LLMClientPool.shared().llm()
+    router = ModelRouter.from_env()
+    requirements = FakeChatModel().reply("You are an expert in Requirements Agent.")
+    code = FakeChatModel().reply("You are an expert in Coding Agent.")
+
+    def verifier():
+        agent = AgentRegistry.get("VerifierAgent")()
+        agent.integrated_system = code
+        agent.req_doc = requirements
+        return agent
+
+    makers = {
+        "requirements": lambda: AgentRegistry.get("RequirementsAgent")(pdf),
+        "implementation": lambda: AgentRegistry.get("ImplementationAgent")(requirements),
+        "code": lambda: AgentRegistry.get("CodingAgent")(requirements),
+        "code_patch": lambda: AgentRegistry.get("CodingAgent")(requirements, code, review="Use a darker background"),
+        "documentation": lambda: AgentRegistry.get("DocumentationAgent")(code),
+        "verification": verifier,
+        "website": lambda: AgentRegistry.get("WebsiteDesignAgent")(code, generate_procedure=True, generate_content=True)
+    }
+    results = {}
+    for name, make_agent in makers.items():
+        latencies = []
+        for _ in range(rounds):
+            agent = make_agent()
+            agent.set_llm(llm)
+            agent.set_prompt_enhancer_llm(llm)
+            agent.set_model_router(router)
+            start = time.perf_counter()
+            agent.enhance_prompt()
+            agent.get_output()
+            latencies.append(time.perf_counter() - start)
+        results[name] = latency_stats(latencies)
+    return results
+
+
+def bench_ui(rounds):
+    """Time the ui.py helpers the Streamlit buttons call; needs Streamlit, run without a server."""
+    import ui
+    requirements = FakeChatModel().reply("You are an expert in Requirements Agent.")
+    steps = {
+        "generate_implementation": lambda: ui.generate_implementation(requirements),
+        "generate_code": lambda: ui.generate_code(requirements, ""),
+        "generate_documentation": lambda: ui.generate_documentation(requirements)
+    }
+    results = {}
+    for name, step in steps.items():
+        latencies = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            step()
+            latencies.append(time.perf_counter() - start)
+        results[name] = latency_stats(latencies)
+    return results
+
+
+def flatten(results, prefix=""):
+    """Return ``{"a.b.c": value}`` for every number in the nested results."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results, baseline, max_regression):
+    """Print every metric against the baseline; return the metrics worse by more than ``max_regression`` %."""
+    current, previous = flatten(results["metrics"]), flatten(baseline["metrics"])
+    regressions = []
+    print(f"\n{'metric':52} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, value in current.items():
+        old = previous.get(metric)
+        if not old:
+            continue
+        change = (value - old) / old * 100
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > max_regression and not metric.endswith((".runs", ".concurrency")):
+            regressions.append(metric)
+            flag = "  REGRESSION"
+        print(f"{metric:52} {old:10.3f} {value:10.3f} {change:+7.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", default=str(ROOT / "inputs"))
+    parser.add_argument("--runs", type=int, default=3, help="pipeline runs per scenario")
+    parser.add_argument("--concurrency", type=int, default=3, help="pipelines in flight in the concurrent scenario")
+    parser.add_argument("--rounds", type=int, default=3, help="calls per agent and ui helper")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model seconds before the first token")
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.1, help="fake model generation time")
+    parser.add_argument("--throttle-every", type=int, default=0, help="reject every n-th call with a 429")
+    parser.add_argument("--rpm", type=int, default=None, help="client-side requests per minute limit")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="maximum concurrent LLM calls")
+    parser.add_argument("--no-routing", action="store_true", help="send every call to the default fake model")
+    parser.add_argument("--ui", action="store_true", help="also time the ui.py helpers (requires Streamlit)")
+    parser.add_argument("--baseline", default=str(BASELINES / "pipeline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=25.0, help="percent a metric may get worse")
+    args = parser.parse_args()
+
+    settings = {name: getattr(args, name) for name in
+                ("runs", "concurrency", "rounds", "latency", "seconds_per_1k_tokens", "throttle_every", "rpm",
+                 "llm_concurrency", "no_routing")}
+    pdfs = sorted(str(path) for path in Path(args.inputs).glob("*.pdf"))
+    import_ms, _ = import_profile("main")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["LLM_TRACE_PATH"] = os.path.join(tmp, "trace.jsonl")
+        pool = install_fake_llm(args)
+        metrics = {
+            "sequential": bench_sequential(pdfs, args.runs, os.path.join(tmp, "sequential"),
+                                           os.environ["LLM_TRACE_PATH"]),
+            "concurrent": bench_concurrent(pdfs, args.runs, args.concurrency, os.path.join(tmp, "concurrent")),
+            "agents": bench_agents(pdfs[0], args.rounds)
+        }
+        if args.ui:
+            metrics["ui"] = bench_ui(args.rounds)
+        llm_stats = pool.rate_limiter.stats()
+
+    metrics["llm"] = {field: sum(stats[field] for stats in llm_stats.values()) for field in ("calls", "retries")}
+    # Peak resident memory of the whole benchmark; ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics["peak_memory_mb"] = round(max_rss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 2)
+    metrics["import_main_ms"] = round(import_ms, 1)
+    results = {"settings": settings, "metrics": metrics}
+
+    print(json.dumps(results, indent=2))
+    status = 0
+    if args.save_baseline:
+        BASELINES.mkdir(exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings:
+            print("\nThe baseline was recorded with other settings, not comparing:", baseline["settings"])
+        else:
+            regressions = compare(results, baseline, args.max_regression)
+            if regressions:
+                print(f"\n{len(regressions)} metrics regressed by more than {args.max_regression:.0f}%")
+                status = 1
+    sys.exit(status)
@@ -0,0 +1,86 @@
+"""
+Cold-start regression check based on ``python -X importtime``.
+
+Each entry point is imported in a fresh interpreter. The check fails if it pulls in one of the heavy
+dependencies that must only be imported on first use (langchain, the Gemini client, PyPDF2, markdown)
+or if its cumulative import time exceeds the budget. ``ui`` is only checked with ``--ui`` as it needs
+Streamlit installed.
+
+Usage:
+    python benchmarks/check_import_time.py --budget-ms 400
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+TARGETS = [
+    "main",
+    "batch",
+    "AgentRegistry",
+    "BaseAgent",
+    "Agents.RequirementsAgent",
+    "Agents.HumanReviewAgentForRequirement",
+    "Agents.ImplementationAgent",
+    "Agents.CodingAgent",
+    "Agents.DocumentationAgent",
+    "Agents.VerfierAgent",
+    "Agents.WebsiteDesignAgent",
+]
+
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_google_genai", "google.generativeai", "PyPDF2", "markdown"]
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_profile(module):
+    """Import ``module`` in a fresh interpreter; return its cumulative time in ms and every module it loaded."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    loaded = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            loaded[match.group(4)] = int(match.group(2)) / 1000
+    return loaded.get(module, 0.0), set(loaded)
+
+
+def check(module, rounds, budget_ms):
+    timings = []
+    loaded = set()
+    for _ in range(rounds):
+        elapsed, loaded = import_profile(module)
+        timings.append(elapsed)
+    elapsed = statistics.median(timings)
+    heavy = sorted(name for name in loaded if any(name == h or name.startswith(h + ".") for h in HEAVY_MODULES))
+    heavy_roots = sorted({name.split(".")[0] for name in heavy})
+    problems = []
+    if heavy_roots:
+        problems.append("imports " + ", ".join(heavy_roots))
+    if budget_ms is not None and elapsed > budget_ms:
+        problems.append(f"over the {budget_ms:.0f}ms budget")
+    status = "ok" if not problems else "FAIL: " + "; ".join(problems)
+    print(f"{module:40} {elapsed:9.1f}ms  {status}")
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=None, help="maximum cumulative import time per target")
+    parser.add_argument("--rounds", type=int, default=3, help="imports per target; the median is reported")
+    parser.add_argument("--ui", action="store_true", help="also check ui.py (requires Streamlit)")
+    args = parser.parse_args()
+
+    targets = TARGETS + (["ui"] if args.ui else [])
+    print(f"{'module':40} {'import':>11}")
+    results = [check(module, args.rounds, args.budget_ms) for module in targets]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,208 @@
+"""
+Deterministic stand-in for the Gemini chat model, for running the pipeline offline.
+
+The reply to a prompt only depends on the prompt: its kind is recognised from the agent's prompt
+template and it is sized like what the real model returns for that agent (HTML for code and
+websites, Markdown for plans and documentation, bullet lists for requirements). Prompts asking for
+search/replace edits get a block that applies to the code they quote. Latency is a fixed overhead
+plus a per-token time with a jitter derived from the prompt (lighter models like ``fake-chat-fast``
+answer faster, see ``MODEL_SPEEDUP``), and every ``throttle_every``-th call
+fails like a quota rejection so the rate limiter's retries are exercised too.
+
+Plug it into every agent through the client pool:
+
+    LLMClientPool.set_shared(LLMClientPool(factory=FakeChatModel.factory(latency=0.2)))
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+
+_ANCHOR = re.compile(r"<!-- anchor:(\w+) -->")
+_ROLE = re.compile(r"You are an expert in ([^.\n]+)\.|for the role of '([^']+)'")
+
+# Reply sizes in characters, close to what the real model returns for each agent
+REPLY_CHARS = {
+    "enhance": 2500,
+    "requirements": 3000,
+    "map": 1500,
+    "implementation": 6000,
+    "code": 20000,
+    "documentation": 8000,
+    "website": 30000,
+    "verification": 1200,
+    "text": 2000
+}
+# How many times faster than the default fake model each lighter fake model answers
+MODEL_SPEEDUP = {"fake-chat-fast": 4.0}
+
+
+class ResourceExhausted(Exception):
+    """Quota rejection, named and coded like the one raised by the Gemini client."""
+    code = 429
+
+
+class FakeMessage:
+
+    def __init__(self, content, input_tokens, output_tokens, finish_reason="STOP"):
+        self.content = content
+        self.response_metadata = {"finish_reason": finish_reason}
+        self.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+
+
+class FakeChatModel:
+    """Chat model with the ``invoke``/``ainvoke``/``stream``/``astream`` interface the agents use."""
+
+    def __init__(self, model="fake-chat", temperature=0.1, max_tokens=100000, latency=0.2, seconds_per_1k_tokens=0.5,
+                 jitter=0.2, throttle_every=0, chunk_chars=400, **kwargs):
+        """
+        Args:
+            latency (float): Fixed seconds per call before the first token
+            seconds_per_1k_tokens (float): Generation time per thousand output tokens
+            jitter (float): Maximum relative deviation of a call's latency, derived from its prompt
+            throttle_every (int): Fail every n-th call with ``ResourceExhausted``; 0 never throttles
+            chunk_chars (int): Size of the chunks a streamed reply is split into
+        """
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.latency = latency / MODEL_SPEEDUP.get(model, 1.0)
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens / MODEL_SPEEDUP.get(model, 1.0)
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, **settings):
+        """Return a client factory for ``LLMClientPool`` building fake models with ``settings``."""
+        def create(**config):
+            return cls(**{**config, **settings})
+        return create
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def kind_of(prompt):
+        """Recognise which agent (and which of its phases) ``prompt`` comes from."""
+        lowered = prompt.lower()
+        if "expert prompt engineer" in lowered or lowered.startswith("please enhance"):
+            return "enhance"
+        if "<<<<<<< search" in lowered:
+            return "patch"
+        if "virtual lab website" in lowered:
+            return "website"
+        match = _ROLE.search(prompt)
+        role = (match.group(1) or match.group(2)).lower() if match else ""
+        if "requirements" in role:
+            return "map" if "this is part" in lowered else "requirements"
+        for name, kind in (("implementation", "implementation"), ("coding", "code"),
+                           ("documentation", "documentation"), ("verifier", "verification")):
+            if name in role:
+                return kind
+        return "text"
+
+    @staticmethod
+    def _fill(words, size, seed):
+        # Deterministic filler text of about ``size`` characters
+        text, i = [], 0
+        while sum(len(part) + 1 for part in text) < size:
+            text.append(words[(int(seed[i % len(seed)], 16) + i) % len(words)])
+            i += 1
+        return " ".join(text)
+
+    def reply(self, prompt):
+        """Return the canned reply to ``prompt``."""
+        kind = self.kind_of(prompt)
+        seed = self._digest(prompt)
+        words = ["simulation", "experiment", "user", "value", "graph", "control", "slider", "result",
+                 "measure", "display", "the", "should", "update", "panel", "step", "input"]
+        if kind == "patch":
+            match = _ANCHOR.search(prompt)
+            anchor = match.group(0) if match else "<body>"
+            return (f"<<<<<<< SEARCH\n{anchor}\n=======\n{anchor}\n"
+                    f"<p>Revised: {self._fill(words, 80, seed)}</p>\n>>>>>>> REPLACE")
+        size = REPLY_CHARS[kind]
+        if kind in ("code", "website"):
+            body = "\n".join(
+                f"<p>{self._fill(words, 100, seed[i % 60:] + seed)}</p>" for i in range(size // 110)
+            )
+            return ("<!DOCTYPE html>\n<html>\n<head>\n<title>Virtual Lab</title>\n"
+                    "<style>\nbody { font-family: sans-serif; }\n</style>\n</head>\n<body>\n"
+                    f"<!-- anchor:{seed[:12]} -->\n<div id=\"simulation\">\n{body}\n</div>\n"
+                    "<script>\nfunction update() { return 1; }\n</script>\n</body>\n</html>")
+        if kind in ("requirements", "map"):
+            return "\n".join(f"- {self._fill(words, 70, seed[i % 60:] + seed)}" for i in range(size // 75))
+        if kind == "verification":
+            return "passed\n\n" + self._fill(words, size, seed)
+        if kind == "enhance" and "virtual lab website" in prompt.lower():
+            # An enhanced website template still asks for the website
+            return "Create a complete virtual lab website.\n\n" + self._fill(words, size, seed)
+        paragraphs = [f"## Section {i + 1}\n\n{self._fill(words, 380, seed[i % 60:] + seed)}" for i in range(size // 400)]
+        return "\n\n".join(paragraphs) or self._fill(words, size, seed)
+
+    def _call(self, prompt):
+        """Count the call, throttle it if due, and return its reply and delays (before first token, total)."""
+        with self._lock:
+            self.calls += 1
+            throttled = self.throttle_every and self.calls % self.throttle_every == 0
+            if throttled:
+                self.throttled += 1
+        if throttled:
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        content = self.reply(prompt)
+        # Like the real model, a reply longer than max_tokens is cut off
+        finish_reason = "MAX_TOKENS" if len(content) // 4 > self.max_tokens else "STOP"
+        content = content[:self.max_tokens * 4]
+        output_tokens = len(content) // 4
+        # Jitter in [-jitter, +jitter] taken from the prompt, so a prompt always takes as long
+        factor = 1 + self.jitter * (int(self._digest(prompt)[:4], 16) / 0xFFFF * 2 - 1)
+        first_token = self.latency * factor
+        total = first_token + self.seconds_per_1k_tokens * output_tokens / 1000 * factor
+        return FakeMessage(content, len(prompt) // 4, output_tokens, finish_reason), first_token, total
+
+    def _chunks(self, message):
+        content = message.content
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+        for index, piece in enumerate(pieces):
+            chunk = FakeMessage(piece, 0, 0)
+            # Usage and the finish reason come with the last chunk, as they do from the real client
+            last = index == len(pieces) - 1
+            chunk.usage_metadata = message.usage_metadata if last else None
+            chunk.response_metadata = message.response_metadata if last else {}
+            yield chunk
+
+    def invoke(self, prompt, **kwargs):
+        message, _, total = self._call(prompt)
+        time.sleep(total)
+        return message
+
+    async def ainvoke(self, prompt, **kwargs):
+        message, _, total = self._call(prompt)
+        await asyncio.sleep(total)
+        return message
+
+    def stream(self, prompt, **kwargs):
+        message, first_token, total = self._call(prompt)
+        time.sleep(first_token)
+        chunks = list(self._chunks(message))
+        for chunk in chunks:
+            time.sleep((total - first_token) / len(chunks))
+            yield chunk
+
+    async def astream(self, prompt, **kwargs):
+        message, first_token, total = self._call(prompt)
+        await asyncio.sleep(first_token)
+        chunks = list(self._chunks(message))
+        for chunk in chunks:
+            await asyncio.sleep((total - first_token) / len(chunks))
+            yield chunk
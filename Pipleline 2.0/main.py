@@ -1,83 +1,464 @@
-from sys import implementation
+import asyncio
+import os
+import re
+import time
+import uuid
 
-from Agents.CodingAgent import CodingAgent
-from Agents.HumanReviewAgentForRequirement import HumanReviewAgentForRequirement
-from Agents.ImplementationAgent import ImplementationAgent
-from Agents.RequirementsAgent import RequirementsAgent
-from Agents.VerfierAgent import VerifierAgent
-from Agents.DocumentationAgent import DocumentationAgent
-from BaseAgent import BaseAgent
-from langchain_google_genai import ChatGoogleGenerativeAI
+from AgentRegistry import AgentRegistry
+from ArtifactStore import ArtifactStore
+from HtmlChecker import HtmlChecker
+from LLMClientPool import LLMClientPool
+from ModelRouter import ModelRouter
+from PdfTextCache import PdfTextCache
+from PromptStore import PromptStore
+from ResponseCache import ResponseCache
+from RunCheckpoint import RunCheckpoint
+from StageGraph import StageGraph
+from TokenBudget import TokenBudget
+from Tracer import Tracer
 
 class Pipeline:
     llm = None
+    tracer = None
     max_loop = 3
+    # Print agent output token by token instead of after the whole completion
+    stream = True
+    # Extract requirements chunk by chunk and merge them, for large multi-experiment PDFs
+    requirements_map_reduce = False
+    requirements_chunk_size = 12000
+    requirements_concurrency = 4
+    # Refine code with search/replace edits instead of regenerating it every review round
+    incremental_code = True
+    # Feed defects found by static checks back as the code review, and report them instead of verifying
+    static_checks = True
+    # Refine the code unattended: the verifier reviews each iteration against the requirements and its
+    # findings are the next review, until it passes, max_loop iterations or refine_time_limit seconds
+    auto_refine = False
+    refine_time_limit = 900
+    # Stages that only need the final code, run alongside the documentation; each one is another
+    # heavy model call, so they are opt-in
+    build_website = False
+    verify = False
 
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro-exp-03-25",
-            temperature=0.1,
-            max_tokens=100000
-        )
+    def __init__(self, pdf_path="1.pdf", output_dir=".", reviews=None, verbose=True, checkpoint_dir=None,
+                 **settings):
+        """
+        Args:
+            pdf_path (str): Requirements PDF to process
+            output_dir (str): Directory that receives code.html and documentation.md
+            checkpoint_dir (str): Run directory keeping every stage's inputs and output, so a re-run
+                resumes at the first stage whose inputs changed (defaults to ``output_dir/.checkpoint``)
+            reviews (dict): Pre-supplied review texts per stage ("requirements", "code"), each a
+                string or a list consumed one per round. When given, the run never prompts on stdin
+                and a stage stops asking once its reviews are used up.
+            verbose (bool): Echo agent output and timings to the console
+            settings: Values of the class-level settings above for this pipeline only,
+                e.g. ``build_website=True``
+        """
+        for name, value in settings.items():
+            if name.startswith("_") or callable(getattr(type(self), name, None)) or not hasattr(type(self), name):
+                raise TypeError(f"Unknown pipeline setting: {name}")
+            setattr(self, name, value)
+        self.pdf_path = pdf_path
+        self.output_dir = output_dir
+        self.reviews = None
+        if reviews is not None:
+            self.reviews = {
+                stage: [review] if isinstance(review, str) else list(review)
+                for stage, review in reviews.items()
+            }
+        self.verbose = verbose
+        self.response_cache = ResponseCache.from_env()
+        self.prompt_store = PromptStore.from_env()
+        self.pdf_text_cache = PdfTextCache.from_env()
+        self.token_budget = TokenBudget.from_env()
+        self.checkpoint = RunCheckpoint.from_env(checkpoint_dir or os.path.join(output_dir, ".checkpoint"))
+        self.artifacts = ArtifactStore.from_env()
+        self.model_router = ModelRouter.from_env()
+        self.run_id = None
+        # Number of code iterations and the latest (code, verification report) of the run
+        self.code_iterations = 0
+        self.code_verification = None
+
+    @staticmethod
+    def create_llm():
+        # Pipelines in one process share the pool's clients and connections
+        return LLMClientPool.shared().llm()
+
+    def _setup_agent(self, agent):
+        agent.set_llm(self.llm)
+        agent.set_prompt_enhancer_llm(self.llm)
+        agent.set_response_cache(self.response_cache)
+        agent.set_prompt_store(self.prompt_store)
+        agent.set_token_budget(self.token_budget)
+        agent.set_tracer(self.tracer)
+        agent.set_model_router(self.model_router)
+        return agent
+
+    def _log(self, *args, **kwargs):
+        if self.verbose:
+            print(*args, **kwargs)
+
+    async def _ask_review(self, stage, prompt):
+        """Return the next review for ``stage``, from stdin or from the pre-supplied reviews."""
+        if self.reviews is None:
+            return await asyncio.to_thread(input, prompt)
+        pending = self.reviews.get(stage) or []
+        return pending.pop(0) if pending else ""
+
+    async def _timed_enhance(self, agent):
+        start = time.perf_counter()
+        enhanced_prompt = await agent.aenhance_prompt()
+        return enhanced_prompt, time.perf_counter() - start
+
+    def _prefetch_prompts(self, agent_classes):
+        """Start enhancing every agent's prompt concurrently; enhancements don't depend on upstream outputs."""
+        return {
+            cls: asyncio.create_task(self._timed_enhance(self._setup_agent(cls.prompt_enhancer())))
+            for cls in agent_classes
+        }
+
+    async def _use_prefetched_prompt(self, agent):
+        """Hand a prefetched enhancement to ``agent`` and report the wall-clock it saved."""
+        start = time.perf_counter()
+        agent.enhanced_prompt, enhance_time = await self.prefetched_prompts[type(agent)]
+        waited = time.perf_counter() - start
+        saved = max(enhance_time - waited, 0.0)
+        self.enhancement_time_saved += saved
+        self._log(f"\033[90m[timing] {agent.role}: prompt enhancement took {enhance_time:.2f}s, "
+              f"waited {waited:.2f}s, saved {saved:.2f}s\033[0m")
+        return agent.enhanced_prompt
+
+    async def _emit_output(self, agent, path=None, echo=True):
+        """Get ``agent``'s output, echoing it to the console (and ``path``) as it arrives when streaming.
+
+        Stages running concurrently pass ``echo=False`` so their outputs don't interleave on the console.
+        """
+        if path:
+            path = os.path.join(self.output_dir, path)
+        if not (self.stream and self.verbose and echo):
+            output = await agent.aget_output()
+            if echo:
+                self._log(output)
+            if path:
+                with open(path, "w") as f:
+                    f.write(output)
+            return output
+
+        chunks = []
+        f = open(path, "w") if path else None
+        try:
+            async for chunk in agent.astream_output():
+                chunks.append(chunk)
+                print(chunk, end="", flush=True)
+                if f:
+                    f.write(chunk)
+                    f.flush()
+        finally:
+            if f:
+                f.close()
+        self._log()
+        return "".join(chunks)
+
+    async def _run_stage(self, stage, inputs, make_agent, path=None, echo=True, clean=None):
+        """
+        Return the output of ``stage``. It is reused from the checkpoint when the stage already
+        ran with the same ``inputs``; otherwise the agent built by ``make_agent`` produces it, and
+        ``clean`` (if given) tidies it up before it is written, checkpointed and stored.
+        """
+        # Routing decides which model answers each of the agent's calls, so it is an input as well
+        inputs = {**inputs, "model": getattr(self.llm, "model", None),
+                  "routing": self.model_router.settings() if self.model_router is not None else None}
+        output = self.checkpoint.load(stage, inputs) if self.checkpoint else None
+        if output is not None:
+            self._log(f"\033[90m[checkpoint] {stage}: inputs unchanged, reusing the saved output\033[0m")
+            if echo:
+                self._log(output)
+            if path:
+                with open(os.path.join(self.output_dir, path), "w") as f:
+                    f.write(output)
+            self._record_artifact(stage, output)
+            return output
+
+        agent = self._setup_agent(await asyncio.to_thread(make_agent))
+        if type(agent) in self.prefetched_prompts:
+            await self._use_prefetched_prompt(agent)
+        output = await self._emit_output(agent, path, echo)
+        if clean is not None and clean(output) != output:
+            output = clean(output)
+            if path:
+                with open(os.path.join(self.output_dir, path), "w") as f:
+                    f.write(output)
+        if getattr(agent, "patch_error", None) is not None:
+            self._log(f"\033[90m[patch] edits did not apply, regenerated the code instead: "
+                      f"{str(agent.patch_error).splitlines()[0]}\033[0m")
+        if not echo:
+            self._log(f"\033[90m[stage] {stage} finished" + (f", written to {path}" if path else "") + "\033[0m")
+        # A website that failed to generate comes back as an error page, which is not worth keeping
+        if getattr(agent, "generation_error", None) is None:
+            if self.checkpoint:
+                self.checkpoint.save(stage, inputs, output)
+            self._record_artifact(stage, output)
+        return output
+
+    def _record_artifact(self, stage, output):
+        # Review rounds and code iterations become successive iterations of one stage
+        if self.artifacts is not None:
+            self.artifacts.record(self.run_id, re.sub(r"_\d+$", "", stage), output)
+
+    def _log_token_usage(self):
+        self._log("\033[90m[tokens] agent                              calls      input     output\033[0m")
+        for role, usage in self.token_budget.report().items():
+            self._log(f"\033[90m[tokens] {role:34} {usage['calls']:5} {usage['input_tokens']:10} "
+                      f"{usage['output_tokens']:10}\033[0m")
 
     def run(self):
-        reqAgent = RequirementsAgent("1.pdf")
-        reqAgent.set_llm(self.llm)
-        reqAgent.set_prompt_enhancer_llm(self.llm)
-        reqAgent.enhance_prompt()
-        req_Agent_output = reqAgent.get_output()
-        print("[\033[91mRequirements OUTPUT\033[0m")
-        print(req_Agent_output)
+        return asyncio.run(self.arun())
+
+    async def _requirements_stage(self, results):
+        self._log("[\033[91mRequirements OUTPUT\033[0m")
+        return await self._run_stage(
+            "requirements",
+            {
+                "pdf": await asyncio.to_thread(PdfTextCache.file_digest, self.pdf_path),
+                "map_reduce": self.requirements_map_reduce,
+                "chunk_size": self.requirements_chunk_size
+            },
+            lambda: AgentRegistry.get("RequirementsAgent")(
+                self.pdf_path, self.pdf_text_cache,
+                map_reduce=self.requirements_map_reduce,
+                chunk_size=self.requirements_chunk_size,
+                max_concurrency=self.requirements_concurrency
+            )
+        )
+
+    async def _review_stage(self, results):
         human_review_output = ""
+        review_round = 0
         while True:
-            review_1 = input(">>> Enter your review for the requirements: Press Enter to skip: ")
+            review_1 = await self._ask_review("requirements", ">>> Enter your review for the requirements: Press Enter to skip: ")
             if review_1 == "":
                 if human_review_output == "":
-                    human_review_output = req_Agent_output
+                    human_review_output = results["requirements"]
                 break
 
+            review_round += 1
+            previous_output = human_review_output or results["requirements"]
+            human_review_output = await self._run_stage(
+                f"requirements_review_{review_round}",
+                {"review": review_1, "requirements": previous_output},
+                lambda: AgentRegistry.get("HumanReviewAgentForRequirement")(review_1, previous_output)
+            )
+        self._log("\033[91mHuman Review Output\033[0m")
+        self._log(human_review_output)
+        return human_review_output
 
-            human_review = HumanReviewAgentForRequirement(req_Agent_output, review_1)
-            human_review.set_llm(self.llm)
-            human_review.set_prompt_enhancer_llm(self.llm)
-            human_review.enhance_prompt()
-            human_review_output = human_review.get_output()
-            print(human_review_output)
-        print("\033[91mHuman Review Output\033[0m")
-        print(human_review_output)
-        implementation_agent = ImplementationAgent(human_review_output)
-        implementation_agent.set_llm(self.llm)
-        implementation_agent.set_prompt_enhancer_llm(self.llm)
+    async def _implementation_stage(self, results):
+        self._log("\033[91mImplementation OUTPUT\033[0m")
+        return await self._run_stage(
+            "implementation",
+            {"requirements": results["reviewed_requirements"]},
+            lambda: AgentRegistry.get("ImplementationAgent")(results["reviewed_requirements"])
+        )
 
-        impl_agent_output = implementation_agent.get_output()
-        print("\033[91mImplementation OUTPUT\033[0m")
-        print(impl_agent_output)
+    @staticmethod
+    def verification_passed(report):
+        """Whether a verifier report is the plain "passed" the verifier gives for code meeting the requirements."""
+        return re.match(r"[\W_]*passed\b", report.strip(), re.IGNORECASE) is not None
 
+    async def _verify_code(self, code, requirements, iteration):
+        report = await self._run_stage(
+            f"verification_{iteration}",
+            {"code": code, "requirements": requirements, "static_checks": self.static_checks},
+            lambda: self._make_verifier(code, requirements),
+            echo=False
+        )
+        self.code_verification = (code, report)
+        return report
+
+    async def _code_stage(self, results):
+        impl_agent_output = results["implementation"]
+        coding_agent_class = AgentRegistry.get("CodingAgent")
         loop = 0
         code_review = ""
         coding_agent_output = ""
+        refine_start = time.perf_counter()
         while loop < self.max_loop:
-            coding_agent = CodingAgent(impl_agent_output, code_review)
-            coding_agent.set_llm(self.llm)
-            coding_agent.set_prompt_enhancer_llm(self.llm)
-            coding_agent.enhance_prompt()
-            coding_agent_output = coding_agent.get_output()
-            with open("code.html", "w") as f:
-                f.write(coding_agent_output)
-
-                print()
-                print("-"*100)
-                print(coding_agent_output)
-            code_review = input(">>> Enter your review for the code: ")
-
-        documentation_agent = DocumentationAgent(coding_agent_output)
-        documentation_agent.set_llm(self.llm)
-        documentation_agent.set_prompt_enhancer_llm(self.llm)
-        documentation_agent.enhance_prompt()
-        documentation_agent_output = documentation_agent.get_output()
-        with open("documentation.md", "w") as f:
-            f.write(documentation_agent_output)
+            self._log()
+            self._log("-"*100)
+            previous_code = coding_agent_output
+            # After the first round only the edits asked for by the review are requested
+            coding_agent_output = await self._run_stage(
+                f"code_{loop + 1}",
+                {"implementation": impl_agent_output, "previous_code": previous_code, "review": code_review,
+                 "incremental": self.incremental_code},
+                lambda: coding_agent_class(impl_agent_output, previous_code, review=code_review,
+                                           incremental=self.incremental_code),
+                "code.html",
+                # Fences and prose around the code are dropped here rather than spending a round on them
+                clean=HtmlChecker.extract
+            )
+            loop += 1
+            self.code_iterations = loop
+            # Code with certain defects is fixed before anyone spends a review on it
+            static_review = HtmlChecker.review_of(coding_agent_output) if self.static_checks else ""
+            if static_review and loop < self.max_loop:
+                self._log(f"\033[90m[static] {static_review}\033[0m")
+                code_review = static_review
+            elif self.auto_refine:
+                code_review = await self._verify_code(coding_agent_output, results["reviewed_requirements"], loop)
+                if self.verification_passed(code_review):
+                    self._log(f"\033[90m[refine] verification passed after {loop} iterations\033[0m")
+                    break
+                self._log(f"\033[90m[refine] iteration {loop} did not pass verification\033[0m")
+            else:
+                code_review = await self._ask_review("code", ">>> Enter your review for the code: Press Enter to accept: ")
+                if code_review == "":
+                    break
+                continue
+            if self.auto_refine and time.perf_counter() - refine_start > self.refine_time_limit:
+                self._log(f"\033[90m[refine] stopped after {loop} iterations, the {self.refine_time_limit}s "
+                          f"time limit is used up\033[0m")
+                break
+        return coding_agent_output
+
+    async def _documentation_stage(self, results):
+        return await self._run_stage(
+            "documentation",
+            {"code": results["code"]},
+            lambda: AgentRegistry.get("DocumentationAgent")(results["code"]),
+            "documentation.md",
+            echo=False
+        )
+
+    async def _website_stage(self, results):
+        website_agent_class = AgentRegistry.get("WebsiteDesignAgent")
+        website = await self._run_stage(
+            "website",
+            {"code": results["code"]},
+            lambda: website_agent_class(results["code"], generate_procedure=True, generate_content=True),
+            "website.html",
+            echo=False,
+            clean=HtmlChecker.extract
+        )
+        # Like the code, a website with certain defects gets them as feedback, for one revision
+        static_review = HtmlChecker.review_of(website) if self.static_checks else ""
+        if not static_review:
+            return website
+        self._log(f"\033[90m[static] website: {static_review}\033[0m")
 
+        def make_revision():
+            agent = website_agent_class(results["code"], generate_procedure=True, generate_content=True,
+                                        feedback=static_review)
+            agent.set_previous_website_code(website)
+            return agent
+
+        return await self._run_stage(
+            "website_2",
+            {"code": results["code"], "website": website, "review": static_review},
+            make_revision,
+            "website.html",
+            echo=False,
+            clean=HtmlChecker.extract
+        )
+
+    def _make_verifier(self, code, requirements):
+        verifier = AgentRegistry.get("VerifierAgent")()
+        verifier.integrated_system = code
+        verifier.req_doc = requirements
+        verifier.static_checks = self.static_checks
+        return verifier
+
+    async def _verification_stage(self, results):
+        # The refinement loop has already verified the final code
+        if self.code_verification is not None and self.code_verification[0] == results["code"]:
+            report = self.code_verification[1]
+            with open(os.path.join(self.output_dir, "verification.md"), "w") as f:
+                f.write(report)
+            return report
+        return await self._run_stage(
+            "verification",
+            {"code": results["code"], "requirements": results["reviewed_requirements"],
+             "static_checks": self.static_checks},
+            lambda: self._make_verifier(results["code"], results["reviewed_requirements"]),
+            "verification.md",
+            echo=False
+        )
+
+    def build_graph(self):
+        """Declare the pipeline's stages and what each one needs."""
+        graph = StageGraph()
+        graph.add("requirements", self._requirements_stage)
+        graph.add("reviewed_requirements", self._review_stage, ["requirements"])
+        graph.add("implementation", self._implementation_stage, ["reviewed_requirements"])
+        graph.add("code", self._code_stage, ["implementation"] + (["reviewed_requirements"] if self.auto_refine else []))
+        # Everything below only needs the final code, so it runs concurrently
+        graph.add("documentation", self._documentation_stage, ["code"])
+        if self.build_website:
+            graph.add("website", self._website_stage, ["code"])
+        # The refine loop's last report is the verification, so writing it costs no model call
+        if self.verify or self.auto_refine:
+            graph.add("verification", self._verification_stage, ["code", "reviewed_requirements"])
+        return graph
+
+    async def arun(self):
+        """Run the pipeline and return the final output of each stage."""
+        # Agent calls are awaited and blocking work (PDF parsing, console input)
+        # runs in worker threads, so several pipelines can share one event loop.
+        run_start = time.perf_counter()
+        if self.llm is None:
+            self.llm = self.create_llm()
+        self.enhancement_time_saved = 0.0
+        # Budgets are per run
+        self.token_budget = TokenBudget.from_env()
+        # Every run gets its own id in the shared trace and the artifact store
+        self.run_id = uuid.uuid4().hex[:12]
+        self.tracer = Tracer.from_env(self.run_id)
+        self.code_iterations = 0
+        self.code_verification = None
+        # The review agent only runs when there is a review: always possible at the prompt,
+        # but with pre-supplied reviews only if one was given
+        expects_review = self.reviews is None or any(self.reviews.get("requirements") or [])
+        self.prefetched_prompts = self._prefetch_prompts(
+            [AgentRegistry.get(name) for name in ("RequirementsAgent", "CodingAgent", "DocumentationAgent")]
+            + ([AgentRegistry.get("HumanReviewAgentForRequirement")] if expects_review else [])
+            + ([AgentRegistry.get("VerifierAgent")] if self.verify or self.auto_refine else [])
+        )
+        os.makedirs(self.output_dir, exist_ok=True)
+        graph = self.build_graph()
+        results = await graph.arun()
+        self._log("\033[90m" + graph.report() + "\033[0m")
+        self._log(f"\033[90m[timing] run took {time.perf_counter() - run_start:.2f}s, "
+              f"prompt prefetching saved {self.enhancement_time_saved:.2f}s\033[0m")
+        self._log_token_usage()
+        if self.model_router is not None:
+            routing = self.model_router.stats()
+            self._log(f"\033[90m[routing] calls per tier {routing['calls']}, "
+                      f"escalated to the heavy model {routing['escalations'] or 'never'}\033[0m")
+        if self.tracer is not None:
+            for stage, (start, end) in graph.timings.items():
+                self.tracer.record_stage(stage, start, end)
+            self._log(f"\033[90m[trace] run {self.tracer.run_id} in {self.tracer.path}\n"
+                      + self.tracer.report() + "\033[0m")
+        if self.artifacts is not None:
+            iterations = self.artifacts.iterations(self.run_id)
+            self._log(f"\033[90m[artifacts] run {self.run_id}: {len(iterations)} outputs in "
+                      f"{self.artifacts.directory}\033[0m")
+            # Keep the store bounded across many runs; a failed gc never fails the finished run
+            try:
+                await asyncio.to_thread(self.artifacts.gc)
+            except Exception as error:
+                self._log(f"\033[90m[artifacts] gc failed, the next run retries it: {error}\033[0m")
+        outputs = {
+            "requirements": results["reviewed_requirements"],
+            "implementation": results["implementation"],
+            "code": results["code"],
+            "documentation": results["documentation"]
+        }
+        for stage in ("website", "verification"):
+            if stage in results:
+                outputs[stage] = results[stage]
+        return outputs
 
 if __name__ == "__main__":
     pipeline = Pipeline()
@@ -1,35 +1,78 @@
 import streamlit as st
-from Agents.CodingAgent import CodingAgent
-from Agents.HumanReviewAgentForRequirement import HumanReviewAgentForRequirement
-from Agents.ImplementationAgent import ImplementationAgent
-from Agents.RequirementsAgent import RequirementsAgent
-from Agents.DocumentationAgent import DocumentationAgent
-from langchain_google_genai import ChatGoogleGenerativeAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from AgentRegistry import AgentRegistry
+from ArtifactStore import ArtifactStore
+from HtmlChecker import HtmlChecker
+from LLMClientPool import LLMClientPool
+from ModelRouter import ModelRouter
 import os
+import re
 import subprocess
+import uuid
 from pathlib import Path
-import http.server
-import socketserver
 import threading
+import time
 import webbrowser
-import socket
-from Agents.WebsiteDesignAgent import WebsiteDesignAgent  # Import the WebsiteAgent
+from PdfTextCache import PdfTextCache
+from PreviewServer import PreviewServer
+from PromptStore import PromptStore
+from ResponseCache import ResponseCache
+from RunCheckpoint import RunCheckpoint
+from StageGraph import StageGraph
+from TokenBudget import TokenBudget
+from Tracer import TraceFollower, Tracer
 
 # ---------------------------------------------------
 # Configuration & Initialization
 # ---------------------------------------------------
 
-# Initialize the language model instance. This will be used by all agents.
+# Initialize the language model handle. This will be used by all agents.
+# Sessions share the process-wide client pool, so they don't each build a client and open connections.
 def init_llm():
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-exp-03-25",
-        temperature=0.1,
-        max_tokens=100000,
-        google_api_key = os.getenv('GOOGLE_API_KEY')
-    )
+    return LLMClientPool.shared().llm(google_api_key=os.getenv('GOOGLE_API_KEY'))
+
+# The response cache and prompt store are shared by every session of this Streamlit process.
+@st.cache_resource
+def init_response_cache():
+    return ResponseCache.from_env()
+
+@st.cache_resource
+def init_prompt_store():
+    return PromptStore.from_env()
+
+@st.cache_resource
+def init_pdf_text_cache():
+    return PdfTextCache.from_env()
+
+@st.cache_resource
+def init_artifact_store():
+    artifacts = ArtifactStore.from_env()
+    if artifacts is not None:
+        # Keep the store bounded across UI processes too, without holding up the first page
+        threading.Thread(target=artifacts.gc, daemon=True).start()
+    return artifacts
+
+@st.cache_resource
+def init_model_router():
+    return ModelRouter.from_env()
 
-if "llm" not in st.session_state:
-    st.session_state.llm = init_llm()
+# Every session's sidebar metrics read the trace through one follower, which only parses new lines
+@st.cache_resource
+def init_trace_follower(path):
+    return TraceFollower(path)
+
+# One preview server for the process; every session publishes its pages under its own prefix
+@st.cache_resource
+def init_preview_server():
+    return PreviewServer(port=int(os.getenv("PREVIEW_PORT", "8000")))
+
+# Token usage and budgets are tracked per session
+if "token_budget" not in st.session_state:
+    st.session_state.token_budget = TokenBudget.from_env()
+# Each session is a run of its own in the shared trace and the artifact store
+if "run_id" not in st.session_state:
+    st.session_state.run_id = uuid.uuid4().hex[:12]
+    st.session_state.tracer = Tracer.from_env(st.session_state.run_id)
 
 # Prepare session states for pipeline steps
 if "requirements_output" not in st.session_state:
@@ -44,28 +87,119 @@ if "coding_agent_output" not in st.session_state:
     st.session_state.coding_agent_output = ""
 if "documentation_output" not in st.session_state:
     st.session_state.documentation_output = ""
-if 'server_started' not in st.session_state:
-    st.session_state.server_started = False
+if "preview" not in st.session_state:
+    # The session's previews are dropped once Streamlit discards the session
+    st.session_state.preview = init_preview_server().session()
 if "uploaded_file" not in st.session_state:
     st.session_state.uploaded_file = None
+if "uploaded_digest" not in st.session_state:
+    st.session_state.uploaded_digest = None
 
 MAX_CODE_LOOP = 3
+# Refine code with search/replace edits instead of regenerating it every review round, as the pipeline does
+INCREMENTAL_CODE = True
+# Stage checkpoints of each uploaded PDF are kept in a sub-directory named after its digest
+RUN_CHECKPOINT_DIR = os.getenv("RUN_CHECKPOINT_DIR", ".cache/runs")
+# Session state restored when a PDF with a checkpointed run is uploaded again
+SESSION_KEYS = ["requirements_output", "reviewed_requirements", "implementation_output", "code_loop",
+                "coding_agent_output", "documentation_output", "website_output"]
+# Minimum seconds between re-renders of a streaming placeholder
+STREAM_RENDER_INTERVAL = 0.25
 
 # ---------------------------------------------------
 # Agent Functions
 # ---------------------------------------------------
 
+def session_llm():
+    """Return the session's LLM, creating it the first time an agent needs it."""
+    if "llm" not in st.session_state:
+        st.session_state.llm = init_llm()
+    return st.session_state.llm
+
+def prepare_agent(agent):
+    """Attach the session LLM, token budget, shared response cache and prompt store to an agent."""
+    agent.set_llm(session_llm())
+    agent.set_prompt_enhancer_llm(session_llm())
+    agent.set_response_cache(init_response_cache())
+    agent.set_prompt_store(init_prompt_store())
+    agent.set_token_budget(st.session_state.token_budget)
+    agent.set_tracer(st.session_state.tracer)
+    agent.set_model_router(init_model_router())
+    return agent
+
+def run_checkpoint():
+    """Return the checkpoint of the uploaded PDF's run, or None before an upload or when disabled."""
+    if st.session_state.uploaded_digest is None:
+        return None
+    return RunCheckpoint.from_env(os.path.join(RUN_CHECKPOINT_DIR, st.session_state.uploaded_digest))
+
+def stage_inputs(inputs):
+    """Return a stage's checkpoint inputs: its own plus the model and routing that answer its calls."""
+    router = init_model_router()
+    return {**inputs, "model": session_llm().model, "routing": router.settings() if router is not None else None}
+
+def load_stage(stage, inputs):
+    """Return the checkpointed output of ``stage`` if it already ran with the same inputs."""
+    checkpoint = run_checkpoint()
+    if checkpoint is None:
+        return None
+    return checkpoint.load(stage, stage_inputs(inputs))
+
+def save_stage(stage, inputs, output):
+    """Checkpoint ``stage``'s output and keep it as the next iteration of the stage in the artifact store."""
+    checkpoint = run_checkpoint()
+    if checkpoint is not None:
+        checkpoint.save(stage, stage_inputs(inputs), output)
+    artifacts = init_artifact_store()
+    if artifacts is not None:
+        artifacts.record(st.session_state.run_id, re.sub(r"_\d+$", "", stage), output)
+
+def stream_to_placeholder(chunks, placeholder, render, publish=None):
+    """Render streamed output into a live placeholder as it arrives.
+
+    Re-rendering is throttled so long outputs don't resend the whole text on every chunk.
+    ``publish`` is called with the output so far on every re-render, e.g. to update a live preview.
+    """
+    parts = []
+    last_render = 0.0
+    for chunk in chunks:
+        parts.append(chunk)
+        now = time.monotonic()
+        if now - last_render >= STREAM_RENDER_INTERVAL:
+            text = "".join(parts)
+            render(placeholder, text)
+            if publish:
+                publish(text)
+            last_render = now
+    text = "".join(parts)
+    render(placeholder, text)
+    if publish:
+        publish(text)
+    return text
+
+def render_html(placeholder, text):
+    placeholder.code(text, language="html")
+
+def render_markdown(placeholder, text):
+    placeholder.markdown(text)
+
 def generate_requirements():
     """Generate initial requirements from an uploaded PDF using the RequirementsAgent."""
     if st.session_state.uploaded_file is None:
         st.error("Please upload a PDF file first!")
         return ""
     
-    req_agent = RequirementsAgent(str(st.session_state.uploaded_file))
-    req_agent.set_llm(st.session_state.llm)
-    req_agent.set_prompt_enhancer_llm(st.session_state.llm)
+    inputs = {"map_reduce": map_reduce}
+    output = load_stage("requirements", inputs)
+    if output is not None:
+        return output
+    RequirementsAgent = AgentRegistry.get("RequirementsAgent")
+    req_agent = RequirementsAgent(str(st.session_state.uploaded_file), init_pdf_text_cache(),
+                                  st.session_state.uploaded_digest, map_reduce=map_reduce)
+    prepare_agent(req_agent)
     req_agent.enhance_prompt()
     output = req_agent.get_output()
+    save_stage("requirements", inputs, output)
     return output
 
 def review_requirements(user_review, base_text):
@@ -74,28 +208,59 @@ def review_requirements(user_review, base_text):
     """
     if user_review.strip() == "":
         return base_text
-    review_agent = HumanReviewAgentForRequirement(user_review, base_text)
-    review_agent.set_llm(st.session_state.llm)
-    review_agent.set_prompt_enhancer_llm(st.session_state.llm)
+    inputs = {"review": user_review, "requirements": base_text}
+    output = load_stage("requirements_review", inputs)
+    if output is not None:
+        return output
+    review_agent = AgentRegistry.get("HumanReviewAgentForRequirement")(user_review, base_text)
+    prepare_agent(review_agent)
     review_agent.enhance_prompt()
-    return review_agent.get_output()
+    output = review_agent.get_output()
+    save_stage("requirements_review", inputs, output)
+    return output
 
 def generate_implementation(requirements_text):
     """Generate implementation output from reviewed requirements."""
-    impl_agent = ImplementationAgent(requirements_text)
-    impl_agent.set_llm(st.session_state.llm)
-    impl_agent.set_prompt_enhancer_llm(st.session_state.llm)
-    return impl_agent.get_output()
-
-def generate_code(impl_text, code_review):
-    """Generate code via the CodingAgent given implementation output and code review feedback."""
-    coding_agent = CodingAgent(impl_text, code_review)
-    coding_agent.set_llm(st.session_state.llm)
-    coding_agent.set_prompt_enhancer_llm(st.session_state.llm)
+    inputs = {"requirements": requirements_text}
+    output = load_stage("implementation", inputs)
+    if output is not None:
+        return output
+    impl_agent = AgentRegistry.get("ImplementationAgent")(requirements_text)
+    prepare_agent(impl_agent)
+    output = impl_agent.get_output()
+    save_stage("implementation", inputs, output)
+    return output
+
+def generate_code(impl_text, code_review, previous_code=None, placeholder=None):
+    """Generate code via the CodingAgent given implementation output and code review feedback.
+       With previous code and a review, only the edits the review asks for are generated and applied.
+       With a placeholder, the code is streamed into it and into code.html as it is generated.
+    """
+    stage = f"code_{st.session_state.code_loop + 1}"
+    inputs = {"implementation": impl_text, "previous_code": previous_code, "review": code_review,
+              "incremental": INCREMENTAL_CODE}
+    output = load_stage(stage, inputs)
+    if output is not None:
+        if placeholder is not None:
+            render_html(placeholder, output)
+        return output
+    coding_agent = AgentRegistry.get("CodingAgent")(impl_text, previous_code, review=code_review,
+                                                    incremental=INCREMENTAL_CODE)
+    prepare_agent(coding_agent)
     coding_agent.enhance_prompt()
-    return coding_agent.get_output()
+    if placeholder is None:
+        output = coding_agent.get_output()
+    else:
+        output = stream_to_placeholder(coding_agent.stream_output(), placeholder, render_html,
+                                       lambda text: st.session_state.preview.publish("code.html", text))
+    # Fences and prose around the code are dropped here rather than left for a review round
+    code = HtmlChecker.extract(output)
+    if code != output and placeholder is not None:
+        render_html(placeholder, code)
+    save_stage(stage, inputs, code)
+    return code
 
-def generate_documentation(code_text):
+def generate_documentation(code_text, placeholder=None):
     """Generate documentation using the DocumentationAgent."""
     # Combine requirements, implementation, and code for richer context
     context = (
@@ -103,73 +268,73 @@ def generate_documentation(code_text):
         f"Implementation Plan:\n{st.session_state.implementation_output}\n\n"
         f"Code:\n{code_text}"
     )
-    doc_agent = DocumentationAgent(context)
-    doc_agent.set_llm(st.session_state.llm)
-    doc_agent.set_prompt_enhancer_llm(st.session_state.llm)
+    inputs = {"context": context}
+    output = load_stage("documentation", inputs)
+    if output is not None:
+        if placeholder is not None:
+            render_markdown(placeholder, output)
+        return output
+    doc_agent = AgentRegistry.get("DocumentationAgent")(context)
+    prepare_agent(doc_agent)
     doc_agent.enhance_prompt()
-    return doc_agent.get_output()
-
-def start_http_server(directory, port=8000):
-    """Start a HTTP server in a separate thread"""
-    if st.session_state.server_started:
-        return True
-        
-    class Handler(http.server.SimpleHTTPRequestHandler):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, directory=directory, **kwargs)
-    
-    try:
-        # Test if port is available
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(('', port))
-        sock.close()
-        
-        # Create server
-        handler = Handler
-        httpd = socketserver.TCPServer(("", port), handler)
-        
-        # Start server in a separate thread
-        server_thread = threading.Thread(target=httpd.serve_forever)
-        server_thread.daemon = True  # Thread will close when main program exits
-        server_thread.start()
-        
-        st.session_state.server_started = True
-        return True
-        
-    except OSError as e:
-        if e.errno in [98, 10048]:  # Port already in use (Linux: 98, Windows: 10048)
-            st.session_state.server_started = True
-            return True
-        st.error(f"Server error: {str(e)}")
-        return False
-
-def save_and_serve_code(code_content):
-    """Save code to file and start server if needed"""
+    if placeholder is None:
+        output = doc_agent.get_output()
+    else:
+        output = stream_to_placeholder(doc_agent.stream_output(), placeholder, render_markdown)
+    save_stage("documentation", inputs, output)
+    return output
+
+def save_and_serve_code(code_content, name="code.html"):
+    """Publish code on the preview server and return its URL"""
     try:
-        # Get the directory of the current file
-        current_dir = Path(__file__).parent
-        code_file_path = current_dir / "code.html"
-        
-        # Save the code to file
-        with open(code_file_path, "w", encoding="utf-8") as f:
-            f.write(code_content)
-        
-        # Start the server if not already running
-        if start_http_server(current_dir):
-            return f"http://localhost:8000/code.html"
-        return None
-            
+        return st.session_state.preview.publish(name, code_content)
     except Exception as e:
-        st.error(f"Error saving code file: {str(e)}")
+        st.error(f"Preview server error: {str(e)}")
         return None
 
-def generate_website(simulation_code, website_feedback=None, previous_website_code=None):
-    """Generate a complete Virtual Lab Website using the WebsiteAgent."""
-    website_agent = WebsiteDesignAgent(simulation_code, website_feedback, previous_website_code)
-    website_agent.set_llm(st.session_state.llm)
-    website_agent.set_prompt_enhancer_llm(st.session_state.llm)
+def generate_website(simulation_code, website_feedback=None, previous_website_code=None, placeholder=None):
+    """Generate a complete Virtual Lab Website using the WebsiteAgent.
+       With feedback on a previous website, only the edits it asks for are generated and applied.
+       With a placeholder, the raw HTML is streamed into it while it is generated.
+    """
+    inputs = {"simulation_code": simulation_code, "feedback": website_feedback or "",
+              "previous_website_code": previous_website_code}
+    output = load_stage("website", inputs)
+    if output is not None:
+        return output
+    website_agent = AgentRegistry.get("WebsiteDesignAgent")(simulation_code, feedback=website_feedback or "")
+    website_agent.set_previous_website_code(previous_website_code)
+    prepare_agent(website_agent)
     website_agent.enhance_prompt()
-    return website_agent.get_output()
+    if placeholder is None:
+        output = website_agent.get_output()
+        # Generation errors come back as an error page, which is not worth keeping
+        if website_agent.generation_error is None:
+            save_stage("website", inputs, output)
+        return output
+    stream_to_placeholder(website_agent.stream_output(), placeholder, render_html)
+    if website_agent.generation_error is None:
+        save_stage("website", inputs, website_agent.website_html)
+    else:
+        # Replace whatever was streamed before the error with the error page
+        render_html(placeholder, website_agent.website_html)
+    return website_agent.website_html
+
+def generate_final_stages(code_text, website_feedback=None, previous_website_code=None):
+    """Generate the documentation and the website concurrently, as both only need the final code.
+       Returns the outputs by stage name and the graph, whose report gives the stage timings.
+    """
+    # Worker threads need the script context to use the session state
+    ctx = get_script_run_ctx()
+    graph = StageGraph(initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx))
+    graph.add("documentation", lambda results: generate_documentation(code_text))
+    graph.add("website", lambda results: generate_website(code_text, website_feedback, previous_website_code))
+    outputs = graph.run()
+    tracer = st.session_state.tracer
+    if tracer is not None:
+        for stage, (start, end) in graph.timings.items():
+            tracer.record_stage(stage, start, end)
+    return outputs, graph
 
 # ---------------------------------------------------
 # Streamlit UI
@@ -179,22 +344,33 @@ st.title("Interactive Pipeline UI")
 # Step 1: Generate Requirements
 st.header("1. Requirements Generation")
 uploaded_file = st.file_uploader("Upload your requirements PDF", type=['pdf'])
+map_reduce = st.checkbox("Large document: extract requirements section by section and merge them", value=False)
 
 if uploaded_file is not None:
-    # Save the uploaded file temporarily
-    temp_path = Path("temp_requirements.pdf")
-    with open(temp_path, "wb") as f:
-        f.write(uploaded_file.getvalue())
+    # Save the uploaded file temporarily, only rewriting it when its content changes
+    # Named after its content, so sessions uploading other PDFs never overwrite the one this session extracts
+    uploaded_bytes = uploaded_file.getvalue()
+    uploaded_digest = PdfTextCache.digest(uploaded_bytes)
+    temp_path = Path(f"temp_{uploaded_digest}.pdf")
+    if not temp_path.exists():
+        partial_path = temp_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+        with open(partial_path, "wb") as f:
+            f.write(uploaded_bytes)
+        os.replace(partial_path, temp_path)
+    if uploaded_digest != st.session_state.uploaded_digest:
+        st.session_state.uploaded_digest = uploaded_digest
+        # Pick up where an earlier session on the same PDF left off
+        checkpoint = run_checkpoint()
+        saved_session = checkpoint.load("session", {}) if checkpoint else None
+        if saved_session and not st.session_state.requirements_output:
+            for key, value in saved_session.items():
+                st.session_state[key] = value
+            st.info("Resumed the previous run for this PDF.")
     st.session_state.uploaded_file = temp_path
     
     if st.button("Generate Requirements"):
         with st.spinner("Generating requirements from uploaded PDF..."):
-            # Modify the generate_requirements function call
-            req_agent = RequirementsAgent(str(st.session_state.uploaded_file))
-            req_agent.set_llm(st.session_state.llm)
-            req_agent.set_prompt_enhancer_llm(st.session_state.llm)
-            req_agent.enhance_prompt()
-            st.session_state.requirements_output = req_agent.get_output()
+            st.session_state.requirements_output = generate_requirements()
         st.success("Requirements generated.")
 
 if st.session_state.requirements_output:
@@ -231,16 +407,19 @@ if st.session_state.implementation_output == "":
     st.info("Generate implementation first to start code generation.")
 else:
     st.write(f"Code Generation Iteration: {st.session_state.code_loop + 1} of {MAX_CODE_LOOP}")
+    # Defects the static checks find in the current code are the review unless one is entered
+    static_review = HtmlChecker.review_of(st.session_state.coding_agent_output) if st.session_state.code_loop else ""
+    if static_review:
+        st.warning(static_review)
     code_review_input = st.text_area("Enter your code review feedback (for the current iteration)", height=100)
     if st.button("Generate/Refine Code"):
         with st.spinner("Generating code..."):
-            # Use implementation output for the first iteration, then use the previous code
-            input_text = (
-                st.session_state.implementation_output
-                if st.session_state.code_loop == 0
-                else st.session_state.coding_agent_output
-            )
-            new_code_output = generate_code(input_text, code_review_input)
+            code_review_input = code_review_input or static_review
+            # The first iteration writes the code from scratch, later ones refine the previous code
+            previous_code = st.session_state.coding_agent_output if st.session_state.code_loop > 0 else None
+            code_placeholder = st.empty()
+            new_code_output = generate_code(st.session_state.implementation_output, code_review_input,
+                                            previous_code, code_placeholder)
             st.session_state.coding_agent_output = new_code_output
             st.session_state.code_loop += 1
             
@@ -248,14 +427,13 @@ else:
             localhost_url = save_and_serve_code(new_code_output)
             if localhost_url:
                 st.success("Code generated/refined.")
-                st.code(new_code_output, language="html")
                 
                 # Add link to view in browser
                 st.markdown(f"""
                 ### View Live Preview
                 Click here to view the code in your browser: [Open Preview]({localhost_url})
                 
-                Note: Preview server is running on port 8000
+                Note: Preview server is running on port {init_preview_server().port}
                 """)
                 
                 # Optionally, open the browser automatically
@@ -273,10 +451,10 @@ else:
     
     if st.button("Generate Documentation"):
         with st.spinner("Generating documentation..."):
-            doc_output = generate_documentation(st.session_state.coding_agent_output)
+            doc_placeholder = st.empty()
+            doc_output = generate_documentation(st.session_state.coding_agent_output, doc_placeholder)
             st.session_state.documentation_output = doc_output
         st.success("Documentation generated.")
-        st.markdown(doc_output)
 
 # Step 6: Generate Complete Virtual Lab Website
 st.header("6. Generate Complete Virtual Lab Website")
@@ -299,16 +477,18 @@ if st.button("Generate Virtual Lab Website"):
             # Check if we have previous website code and feedback
             previous_website_code = st.session_state.get("website_output", None) if website_feedback else None
             
-            # Generate the website using the WebsiteAgent
+            # Generate the website using the WebsiteAgent, streaming it into a live preview
+            website_placeholder = st.empty()
             website_output = generate_website(
                 simulation_code, 
                 website_feedback=website_feedback,
-                previous_website_code=previous_website_code
+                previous_website_code=previous_website_code,
+                placeholder=website_placeholder
             )
             st.session_state.website_output = website_output
             
             # Save website and get URL
-            localhost_url = save_and_serve_code(website_output)
+            localhost_url = save_and_serve_code(website_output, "website.html")
             if localhost_url:
                 st.success("Virtual Lab Website generated!")
                 
@@ -319,27 +499,120 @@ if st.button("Generate Virtual Lab Website"):
                 else:
                     preview = website_output
                     
-                st.code(preview, language="html")
+                website_placeholder.code(preview, language="html")
                 
                 # Add link to view in browser
                 st.markdown(f"""
                 ### View Complete Virtual Lab
                 Click here to view the complete virtual lab in your browser: [Open Virtual Lab]({localhost_url})
                 
-                Note: Preview server is running on port 8000
+                Note: Preview server is running on port {init_preview_server().port}
                 """)
                 
                 # Optionally, open the browser automatically
                 webbrowser.open(localhost_url)
 
+# Steps 5 and 6 only need the final code, so they can also run together
+if st.session_state.coding_agent_output and st.button("Generate Documentation and Website Together"):
+    with st.spinner("Generating documentation and website concurrently..."):
+        previous_website_code = st.session_state.get("website_output", None) if website_feedback else None
+        final_outputs, final_graph = generate_final_stages(
+            st.session_state.coding_agent_output, website_feedback, previous_website_code
+        )
+        st.session_state.documentation_output = final_outputs["documentation"]
+        st.session_state.website_output = final_outputs["website"]
+    st.success("Documentation and website generated.")
+    st.markdown(st.session_state.documentation_output)
+    localhost_url = save_and_serve_code(st.session_state.website_output, "website.html")
+    if localhost_url:
+        st.markdown(f"[Open Virtual Lab]({localhost_url})")
+    with st.expander("Stage timings"):
+        st.text(final_graph.report())
+
 # Optional: Reset pipeline
 if st.button("Reset Pipeline"):
+    # A reset starts over, so the uploaded PDF's checkpointed stages are dropped too
+    checkpoint = run_checkpoint()
+    if checkpoint is not None:
+        checkpoint.clear()
+    uploaded_path = st.session_state.uploaded_file
     for key in ["requirements_output", "reviewed_requirements", "implementation_output",
                 "code_loop", "coding_agent_output", "documentation_output", "website_output", "uploaded_file"]:
         st.session_state[key] = "" if key != "code_loop" else 0
     
-    # Clean up temporary file if it exists
-    if Path("temp_requirements.pdf").exists():
-        Path("temp_requirements.pdf").unlink()
+    st.session_state.uploaded_digest = None
+    # The session's run is complete, so it is a good moment to trim the store
+    artifacts = init_artifact_store()
+    if artifacts is not None:
+        threading.Thread(target=artifacts.gc, daemon=True).start()
+    st.session_state.run_id = uuid.uuid4().hex[:12]
+    st.session_state.tracer = Tracer.from_env(st.session_state.run_id)
+    st.session_state.preview.close()
+    st.session_state.preview = init_preview_server().session()
+
+    # Clean up the session's temporary file if it exists
+    if uploaded_path and Path(uploaded_path).exists():
+        Path(uploaded_path).unlink()
     
     st.success("Pipeline reset.")
+
+# Persist the session so a lost session can be resumed by uploading the same PDF again
+checkpoint = run_checkpoint()
+if checkpoint is not None and st.session_state.requirements_output:
+    session_snapshot = {key: st.session_state.get(key, "") for key in SESSION_KEYS}
+    if session_snapshot != st.session_state.get("saved_session"):
+        checkpoint.save("session", {}, session_snapshot)
+        st.session_state.saved_session = session_snapshot
+
+# Rendered last so it includes the calls made during this rerun
+with st.sidebar:
+    st.subheader("Token usage")
+    token_report = st.session_state.token_budget.report()
+    st.table({
+        role: {"calls": usage["calls"], "input": usage["input_tokens"], "output": usage["output_tokens"]}
+        for role, usage in token_report.items()
+    })
+
+    tracer = st.session_state.tracer
+    if tracer is not None:
+        st.subheader("Run metrics")
+        trace = init_trace_follower(tracer.path)
+        session_spans = trace.spans(kind="llm", run=tracer.run_id)
+        if session_spans:
+            st.caption("LLM calls of this session by agent and phase (seconds)")
+            st.table({
+                f"{row['agent']} / {row['phase']}": {
+                    column: row[column] for column in ["calls", "cache_hits", "retries", "p50", "p95", "total"]
+                }
+                for row in Tracer.summarize(session_spans)
+            })
+        all_spans = trace.spans()
+        if all_spans:
+            st.caption(f"Latency percentiles across {len({span.get('run') for span in all_spans})} runs (seconds)")
+            for kind, field in (("llm", "agent"), ("stage", "stage")):
+                rows = Tracer.summarize([span for span in all_spans if span.get("kind") == kind], by=(field,))
+                if rows:
+                    st.table({
+                        row[field]: {column: row[column] for column in ["calls", "p50", "p95", "max"]}
+                        for row in rows
+                    })
+
+    # The router is shared by every session, so its counts are not this session's
+    router = init_model_router()
+    if router is not None:
+        st.subheader("Model routing")
+        routing = router.stats()
+        st.caption(f"Across all sessions since the UI started: calls per model tier {routing['calls']}; "
+                   f"escalated to the heavy model: {sum(routing['escalations'].values())}")
+
+    artifacts = init_artifact_store()
+    iterations = artifacts.iterations(st.session_state.run_id) if artifacts is not None else []
+    if iterations:
+        st.subheader("Iterations")
+        labels = [f"{entry['stage']} #{entry['iteration']}" for entry in iterations]
+        chosen = st.selectbox("Stored outputs of this session", range(len(iterations)),
+                              index=len(iterations) - 1, format_func=lambda i: labels[i])
+        entry = iterations[chosen]
+        extension = "html" if entry["stage"] in ("code", "website") else "md"
+        st.download_button(f"Download {labels[chosen]}", artifacts.get(entry["digest"]) or "",
+                           file_name=f"{entry['stage']}-{entry['iteration']}.{extension}")